@@ -0,0 +1,174 @@
+"""initial schema
+
+Revision ID: 3b1f0c2a9d41
+Revises:
+Create Date: 2026-10-18 01:18:00.000000
+
+初始表结构（此前由 Base.metadata.create_all 建表）。已有的数据库表已经存在，
+这里只创建缺失的表，因此已部署的数据库直接执行 alembic upgrade head 即可。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c2a9d41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('email', sa.String(), nullable=False),
+            sa.Column('username', sa.String(), nullable=True),
+            sa.Column('hashed_password', sa.String(), nullable=True),
+            sa.Column('full_name', sa.String(), nullable=True),
+            sa.Column('avatar_url', sa.String(), nullable=True),
+            sa.Column('credits', sa.Integer(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_verified', sa.Boolean(), nullable=True),
+            sa.Column('supabase_user_id', sa.String(), nullable=True),
+            sa.Column('authentik_user_id', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('last_login_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('authentik_user_id'),
+        )
+        op.create_index('ix_users_email', 'users', ['email'], unique=True)
+        op.create_index('ix_users_supabase_user_id', 'users', ['supabase_user_id'], unique=True)
+
+    if not _has_table('uploaded_images'):
+        op.create_table(
+            'uploaded_images',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('user_id', sa.String(), nullable=False),
+            sa.Column('filename', sa.String(), nullable=False),
+            sa.Column('storage_path', sa.String(), nullable=False),
+            sa.Column('file_size', sa.Integer(), nullable=False),
+            sa.Column('width', sa.Integer(), nullable=False),
+            sa.Column('height', sa.Integer(), nullable=False),
+            sa.Column('mime_type', sa.String(), nullable=False),
+            sa.Column('is_temp', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not _has_table('generation_jobs'):
+        op.create_table(
+            'generation_jobs',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('user_id', sa.String(), nullable=False),
+            sa.Column('source_image_id', sa.String(), nullable=False),
+            sa.Column('style_id', sa.String(), nullable=False),
+            sa.Column('custom_prompt', sa.String(), nullable=True),
+            sa.Column(
+                'status',
+                sa.Enum('PENDING', 'PROCESSING', 'COMPLETED', 'FAILED', name='generationstatus'),
+                nullable=True,
+            ),
+            sa.Column('queue_position', sa.Integer(), nullable=True),
+            sa.Column('result_image_url', sa.String(), nullable=True),
+            sa.Column('credits_cost', sa.Integer(), nullable=True),
+            sa.Column('error_message', sa.String(), nullable=True),
+            sa.Column('api_response', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(['source_image_id'], ['uploaded_images.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not _has_table('generation_styles'):
+        op.create_table(
+            'generation_styles',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.Column('prompt_template', sa.String(), nullable=False),
+            sa.Column('thumbnail_url', sa.String(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_premium', sa.Boolean(), nullable=True),
+            sa.Column('sort_order', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not _has_table('credit_packages'):
+        op.create_table(
+            'credit_packages',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('credits', sa.Integer(), nullable=False),
+            sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+            sa.Column('currency', sa.String(), nullable=True),
+            sa.Column('stripe_price_id', sa.String(), nullable=True),
+            sa.Column('is_popular', sa.Boolean(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('sort_order', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not _has_table('credit_transactions'):
+        op.create_table(
+            'credit_transactions',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('user_id', sa.String(), nullable=False),
+            sa.Column(
+                'type',
+                sa.Enum('PURCHASE', 'CONSUMPTION', 'REFUND', 'BONUS', name='transactiontype'),
+                nullable=False,
+            ),
+            sa.Column('amount', sa.Integer(), nullable=False),
+            sa.Column('balance_before', sa.Integer(), nullable=False),
+            sa.Column('balance_after', sa.Integer(), nullable=False),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.Column('stripe_session_id', sa.String(), nullable=True),
+            sa.Column('stripe_payment_intent_id', sa.String(), nullable=True),
+            sa.Column('related_job_id', sa.String(), nullable=True),
+            sa.Column('extra_data', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.ForeignKeyConstraint(['related_job_id'], ['generation_jobs.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not _has_table('stripe_events'):
+        op.create_table(
+            'stripe_events',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('event_id', sa.String(), nullable=False),
+            sa.Column('event_type', sa.String(), nullable=False),
+            sa.Column('processed', sa.Boolean(), nullable=True),
+            sa.Column('payload', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+            sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('event_id'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('stripe_events')
+    op.drop_table('credit_transactions')
+    op.drop_table('credit_packages')
+    op.drop_table('generation_styles')
+    op.drop_table('generation_jobs')
+    op.drop_table('uploaded_images')
+    op.drop_index('ix_users_supabase_user_id', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,32 @@
+"""add generation_jobs.claimed_by
+
+Revision ID: 7c9e2d4b1a05
+Revises: 3b1f0c2a9d41
+Create Date: 2026-10-18 01:19:00.000000
+
+认领任务的 worker 标识（独立 worker 进程按 claimed_by 条件更新认领任务）。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7c9e2d4b1a05'
+down_revision = '3b1f0c2a9d41'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_jobs', 'claimed_by'):
+        op.add_column('generation_jobs', sa.Column('claimed_by', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_column('claimed_by')
@@ -0,0 +1,47 @@
+"""add result cache columns
+
+Revision ID: a4d83f6e2c17
+Revises: 7c9e2d4b1a05
+Create Date: 2026-10-18 01:28:00.000000
+
+结果缓存：源图内容哈希、任务的缓存键、风格的 cache_results 开关。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a4d83f6e2c17'
+down_revision = '7c9e2d4b1a05'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('uploaded_images', 'content_hash'):
+        op.add_column('uploaded_images', sa.Column('content_hash', sa.String(), nullable=True))
+        op.create_index('ix_uploaded_images_content_hash', 'uploaded_images', ['content_hash'])
+    if not _has_column('generation_jobs', 'cache_key'):
+        op.add_column('generation_jobs', sa.Column('cache_key', sa.String(), nullable=True))
+        op.create_index('ix_generation_jobs_cache_key', 'generation_jobs', ['cache_key'])
+    if not _has_column('generation_styles', 'cache_results'):
+        op.add_column(
+            'generation_styles',
+            sa.Column('cache_results', sa.Boolean(), nullable=True, server_default=sa.false()),
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_styles') as batch_op:
+        batch_op.drop_column('cache_results')
+    op.drop_index('ix_generation_jobs_cache_key', table_name='generation_jobs')
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_column('cache_key')
+    op.drop_index('ix_uploaded_images_content_hash', table_name='uploaded_images')
+    with op.batch_alter_table('uploaded_images') as batch_op:
+        batch_op.drop_column('content_hash')
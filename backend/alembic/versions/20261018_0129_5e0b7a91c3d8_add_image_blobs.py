@@ -0,0 +1,40 @@
+"""add image_blobs
+
+Revision ID: 5e0b7a91c3d8
+Revises: a4d83f6e2c17
+Create Date: 2026-10-18 01:29:00.000000
+
+按内容寻址的上传文件表（相同内容只保存一份，ref_count 记录引用数）。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5e0b7a91c3d8'
+down_revision = 'a4d83f6e2c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 启动时的 create_all 可能已经建好了该表
+    if sa.inspect(op.get_bind()).has_table('image_blobs'):
+        return
+    op.create_table(
+        'image_blobs',
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('storage_path', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=False),
+        sa.Column('height', sa.Integer(), nullable=False),
+        sa.Column('mime_type', sa.String(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('content_hash'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('image_blobs')
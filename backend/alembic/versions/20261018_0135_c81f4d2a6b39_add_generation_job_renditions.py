@@ -0,0 +1,32 @@
+"""add generation_jobs.renditions
+
+Revision ID: c81f4d2a6b39
+Revises: 5e0b7a91c3d8
+Create Date: 2026-10-18 01:35:00.000000
+
+生成结果的派生版本 {尺寸: {格式: 存储路径}}。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4d2a6b39'
+down_revision = '5e0b7a91c3d8'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_jobs', 'renditions'):
+        op.add_column('generation_jobs', sa.Column('renditions', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_column('renditions')
@@ -0,0 +1,34 @@
+"""add generation_jobs.batch_id
+
+Revision ID: 2f6a9c0e7d52
+Revises: c81f4d2a6b39
+Create Date: 2026-10-18 01:41:00.000000
+
+批量生成时同一批任务共享的 batch_id。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2f6a9c0e7d52'
+down_revision = 'c81f4d2a6b39'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_jobs', 'batch_id'):
+        op.add_column('generation_jobs', sa.Column('batch_id', sa.String(), nullable=True))
+        op.create_index('ix_generation_jobs_batch_id', 'generation_jobs', ['batch_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_batch_id', table_name='generation_jobs')
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_column('batch_id')
@@ -0,0 +1,32 @@
+"""add generation_styles.provider_chain
+
+Revision ID: 9d3e5b8f1a64
+Revises: 2f6a9c0e7d52
+Create Date: 2026-10-18 01:43:00.000000
+
+风格的 provider 尝试顺序（逗号分隔），为空时使用全局配置。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9d3e5b8f1a64'
+down_revision = '2f6a9c0e7d52'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_styles', 'provider_chain'):
+        op.add_column('generation_styles', sa.Column('provider_chain', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_styles') as batch_op:
+        batch_op.drop_column('provider_chain')
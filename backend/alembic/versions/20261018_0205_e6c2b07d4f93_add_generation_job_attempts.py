@@ -0,0 +1,35 @@
+"""add generation_jobs.attempts
+
+Revision ID: e6c2b07d4f93
+Revises: 9d3e5b8f1a64
+Create Date: 2026-10-18 02:05:00.000000
+
+任务被 worker 认领的次数，超过 GENERATION_JOB_MAX_ATTEMPTS 后不再重新入队。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e6c2b07d4f93'
+down_revision = '9d3e5b8f1a64'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_jobs', 'attempts'):
+        op.add_column(
+            'generation_jobs',
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.drop_column('attempts')
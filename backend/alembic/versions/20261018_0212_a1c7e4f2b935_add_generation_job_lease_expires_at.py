@@ -0,0 +1,40 @@
+"""add generation_jobs.lease_expires_at, drop queue_position
+
+Revision ID: a1c7e4f2b935
+Revises: e6c2b07d4f93
+Create Date: 2026-10-18 02:12:00.000000
+
+租约到期时间单独存放，worker 续租只推后 lease_expires_at，started_at 保持认领时间。
+排队位置在查询时计算（job_events.queue_position），queue_position 列不再保留。
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e4f2b935'
+down_revision = 'e6c2b07d4f93'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # 启动时的 create_all 可能已经建好了最新的表
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('generation_jobs', 'lease_expires_at'):
+        op.add_column(
+            'generation_jobs',
+            sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+        )
+    if _has_column('generation_jobs', 'queue_position'):
+        with op.batch_alter_table('generation_jobs') as batch_op:
+            batch_op.drop_column('queue_position')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('generation_jobs') as batch_op:
+        batch_op.add_column(sa.Column('queue_position', sa.Integer(), nullable=True))
+        batch_op.drop_column('lease_expires_at')
@@ -3,7 +3,7 @@ API v1 路由聚合
 """
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import images, styles, generations, auth, users
+from app.api.v1.endpoints import images, styles, generations, auth, users, ops
 
 api_router = APIRouter()
 
@@ -13,3 +13,4 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(images.router, prefix="/images", tags=["images"])
 api_router.include_router(styles.router, prefix="/styles", tags=["styles"])
 api_router.include_router(generations.router, prefix="/generations", tags=["generations"])
+api_router.include_router(ops.router, prefix="/ops", tags=["ops"])
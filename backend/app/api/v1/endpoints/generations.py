@@ -1,17 +1,32 @@
 """
 生成任务 API 端点
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import uuid
 import logging
+import asyncio
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.image import GenerationJob, GenerationStatus, UploadedImage, GenerationStyle
 from app.models.user import User
-from app.schemas.generation import GenerationJobCreate, GenerationJobResponse
-from app.services.generation_service import process_generation_job
+from app.schemas.generation import (
+    GenerationBatchCreate,
+    GenerationBatchResponse,
+    GenerationJobCreate,
+    GenerationJobResponse,
+)
+from app.services.job_events import (
+    job_response,
+    load_job_snapshot,
+    load_job_state,
+    stream_job_events,
+    wait_for_job_change,
+)
+from app.services.job_queue import generation_worker_pool
 from app.api.deps import get_current_user
 
 router = APIRouter()
@@ -21,7 +36,6 @@ logger = logging.getLogger(__name__)
 @router.post("/", response_model=GenerationJobResponse, status_code=status.HTTP_201_CREATED)
 async def create_generation_job(
     request: GenerationJobCreate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ) -> GenerationJobResponse:
@@ -31,8 +45,8 @@ async def create_generation_job(
     - 需要登录
     - 需要提供源图片 ID 和风格 ID
     - 会扣减 1 个积分
-    - 返回任务 ID 和状态
-    - 触发后台任务进行处理
+    - 返回任务 ID、状态和排队位置
+    - 任务写入持久化队列，由 worker 池异步处理
     """
     logger.info(f"创建生成任务请求 - 用户: {current_user.email}, 源图片: {request.source_image_id}, 风格: {request.style_id}")
 
@@ -95,30 +109,176 @@ async def create_generation_job(
 
     logger.info(f"✓ 生成任务创建成功 - ID: {job_id}, 风格: {style.name}")
 
-    # 触发后台任务
-    background_tasks.add_task(process_generation_job, job.id, db)
-    logger.info(f"后台生成任务已加入队列 - ID: {job_id}")
+    response = job_response(db, job)
 
-    return job
+    # 唤醒空闲 worker
+    generation_worker_pool.notify()
+    logger.info(f"生成任务已加入队列 - ID: {job_id}, 排队位置: {response.queue_position}")
+
+    return response
+
+
+@router.post("/batch", response_model=GenerationBatchResponse, status_code=status.HTTP_201_CREATED)
+async def create_generation_batch(
+    request: GenerationBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> GenerationBatchResponse:
+    """
+    批量创建生成任务：同一张源图片生成多个风格
+
+    - 需要登录
+    - 每个风格扣减 1 个积分，整批一次性扣减，积分不足时不创建任何任务
+    - 所有任务在同一个事务中写入队列，共享 batch_id
+    - 任务由 worker 池并发处理（同一 provider 的并发数受 PROVIDER_MAX_CONCURRENCY 限制）
+    - 返回 batch_id 和汇总状态，之后通过 GET /generations/batch/{batch_id} 查询
+    """
+    style_ids = request.style_ids
+    logger.info(f"批量生成请求 - 用户: {current_user.email}, 源图片: {request.source_image_id}, 风格: {style_ids}")
+
+    if len(style_ids) > settings.GENERATION_BATCH_MAX_STYLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多生成 {settings.GENERATION_BATCH_MAX_STYLES} 个风格"
+        )
+
+    # 验证源图片存在
+    source_image = db.query(UploadedImage).filter(
+        UploadedImage.id == request.source_image_id
+    ).first()
+
+    if not source_image:
+        logger.warning(f"源图片不存在: {request.source_image_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="源图片不存在"
+        )
+
+    # 一次查询验证所有风格
+    styles = db.query(GenerationStyle).filter(GenerationStyle.id.in_(style_ids)).all()
+    missing = set(style_ids) - {style.id for style in styles}
+    if missing:
+        logger.warning(f"风格不存在: {sorted(missing)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的风格ID: {', '.join(sorted(missing))}"
+        )
+
+    # 一次性扣减整批积分（条件更新，并发请求不会把积分扣成负数）
+    credits_per_job = 1
+    credits_required = credits_per_job * len(style_ids)
+    deducted = db.query(User).filter(
+        User.id == current_user.id,
+        User.credits >= credits_required
+    ).update(
+        {User.credits: User.credits - credits_required},
+        synchronize_session=False
+    )
+    if not deducted:
+        db.rollback()
+        logger.warning(f"用户积分不足 - 用户: {current_user.email}, 当前积分: {current_user.credits}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"积分不足，需要 {credits_required} 积分，当前 {current_user.credits} 积分"
+        )
+    logger.info(f"扣减积分 - 用户: {current_user.email}, 扣减: {credits_required}")
+
+    # 在同一事务中创建整批任务
+    batch_id = str(uuid.uuid4())
+    created_at = datetime.utcnow()
+    jobs = []
+    for style_id in style_ids:
+        job = GenerationJob(
+            id=str(uuid.uuid4()),
+            user_id=current_user.id,
+            source_image_id=request.source_image_id,
+            style_id=style_id,
+            batch_id=batch_id,
+            status=GenerationStatus.PENDING,
+            credits_cost=credits_per_job,
+            created_at=created_at
+        )
+        db.add(job)
+        jobs.append(job)
+
+    # 更新源图片为非临时状态
+    source_image.is_temp = False
+
+    db.commit()
+    for job in jobs:
+        db.refresh(job)
+
+    logger.info(f"✓ 批量生成任务创建成功 - 批次: {batch_id}, 任务数: {len(jobs)}")
+
+    responses = [job_response(db, job) for job in jobs]
+
+    # 唤醒所有空闲 worker，整批任务并发处理
+    generation_worker_pool.notify()
+
+    return GenerationBatchResponse.from_jobs(batch_id, responses)
+
+
+@router.get("/batch/{batch_id}", response_model=GenerationBatchResponse)
+def get_generation_batch(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> GenerationBatchResponse:
+    """
+    获取批量生成的汇总状态（只能查询自己的批次）
+
+    Args:
+        batch_id: 批次 ID
+        current_user: 当前用户
+
+    Returns:
+        汇总状态和每个任务的详情
+    """
+    jobs = db.query(GenerationJob).filter(
+        GenerationJob.batch_id == batch_id,
+        GenerationJob.user_id == current_user.id
+    ).order_by(GenerationJob.created_at, GenerationJob.id).all()
+
+    if not jobs:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="批次不存在"
+        )
+
+    return GenerationBatchResponse.from_jobs(batch_id, [job_response(db, job) for job in jobs])
 
 
 @router.get("/{job_id}", response_model=GenerationJobResponse)
-def get_generation_job(
+async def get_generation_job(
     job_id: str,
-    db: Session = Depends(get_db),
+    wait: float = Query(
+        0,
+        ge=0,
+        le=settings.GENERATION_LONG_POLL_MAX_SECONDS,
+        description="长轮询：最多等待的秒数，任务状态、排队位置或结果变化后立即返回",
+    ),
 ) -> GenerationJobResponse:
     """
     获取生成任务状态
 
+    - wait=0（默认）：立即返回当前状态
+    - wait>0：长轮询，阻塞到任务状态、排队位置或结果变化（或超时）再返回；
+      任务已完成或失败时立即返回。等待期间不占用数据库连接。
+      不能使用 SSE（/{job_id}/events）的客户端用它代替高频轮询
+
     Args:
         job_id: 任务 ID
+        wait: 最长等待秒数
 
     Returns:
         任务详情，包括状态和结果 URL（如果已完成）
     """
-    logger.debug(f"查询生成任务状态 - ID: {job_id}")
+    logger.debug(f"查询生成任务状态 - ID: {job_id}, wait: {wait}")
 
-    job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+    if wait > 0:
+        job = await wait_for_job_change(job_id, wait)
+    else:
+        job = await asyncio.to_thread(load_job_snapshot, job_id)
 
     if not job:
         logger.warning(f"生成任务不存在: {job_id}")
@@ -127,5 +287,35 @@ def get_generation_job(
             detail="生成任务不存在"
         )
 
-    logger.debug(f"任务状态 - ID: {job_id}, Status: {job.status}")
+    logger.debug(f"任务状态 - ID: {job_id}, Status: {job['status']}")
     return job
+
+
+@router.get("/{job_id}/events")
+async def stream_generation_job(job_id: str) -> StreamingResponse:
+    """
+    推送生成任务状态（Server-Sent Events）
+
+    - 连接后立即推送当前状态，之后每次状态变化（排队位置、处理中、完成、失败）推送一次
+    - 事件类型为 status，数据与 GET /generations/{job_id} 相同
+    - 任务完成或失败后服务端关闭连接
+    - 取代客户端轮询；EventSource 断线后会自动重连
+
+    Args:
+        job_id: 任务 ID
+    """
+    initial = await asyncio.to_thread(load_job_state, job_id)
+    if initial is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="生成任务不存在"
+        )
+
+    return StreamingResponse(
+        stream_job_events(job_id, initial),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 nginx 缓冲，事件立即送达
+        },
+    )
@@ -1,19 +1,31 @@
 """
 图片上传 API 端点
 """
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from PIL import Image
+import hashlib
 import uuid
 import os
 import logging
-import shutil
-from typing import Set
+import tempfile
+from typing import Dict, Set
 
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.storage import storage_key
 from app.models.image import UploadedImage
 from app.schemas.image import UploadedImageResponse
+from app.services.image_validation import ImageValidationError, inspect_image
+from app.services.image_processing import prepare_upload_derivative
+from app.services.storage_backend import get_storage
+from app.services.upload_storage import (
+    acquire_blob_reference,
+    blob_storage_path,
+    find_blob,
+    register_blob,
+    release_blob,
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -31,6 +43,82 @@ ALLOWED_EXTENSIONS: Set[str] = {".jpg", ".jpeg", ".png", ".webp"}
 # 最大文件大小 (10MB)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB in bytes
 
+# 分块读取上传文件的块大小
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# multipart 请求体中除文件外的额外开销（边界、表单头等）
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"文件大小超过限制，最大支持 {MAX_FILE_SIZE // (1024 * 1024)}MB"
+    )
+
+
+def check_content_length(request: Request) -> None:
+    """
+    按 Content-Length 拒绝声明超过上传限制的请求
+
+    FastAPI 在执行依赖前已经读取了表单，这里不能阻止请求体被接收，只是尽早
+    拒绝并不再处理；请求体的大小上限应在反向代理上配置（如 nginx
+    client_max_body_size）。没有 Content-Length 的分块上传由
+    save_upload_to_temp 的累计大小检查拒绝。
+
+    Raises:
+        HTTPException: 请求体超过 MAX_FILE_SIZE + MULTIPART_OVERHEAD（413）
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        logger.warning(f"拒绝超大上传 - Content-Length: {content_length}")
+        raise _too_large()
+
+
+async def save_upload_to_temp(file: UploadFile) -> Dict:
+    """
+    分块读取上传文件并写入 TEMP_DIR 下的临时文件
+
+    每次只读取 UPLOAD_CHUNK_SIZE 字节，累计超过 MAX_FILE_SIZE 立即中止；
+    磁盘写入在线程池中执行，写入的同时计算内容的 SHA-256。
+
+    Args:
+        file: 上传的文件对象
+
+    Returns:
+        {"path": 临时文件路径, "size": 文件大小, "content_hash": SHA-256}
+
+    Raises:
+        HTTPException: 文件过大或写入失败
+    """
+    fd, temp_path = tempfile.mkstemp(dir=settings.TEMP_DIR, suffix=".upload")
+    digest = hashlib.sha256()
+    file_size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise _too_large()
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+    except HTTPException:
+        os.remove(temp_path)
+        raise
+    except Exception as e:
+        logger.error(f"写入临时文件失败: {e}")
+        os.remove(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="上传失败，请稍后重试"
+        ) from e
+
+    return {"path": temp_path, "size": file_size, "content_hash": digest.hexdigest()}
+
 
 def validate_image_file(file: UploadFile) -> None:
     """
@@ -50,7 +138,7 @@ def validate_image_file(file: UploadFile) -> None:
         )
 
     # 验证文件扩展名
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    file_ext = os.path.splitext(file.filename or "")[1].lower()
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -58,8 +146,24 @@ def validate_image_file(file: UploadFile) -> None:
         )
 
 
-@router.post("/upload", response_model=UploadedImageResponse, status_code=status.HTTP_201_CREATED)
+def _release_reference(db: Session, content_hash: str) -> None:
+    """上传失败时释放本次持有的文件引用"""
+    try:
+        release_blob(db, content_hash)
+        db.commit()
+    except Exception as e:
+        logger.error(f"清理上传文件失败: {e}")
+        db.rollback()
+
+
+@router.post(
+    "/upload",
+    response_model=UploadedImageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(check_content_length)],
+)
 async def upload_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ) -> UploadedImageResponse:
@@ -69,70 +173,88 @@ async def upload_image(
     - 接受 JPG、PNG、WEBP 格式
     - 最大文件大小：10MB
     - 返回图片元数据和存储 URL
+    - 按内容哈希存储，重复上传只新增记录，不再写入文件
+    - 响应后在进程池中预生成发送给 provider 的规范化派生图
     """
     logger.info(f"图片上传请求 - 文件名: {file.filename}, 类型: {file.content_type}")
 
     # 验证文件类型
     validate_image_file(file)
 
-    # 读取文件内容
-    contents = await file.read()
-    file_size = len(contents)
+    # 分块写入临时文件，超过大小限制立即中止
+    upload = await save_upload_to_temp(file)
+    temp_path, file_size, content_hash = upload["path"], upload["size"], upload["content_hash"]
     logger.debug(f"文件大小: {file_size / 1024:.2f} KB")
 
-    # 验证文件大小
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"文件大小超过限制，最大支持 {MAX_FILE_SIZE // (1024 * 1024)}MB"
-        )
-
-    if file_size < 1024:  # 最小 1KB
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="文件大小过小，可能已损坏"
-        )
-
+    referenced = False  # 本次请求是否持有文件引用（失败时必须释放）
+    is_new_file = False
     try:
-        # 使用 PIL 打开图片并验证
-        from io import BytesIO
-        image = Image.open(BytesIO(contents))
-        width, height = image.size
-
-        # 验证图片尺寸
-        if width < 128 or height < 128:
+        if file_size < 1024:  # 最小 1KB
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="图片尺寸过小，建议至少 512x512 像素"
+                detail="文件大小过小，可能已损坏"
             )
 
-        # 获取真实的 MIME 类型
-        mime_type = Image.MIME.get(image.format, file.content_type)
+        blob = await run_in_threadpool(find_blob, db, content_hash)
+        if blob is not None:
+            # 相同内容已保存过（通常是客户端重试），只需增加引用；
+            # 文件恰好被并发释放时按新文件重新写入
+            width, height, mime_type = blob.width, blob.height, blob.mime_type
+            storage_path = blob.storage_path
+            referenced = await run_in_threadpool(acquire_blob_reference, db, content_hash)
+            if referenced:
+                logger.info(f"重复上传，复用已有文件 - 哈希: {content_hash[:12]}")
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"无效的图片文件：{str(e)}"
-        )
+        if not referenced:
+            # 在线程池中验证图片：只读文件头 + 轻量完整性检查（不阻塞事件循环）
+            try:
+                image_info = await run_in_threadpool(inspect_image, temp_path)
+            except ImageValidationError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"无效的图片文件：{str(e)}"
+                ) from e
+            width = image_info["width"]
+            height = image_info["height"]
 
-    # 生成唯一文件名
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
+            # 验证图片尺寸
+            if width < 128 or height < 128:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="图片尺寸过小，建议至少 512x512 像素"
+                )
 
-    # 构建存储路径
-    upload_dir = os.path.join(settings.UPLOAD_DIR, "images")
-    file_path = os.path.join(upload_dir, unique_filename)
-    storage_path = f"/uploads/images/{unique_filename}"
+            # 获取真实的 MIME 类型
+            mime_type = image_info["mime_type"] or file.content_type
 
-    # 保存文件
-    try:
-        with open(file_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"上传失败，请稍后重试"
-        )
+            # 按内容哈希命名，相同内容只保存一份
+            storage_path = blob_storage_path(content_hash, mime_type)
+
+            # 先登记引用再写入文件：文件只在引用数归零时删除，并发上传同一内容互不影响
+            await run_in_threadpool(
+                register_blob, db, content_hash, storage_path, file_size, width, height, mime_type
+            )
+            referenced = True
+
+            # 保存到存储后端（本地存储为原子移动，不复制数据；对象存储保留本地副本供预处理）
+            try:
+                await run_in_threadpool(
+                    get_storage().put_file, temp_path, storage_key(storage_path), mime_type, True
+                )
+                is_new_file = True
+            except Exception as e:
+                logger.error(f"保存上传文件失败: {e}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="上传失败，请稍后重试"
+                ) from e
+    except Exception:
+        if referenced:
+            await run_in_threadpool(_release_reference, db, content_hash)
+        raise
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
     # 创建数据库记录
     try:
@@ -146,6 +268,7 @@ async def upload_image(
             width=width,
             height=height,
             mime_type=mime_type,
+            content_hash=content_hash,
             is_temp=True  # 新上传的图片标记为临时
         )
         db.add(uploaded_image)
@@ -153,17 +276,21 @@ async def upload_image(
         db.refresh(uploaded_image)
 
         logger.info(f"✓ 图片上传成功 - ID: {image_id}, 尺寸: {width}x{height}, 大小: {file_size / 1024:.2f}KB")
+
+        # 新文件预生成规范化派生图（按内容哈希命名，重复上传直接复用）
+        if is_new_file:
+            background_tasks.add_task(prepare_upload_derivative, content_hash, storage_path)
         return uploaded_image
 
     except Exception as e:
-        # 数据库操作失败，清理已上传的文件
+        # 数据库操作失败，释放本次持有的文件引用（引用数归零时才删除文件）
         logger.error(f"数据库保存失败: {e}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        db.rollback()
+        await run_in_threadpool(_release_reference, db, content_hash)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="保存图片信息失败"
-        )
+        ) from e
 
 
 @router.get("/{image_id}", response_model=UploadedImageResponse)
@@ -0,0 +1,40 @@
+"""
+运维 API 端点
+"""
+import secrets
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from app.core.config import settings
+from app.services.provider_router import parse_provider_chain, provider_router
+
+router = APIRouter()
+
+
+def verify_ops_token(x_ops_token: Optional[str] = Header(None)) -> None:
+    """校验 X-Ops-Token 请求头；未配置 OPS_TOKEN 时运维接口关闭（404）"""
+    if not settings.OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_ops_token or not secrets.compare_digest(x_ops_token, settings.OPS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的运维令牌"
+        )
+
+
+@router.get("/providers", dependencies=[Depends(verify_ops_token)])
+async def get_provider_status() -> Dict:
+    """
+    图像生成 provider 的健康状况和熔断状态
+
+    - 统计只包含当前进程（API 进程内的 worker）；独立部署的 worker 进程各自统计
+    - breaker.state: closed（正常）/ open（熔断，请求被跳过）/ half_open（探测恢复中）
+    - breaker.health_score: 0 ~ 1，窗口内的成功且不慢的请求比例，熔断时为 0
+    """
+    chain = parse_provider_chain(f"{settings.IMAGE_PROVIDER},{settings.IMAGE_PROVIDER_FALLBACKS}")
+    return {
+        "chain": chain,
+        "workers_in_api": settings.GENERATION_WORKERS_IN_API,
+        "providers": provider_router.snapshot(chain),
+    }
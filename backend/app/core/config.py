@@ -44,6 +44,28 @@ class Settings(BaseSettings):
     # Image Generation API
     # 支持的提供商: mock, google_ai, stability_ai, replicate
     IMAGE_PROVIDER: str = "mock"
+    # IMAGE_PROVIDER 失败时依次尝试的备用 provider（逗号分隔，如 "openrouter,stability_ai"）；
+    # 风格的 provider_chain 优先
+    IMAGE_PROVIDER_FALLBACKS: str = ""
+    # provider 熔断器：窗口内错误率或慢请求率过高时熔断，一段时间后放行探测请求
+    PROVIDER_BREAKER_WINDOW_SECONDS: float = 60  # 统计窗口（秒）
+    PROVIDER_BREAKER_MIN_REQUESTS: int = 5  # 窗口内请求数少于该值时不熔断
+    PROVIDER_BREAKER_ERROR_RATE: float = 0.5  # 熔断的错误率
+    PROVIDER_BREAKER_SLOW_CALL_SECONDS: float = 60  # 超过该耗时（秒）视为慢请求
+    PROVIDER_BREAKER_SLOW_CALL_RATE: float = 0.8  # 熔断的慢请求率
+    PROVIDER_BREAKER_OPEN_SECONDS: float = 30  # 熔断持续时间（秒），之后进入半开状态
+    PROVIDER_BREAKER_HALF_OPEN_PROBES: int = 1  # 半开状态同时放行的探测请求数
+    # 暂时性错误（429、5xx、连接重置）的重试：带抖动的指数退避，遵守 Retry-After
+    PROVIDER_RETRY_MAX_ATTEMPTS: int = 2  # 同一 provider 最多重试次数
+    PROVIDER_RETRY_JOB_BUDGET: int = 3  # 每个任务所有 provider 的重试总数
+    PROVIDER_RETRY_BASE_DELAY: float = 1.0  # 退避基数（秒）
+    PROVIDER_RETRY_MAX_DELAY: float = 20.0  # 单次等待上限（秒），Retry-After 超过该值时直接切换 provider
+    # 对冲请求：调用超过最近耗时的分位数仍未返回时向下一个 provider 再发一个请求，采用先返回的结果
+    PROVIDER_HEDGE_ENABLED: bool = False
+    PROVIDER_HEDGE_PERCENTILE: float = 95  # 触发对冲的耗时分位数
+    PROVIDER_HEDGE_MIN_SAMPLES: int = 20  # 耗时样本少于该数量时不对冲
+    PROVIDER_HEDGE_MIN_DELAY: float = 5  # 最早在调用开始多少秒后对冲
+    PROVIDER_HEDGE_BUDGET: float = 0.05  # 对冲请求占全部请求的最大比例
 
     # Google AI (Vertex AI - Imagen)
     GOOGLE_AI_API_KEY: str = ""
@@ -68,6 +90,37 @@ class Settings(BaseSettings):
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     OPENROUTER_MODEL: str = "google/gemini-2.0-flash-exp:free"  # 支持图像生成的模型
 
+    # Provider 请求超时（秒）
+    GOOGLE_AI_TIMEOUT: float = 90
+    STABILITY_AI_TIMEOUT: float = 90
+    REPLICATE_TIMEOUT: float = 120
+    OPENROUTER_TIMEOUT: float = 90
+    DOWNLOAD_TIMEOUT: float = 30  # 下载生成结果
+
+    # HTTP 连接池（每个 provider 一个长连接客户端）
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保持时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP2_ENABLED: bool = False  # 需要安装 h2（pip install httpx[http2]）
+    # 每个进程对同一 provider 同时进行的生成请求数（0 表示不限制）。按进程计数，集群总并发为
+    # 运行 worker 的进程数 × 该值；小于 GENERATION_WORKER_CONCURRENCY 时才会起作用
+    PROVIDER_MAX_CONCURRENCY: int = 2
+
+    # 运维接口（/api/v1/ops）的访问令牌，通过 X-Ops-Token 请求头传入；为空时运维接口关闭（404）
+    OPS_TOKEN: str = ""
+
+    # Generation Queue
+    GENERATION_WORKERS_IN_API: bool = True  # 是否在 API 进程内运行 worker（独立部署时关闭）
+    GENERATION_WORKER_CONCURRENCY: int = 4  # 每个进程并发处理的任务数
+    GENERATION_QUEUE_POLL_INTERVAL: float = 2.0  # 空闲时轮询队列的间隔（秒）
+    GENERATION_JOB_LEASE_SECONDS: int = 600  # 租约时长：worker 每 1/3 租约续租一次（推后 lease_expires_at），租约过期视为中断，重新入队
+    GENERATION_JOB_MAX_ATTEMPTS: int = 3  # 任务最多被认领的次数，超过后不再重新入队，直接标记失败
+    GENERATION_EVENTS_POLL_INTERVAL: float = 2.0  # worker 独立部署时 SSE / 长轮询在服务端读取任务状态的间隔（秒）
+    GENERATION_LONG_POLL_MAX_SECONDS: int = 30  # GET /generations/{job_id}?wait= 的最长等待时间（秒）
+    GENERATION_EVENTS_MAX_STREAM_SECONDS: int = 600  # 单个 SSE 连接的最长保持时间（秒），之后由 EventSource 自动重连
+    GENERATION_BATCH_MAX_STYLES: int = 10  # 批量生成一次最多的风格数
+
     # 保留旧的 Veo3 配置（向后兼容）
     VEO3_API_KEY: str = ""
     VEO3_API_URL: str = "https://api.veo3.example.com"
@@ -90,6 +143,23 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     TEMP_DIR: str = "./uploads/temp"
     MAX_FILE_SIZE: int = 10485760  # 10MB
+    MAX_RESULT_FILE_SIZE: int = 26214400  # 下载生成结果的大小上限 25MB
+    IMAGE_PROCESS_POOL_WORKERS: int = 2  # 图片规范化等 CPU 密集处理的进程数
+    SOURCE_PAYLOAD_CACHE_MAX_BYTES: int = 67108864  # 源图片编码载荷缓存容量 64MB
+    SOURCE_PAYLOAD_CACHE_MAX_ENTRY_BYTES: int = 8388608  # 单条载荷上限 8MB
+
+    # Storage Backend
+    # 支持: local（UPLOAD_DIR + /uploads 静态挂载）, s3（S3 兼容对象存储，需要 pip install boto3）
+    STORAGE_BACKEND: str = "local"
+    S3_BUCKET: str = ""
+    S3_ENDPOINT_URL: str = ""  # MinIO 等 S3 兼容服务的地址，AWS S3 留空
+    S3_REGION: str = "us-east-1"
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
+    S3_FORCE_PATH_STYLE: bool = False  # MinIO 需要开启
+    S3_PRESIGN_EXPIRES: int = 3600  # 预签名 URL 有效期（秒），前 80% 有效期内复用同一 URL
+    S3_CACHE_MAX_BYTES: int = 1073741824  # 本地缓存（UPLOAD_DIR/cache）容量上限 1GB，超过后按最近使用时间淘汰
+    CDN_BASE_URL: str = ""  # 配置后图片 URL 使用 CDN 地址，不再生成预签名 URL
 
     # Base URL for constructing image URLs
     BASE_URL: str = "http://localhost:8000"
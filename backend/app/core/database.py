@@ -1,9 +1,12 @@
 """
 数据库配置和会话管理
 """
+from contextlib import contextmanager
+from typing import Iterator
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
@@ -29,3 +32,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    独立的事务作用域，供后台任务等不在请求上下文中的代码使用
+
+    正常退出时提交，异常时回滚，结束后立即归还连接。
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,152 @@
+"""
+把平铺的上传目录迁移到分片布局（见 app.core.storage）
+
+    python -m app.core.migrate_storage [--batch-size 500] [--dry-run]
+
+只适用于本地存储（STORAGE_BACKEND=local）。
+
+逐批处理 uploaded_images / image_blobs 的 storage_path 和 generation_jobs 的
+result_image_url：移动文件到分片目录，再改写数据库中的路径，每批单独提交。
+可以在服务运行时执行，也可以中断后重新执行：已迁移的记录会被跳过，
+文件已移动但路径未改写的记录只补写路径。
+"""
+import argparse
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.logging_config import setup_logging
+from app.core.storage import (
+    GENERATED,
+    IMAGES,
+    UPLOADS_URL_PREFIX,
+    resolve_storage_path,
+    storage_local_path,
+    storage_url,
+)
+from app.models.image import GenerationJob, ImageBlob, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+
+def _sharded_url(url: Optional[str], category: str) -> Optional[str]:
+    """平铺布局的路径返回对应的分片路径，其余（已迁移、外部 URL）返回 None"""
+    prefix = f"{UPLOADS_URL_PREFIX}{category}/"
+    if not url or not url.startswith(prefix):
+        return None
+    filename = url[len(prefix):]
+    if not filename or "/" in filename:
+        return None
+    return storage_url(category, filename)
+
+
+def _move_file(old_url: str, new_url: str, category: str, dry_run: bool) -> bool:
+    """
+    移动文件到分片目录
+
+    Returns:
+        文件是否已在新位置（源文件和目标都不存在时返回 False）
+    """
+    old_path = resolve_storage_path(old_url)
+    new_path = resolve_storage_path(new_url)
+
+    if os.path.exists(new_path):
+        return True
+    if not os.path.exists(old_path):
+        return False
+    if dry_run:
+        return True
+
+    storage_local_path(category, os.path.basename(new_path), create_dirs=True)
+    os.replace(old_path, new_path)
+    return True
+
+
+def migrate_column(
+    db: Session,
+    model,
+    column,
+    category: str,
+    batch_size: int,
+    dry_run: bool = False
+) -> int:
+    """
+    迁移一张表中的一个路径列
+
+    按主键分批（keyset 分页），每批移动文件后提交一次。
+
+    Returns:
+        改写的记录数
+    """
+    primary_key = model.__mapper__.primary_key[0]
+    prefix = f"{UPLOADS_URL_PREFIX}{category}/"
+    last_key = None
+    migrated = 0
+    missing = 0
+
+    while True:
+        query = db.query(primary_key, column).filter(column.like(f"{prefix}%"))
+        if last_key is not None:
+            query = query.filter(primary_key > last_key)
+        rows = query.order_by(primary_key).limit(batch_size).all()
+        if not rows:
+            break
+        last_key = rows[-1][0]
+
+        for key, url in rows:
+            new_url = _sharded_url(url, category)
+            if new_url is None:
+                continue
+
+            if not _move_file(url, new_url, category, dry_run):
+                missing += 1
+                logger.warning(f"文件不存在，跳过 - {model.__tablename__} {key}: {url}")
+                continue
+
+            if not dry_run:
+                db.query(model).filter(primary_key == key).update(
+                    {column: new_url},
+                    synchronize_session=False
+                )
+            migrated += 1
+
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+        logger.info(f"{model.__tablename__}.{column.key}: 已处理 {migrated} 条")
+
+    if missing:
+        logger.warning(f"{model.__tablename__}.{column.key}: {missing} 条记录的文件不存在")
+    return migrated
+
+
+def migrate_storage(batch_size: int = 500, dry_run: bool = False) -> None:
+    """迁移所有上传图片和生成结果"""
+    db = SessionLocal()
+    try:
+        migrate_column(db, ImageBlob, ImageBlob.storage_path, IMAGES, batch_size, dry_run)
+        migrate_column(db, UploadedImage, UploadedImage.storage_path, IMAGES, batch_size, dry_run)
+        migrate_column(db, GenerationJob, GenerationJob.result_image_url, GENERATED, batch_size, dry_run)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="迁移上传目录到分片布局")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的记录数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不移动文件也不修改数据库")
+    args = parser.parse_args()
+
+    setup_logging()
+    if settings.STORAGE_BACKEND != "local":
+        parser.error("只有本地存储（STORAGE_BACKEND=local）需要迁移目录布局")
+    migrate_storage(batch_size=args.batch_size, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
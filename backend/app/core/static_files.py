@@ -0,0 +1,222 @@
+"""
+/uploads 静态文件服务（本地存储）
+
+在 Starlette StaticFiles 的基础上：
+- 只提供 images/ 和 generated/ 下的文件（temp、derived 等内部目录返回 404）
+- 文件名是内容哈希或 UUID，内容永不改变，响应带 Cache-Control: immutable，
+  浏览器和 CDN 的重复访问不会再到达 API 进程
+- ETag / If-None-Match、Last-Modified / If-Modified-Since 返回 304（StaticFiles 自带）
+- 支持单段 Range 请求（206 / 416），可配合 If-Range
+- 请求生成结果原图时按 Accept 协商，存在 AVIF / WebP 派生版本时直接返回派生版本
+"""
+import mimetypes
+import os
+import stat
+from typing import List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from app.core.storage import GENERATED, SHARDED_CATEGORIES, storage_relpath
+from app.services.image_processing import (
+    RESULT_RENDITION_FORMATS,
+    RESULT_RENDITION_SIDES,
+)
+from app.services.storage_backend import IMMUTABLE_CACHE_CONTROL
+
+# 旧版本的 mimetypes 不认识 AVIF
+mimetypes.add_type("image/avif", ".avif")
+
+# Accept 协商的格式优先级（越靠前越优先）
+NEGOTIATED_FORMATS = ("avif", "webp")
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 请求头
+
+    Returns:
+        (起始字节, 结束字节)，均包含；多段或格式无法识别时返回 None（按完整文件响应）
+
+    Raises:
+        ValueError: 范围无法满足（应返回 416）
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_text, sep, end_text = ranges.strip().partition("-")
+    if not sep:
+        return None
+
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if not start_text:
+        # bytes=-N 表示最后 N 个字节
+        if not end_text.isdigit():
+            return None
+        suffix_length = int(end_text)
+        if suffix_length == 0:
+            raise ValueError("空的后缀范围")
+        start, end = max(file_size - suffix_length, 0), file_size - 1
+    else:
+        if not start_text.isdigit() or (end_text and not end_text.isdigit()):
+            return None
+        start = int(start_text)
+        end = int(end_text) if end_text else file_size - 1
+
+    end = min(end, file_size - 1)
+    if start > end or start >= file_size:
+        raise ValueError("范围超出文件大小")
+    return start, end
+
+
+def accepted_formats(accept_header: str) -> List[str]:
+    """Accept 请求头中明确接受的协商格式（按 NEGOTIATED_FORMATS 的优先级）"""
+    accepted = set()
+    for item in accept_header.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        if any(param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for param in params):
+            continue
+        accepted.add(media_type.lower())
+    return [name for name in NEGOTIATED_FORMATS if f"image/{name}" in accepted]
+
+
+class FileRangeResponse(Response):
+    """文件的部分内容响应（206）"""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, start: int, end: int, headers: Headers, media_type: Optional[str]):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers({
+            **{key: value for key, value in headers.items() if key != "content-length"},
+            "content-length": str(end - start + 1),
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class UploadStaticFiles(StaticFiles):
+    """上传图片和生成结果的静态文件服务"""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        category = path.split(os.sep, 1)[0]
+        if category not in SHARDED_CATEGORIES:
+            raise HTTPException(status_code=404)
+
+        if category == GENERATED and scope["method"] in ("GET", "HEAD"):
+            negotiated = await self._negotiate(path, scope)
+            if negotiated is not None:
+                return negotiated
+
+        response = await super().get_response(path, scope)
+        if category == GENERATED and self._is_negotiable(path):
+            response.headers["vary"] = "Accept"
+        return response
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+        media_type: Optional[str] = None,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers={"cache-control": IMMUTABLE_CACHE_CONTROL, "accept-ranges": "bytes"},
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if not range_header or not self._if_range_matches(response.headers, request_headers):
+            return response
+
+        try:
+            byte_range = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"content-range": f"bytes */{stat_result.st_size}"},
+            )
+        if byte_range is None:
+            return response
+
+        start, end = byte_range
+        headers = response.headers.mutablecopy()
+        headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        return FileRangeResponse(str(full_path), start, end, headers, response.media_type)
+
+    @staticmethod
+    def _if_range_matches(response_headers: Headers, request_headers: Headers) -> bool:
+        """If-Range 与当前 ETag / Last-Modified 一致（或未提供）时才按 Range 响应"""
+        if_range = request_headers.get("if-range")
+        if not if_range:
+            return True
+        return if_range in (response_headers.get("etag"), response_headers.get("last-modified"))
+
+    @staticmethod
+    def _is_negotiable(path: str) -> bool:
+        """生成结果原图（不是派生版本本身）"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return not any(stem.endswith(f"_{size}") for size in RESULT_RENDITION_SIDES)
+
+    async def _negotiate(self, path: str, scope: Scope) -> Optional[Response]:
+        """按 Accept 返回原图的 AVIF / WebP 派生版本，不存在时返回 None"""
+        if not self._is_negotiable(path):
+            return None
+
+        formats = accepted_formats(Headers(scope=scope).get("accept", ""))
+        filename, extension = os.path.splitext(os.path.basename(path))
+        for name in formats:
+            if extension.lower() == f".{name}":
+                return None
+
+            relpath = storage_relpath(GENERATED, f"{filename}_full.{name}")
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, relpath)
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                response = self.file_response(
+                    full_path,
+                    stat_result,
+                    scope,
+                    media_type=RESULT_RENDITION_FORMATS[name]["mime_type"],
+                )
+                response.headers["vary"] = "Accept"
+                return response
+        return None
@@ -0,0 +1,77 @@
+"""
+上传目录布局
+
+uploads/images 和 uploads/generated 按文件名哈希分两级子目录存放：
+
+    uploads/images/ab/cd/<文件名>
+
+每级目录最多 256 个子目录，百万级文件时单个目录也只有几十个文件，
+目录查找、StaticFiles 的 stat 以及备份工具都不会随文件数变慢。
+分片只取决于文件名（不含扩展名），给定文件名即可算出位置，不需要查库。
+
+所有上传、生成结果的路径都应通过这里的函数构建。数据库中保存的是
+/uploads/<key> 形式的存储路径，<key> 同时是对象存储中的 key；文件的读写和对外 URL
+由 app.services.storage_backend 决定。本地存储下 /uploads 静态挂载直接映射
+UPLOAD_DIR，分片后的 URL 无需额外配置。旧的平铺文件用
+`python -m app.core.migrate_storage` 迁移。
+"""
+import hashlib
+import os
+
+from app.core.config import settings
+
+# 使用分片布局的目录
+IMAGES = "images"
+GENERATED = "generated"
+SHARDED_CATEGORIES = (IMAGES, GENERATED)
+
+# 存储路径 / URL 前缀（对应 main.py 中的静态挂载）
+UPLOADS_URL_PREFIX = "/uploads/"
+
+
+def shard_for(filename: str) -> str:
+    """
+    文件名对应的分片目录，如 "ab/cd"
+
+    扩展名不参与计算：下载结果时按 Content-Type 修正扩展名不会改变分片。
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    digest = hashlib.sha256(stem.encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def storage_relpath(category: str, filename: str) -> str:
+    """相对 UPLOAD_DIR 的路径，如 images/ab/cd/<文件名>"""
+    return f"{category}/{shard_for(filename)}/{filename}"
+
+
+def storage_url(category: str, filename: str) -> str:
+    """写入数据库的存储路径（同时也是静态文件 URL），如 /uploads/images/ab/cd/<文件名>"""
+    return UPLOADS_URL_PREFIX + storage_relpath(category, filename)
+
+
+def storage_local_path(category: str, filename: str, create_dirs: bool = False) -> str:
+    """
+    文件的本地路径
+
+    Args:
+        category: 目录类别（IMAGES / GENERATED）
+        filename: 文件名
+        create_dirs: 是否创建分片目录（写入前使用）
+    """
+    path = os.path.join(settings.UPLOAD_DIR, storage_relpath(category, filename))
+    if create_dirs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def storage_key(storage_path: str) -> str:
+    """存储路径对应的存储键（相对 UPLOAD_DIR 的路径，也是对象存储中的 key）"""
+    if storage_path.startswith(UPLOADS_URL_PREFIX):
+        return storage_path[len(UPLOADS_URL_PREFIX):]
+    return storage_path.lstrip("/")
+
+
+def resolve_storage_path(storage_path: str) -> str:
+    """把 /uploads/... 形式的存储路径转换为 UPLOAD_DIR 下的本地路径（新旧布局均可）"""
+    return os.path.join(settings.UPLOAD_DIR, storage_key(storage_path))
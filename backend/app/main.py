@@ -3,7 +3,6 @@ FastAPI 主应用
 """
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
 import time
 import logging
@@ -11,7 +10,13 @@ import logging
 from app.core.config import settings
 from app.core.database import engine, Base
 from app.core.logging_config import setup_logging
+from app.core.static_files import UploadStaticFiles
+from app.core.storage import SHARDED_CATEGORIES
 from app.api.v1.api import api_router
+from app.services.job_queue import generation_worker_pool
+from app.services.http_client import http_clients
+from app.services.provider_registry import image_client_registry
+from app.services.image_processing import shutdown_process_pool
 
 # 设置日志
 logger = setup_logging()
@@ -59,12 +64,16 @@ app.add_middleware(
 # 创建上传目录和子目录
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 os.makedirs(settings.TEMP_DIR, exist_ok=True)
-os.makedirs(os.path.join(settings.UPLOAD_DIR, "images"), exist_ok=True)
-os.makedirs(os.path.join(settings.UPLOAD_DIR, "generated"), exist_ok=True)
+for category in SHARDED_CATEGORIES:
+    # 分片子目录（ab/cd）在写入文件时按需创建
+    os.makedirs(os.path.join(settings.UPLOAD_DIR, category), exist_ok=True)
+os.makedirs(os.path.join(settings.UPLOAD_DIR, "derived"), exist_ok=True)
 
-# 挂载静态文件
-if os.path.exists(settings.UPLOAD_DIR):
-    app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+# 挂载静态文件（分片路径 /uploads/images/ab/cd/<文件名> 直接映射到 UPLOAD_DIR）
+# 长期缓存、ETag、Range 和 AVIF / WebP 协商见 UploadStaticFiles；
+# 对象存储模式下客户端通过预签名 URL / CDN 直接下载，不经过 API 进程
+if settings.STORAGE_BACKEND == "local" and os.path.exists(settings.UPLOAD_DIR):
+    app.mount("/uploads", UploadStaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
 
 # 注册 API 路由
 app.include_router(api_router, prefix="/api/v1")
@@ -77,10 +86,24 @@ async def startup_event():
     # 创建数据库表
     Base.metadata.create_all(bind=engine)
     logger.info("数据库表初始化完成")
+    # 创建共享的 provider HTTP 客户端
+    http_clients.start()
+    # 启动生成任务 worker 池（独立部署 worker 时由 app.worker 进程处理）
+    if settings.GENERATION_WORKERS_IN_API:
+        await generation_worker_pool.start()
     logger.info(f"应用已启动，访问地址: http://localhost:8000")
     logger.info(f"API 文档: http://localhost:8000/docs")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时执行"""
+    await generation_worker_pool.stop()
+    image_client_registry.clear()
+    await http_clients.aclose()
+    shutdown_process_pool()
+
+
 @app.get("/")
 async def root():
     """根路径"""
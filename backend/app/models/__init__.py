@@ -2,7 +2,7 @@
 数据库模型
 """
 from app.models.user import User
-from app.models.image import UploadedImage, GenerationJob, GenerationStyle, GenerationStatus
+from app.models.image import UploadedImage, ImageBlob, GenerationJob, GenerationStyle, GenerationStatus
 from app.models.payment import (
     CreditPackage,
     CreditTransaction,
@@ -13,6 +13,7 @@ from app.models.payment import (
 __all__ = [
     "User",
     "UploadedImage",
+    "ImageBlob",
     "GenerationJob",
     "GenerationStyle",
     "GenerationStatus",
@@ -1,7 +1,7 @@
 """
 图片相关模型
 """
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, JSON, Enum as SQLEnum
 from sqlalchemy.sql import func
 import uuid
 import enum
@@ -22,12 +22,35 @@ class UploadedImage(Base):
     width = Column(Integer, nullable=False)
     height = Column(Integer, nullable=False)
     mime_type = Column(String, nullable=False)
+    content_hash = Column(String, nullable=True, index=True)  # 原图 SHA-256
     is_temp = Column(Boolean, default=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class ImageBlob(Base):
+    """
+    按内容寻址的图片文件表
+
+    相同内容的上传只保存一份文件，UploadedImage 通过 content_hash 引用，
+    ref_count 记录引用数，降为 0 时删除文件。
+    """
+
+    __tablename__ = "image_blobs"
+
+    content_hash = Column(String, primary_key=True)  # SHA-256
+    storage_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)  # 字节
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    mime_type = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
 class GenerationStatus(str, enum.Enum):
     """生成任务状态"""
 
@@ -47,15 +70,20 @@ class GenerationJob(Base):
     source_image_id = Column(String, ForeignKey("uploaded_images.id"), nullable=False)
     style_id = Column(String, nullable=False)
     custom_prompt = Column(String, nullable=True)
+    batch_id = Column(String, nullable=True, index=True)  # 批量生成时同一批任务共享
     status = Column(SQLEnum(GenerationStatus), default=GenerationStatus.PENDING)
-    queue_position = Column(Integer, nullable=True)
+    claimed_by = Column(String, nullable=True)  # 认领该任务的 worker 标识
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # 被 worker 认领的次数
+    cache_key = Column(String, nullable=True, index=True)  # 结果缓存键（源图 + prompt + 模型）
     result_image_url = Column(String, nullable=True)
+    renditions = Column(JSON, nullable=True)  # 派生版本 {尺寸: {格式: 存储路径}}
     credits_cost = Column(Integer, default=1)
     error_message = Column(String, nullable=True)
     api_response = Column(String, nullable=True)  # JSON string
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    started_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)  # 认领时间
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # 租约到期时间，处理期间由 worker 定期续租
     completed_at = Column(DateTime(timezone=True), nullable=True)
 
 
@@ -71,6 +99,8 @@ class GenerationStyle(Base):
     thumbnail_url = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     is_premium = Column(Boolean, default=False)
+    cache_results = Column(Boolean, default=False)  # 相同源图和模型直接复用已有结果
+    provider_chain = Column(String, nullable=True)  # provider 尝试顺序（逗号分隔），为空时使用全局配置
     sort_order = Column(Integer, default=0)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
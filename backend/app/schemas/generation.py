@@ -1,9 +1,11 @@
 """
 生成相关的 Pydantic schemas
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
+
+from app.services.storage_backend import public_url
 
 
 class GenerationStyleResponse(BaseModel):
@@ -13,6 +15,7 @@ class GenerationStyleResponse(BaseModel):
     description: Optional[str] = None
     prompt_template: str
     sort_order: int
+    cache_results: bool = False  # 同一张图片重复生成时直接返回已有结果
 
     class Config:
         from_attributes = True
@@ -30,12 +33,98 @@ class GenerationJobResponse(BaseModel):
     user_id: str
     source_image_id: str
     style_id: str
+    batch_id: Optional[str] = None
     status: str  # "pending", "processing", "completed", "failed"
+    queue_position: Optional[int] = None  # 排队中时的位置，1 表示下一个处理
     result_image_url: Optional[str] = None
+    # 派生版本 {尺寸: {格式: URL}}，尺寸为 thumb / medium / full，格式为 webp / avif
+    renditions: Optional[Dict[str, Dict[str, str]]] = None
     error_message: Optional[str] = None
     credits_cost: int
     created_at: datetime
+    started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
+    @field_validator("result_image_url")
+    @classmethod
+    def _to_public_url(cls, value: Optional[str]) -> Optional[str]:
+        """存储路径转换为客户端可访问的 URL（本地路径 / 预签名 URL / CDN 地址）"""
+        return public_url(value)
+
+    @field_validator("renditions")
+    @classmethod
+    def _renditions_to_public_urls(
+        cls, value: Optional[Dict[str, Dict[str, str]]]
+    ) -> Optional[Dict[str, Dict[str, str]]]:
+        """派生版本的存储路径转换为客户端可访问的 URL"""
+        if not value:
+            return value
+        return {
+            size: {fmt: public_url(path) for fmt, path in formats.items()}
+            for size, formats in value.items()
+        }
+
     class Config:
         from_attributes = True
+
+
+class GenerationBatchCreate(BaseModel):
+    """批量生成请求：同一张源图片生成多个风格"""
+    source_image_id: str
+    style_ids: List[str] = Field(..., min_length=1)
+
+    @field_validator("style_ids")
+    @classmethod
+    def _unique_style_ids(cls, value: List[str]) -> List[str]:
+        """去掉重复的风格（保持顺序）"""
+        return list(dict.fromkeys(value))
+
+
+class GenerationBatchResponse(BaseModel):
+    """
+    批量生成响应
+
+    status 为整批的汇总状态：
+    - pending: 所有任务都在排队
+    - processing: 有任务正在处理或排队
+    - completed: 全部完成
+    - failed: 全部失败
+    - partial: 全部结束，部分失败
+    """
+    batch_id: str
+    status: str
+    total: int
+    pending: int
+    processing: int
+    completed: int
+    failed: int
+    credits_cost: int
+    jobs: List[GenerationJobResponse]
+
+    @staticmethod
+    def from_jobs(batch_id: str, jobs: List[GenerationJobResponse]) -> "GenerationBatchResponse":
+        """从同一批任务的响应（见 job_events.job_response）创建汇总响应"""
+        counts = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+        for job in jobs:
+            counts[job.status] += 1
+
+        total = len(jobs)
+        if counts["completed"] == total:
+            batch_status = "completed"
+        elif counts["failed"] == total:
+            batch_status = "failed"
+        elif counts["completed"] + counts["failed"] == total:
+            batch_status = "partial"
+        elif counts["pending"] == total:
+            batch_status = "pending"
+        else:
+            batch_status = "processing"
+
+        return GenerationBatchResponse(
+            batch_id=batch_id,
+            status=batch_status,
+            total=total,
+            credits_cost=sum(job.credits_cost for job in jobs),
+            jobs=jobs,
+            **counts,
+        )
@@ -1,10 +1,12 @@
 """
 历史记录相关的 Pydantic schemas
 """
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator
+from typing import Dict, Optional
 from datetime import datetime
 
+from app.services.storage_backend import public_url
+
 
 class StyleInfo(BaseModel):
     """风格信息"""
@@ -25,11 +27,32 @@ class HistoryItem(BaseModel):
     custom_prompt: Optional[str] = None
     status: str
     result_image_url: Optional[str] = None
+    # 派生版本 {尺寸: {格式: URL}}，列表页使用 thumb
+    renditions: Optional[Dict[str, Dict[str, str]]] = None
     credits_cost: int
     error_message: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
 
+    @field_validator("result_image_url")
+    @classmethod
+    def _to_public_url(cls, value: Optional[str]) -> Optional[str]:
+        """存储路径转换为客户端可访问的 URL（本地路径 / 预签名 URL / CDN 地址）"""
+        return public_url(value)
+
+    @field_validator("renditions")
+    @classmethod
+    def _renditions_to_public_urls(
+        cls, value: Optional[Dict[str, Dict[str, str]]]
+    ) -> Optional[Dict[str, Dict[str, str]]]:
+        """派生版本的存储路径转换为客户端可访问的 URL"""
+        if not value:
+            return value
+        return {
+            size: {fmt: public_url(path) for fmt, path in formats.items()}
+            for size, formats in value.items()
+        }
+
     class Config:
         from_attributes = True
 
@@ -54,6 +77,7 @@ class HistoryResponse(BaseModel):
                 custom_prompt=job.custom_prompt,
                 status=job.status.value if hasattr(job.status, 'value') else job.status,
                 result_image_url=job.result_image_url,
+                renditions=job.renditions,
                 credits_cost=job.credits_cost,
                 error_message=job.error_message,
                 created_at=job.created_at,
@@ -1,8 +1,11 @@
 """
 图片相关的 Pydantic schemas
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import datetime
+from typing import Optional
+
+from app.services.storage_backend import public_url
 
 
 class UploadedImageResponse(BaseModel):
@@ -16,5 +19,11 @@ class UploadedImageResponse(BaseModel):
     mime_type: str
     created_at: datetime
 
+    @field_validator("storage_path")
+    @classmethod
+    def _to_public_url(cls, value: Optional[str]) -> Optional[str]:
+        """存储路径转换为客户端可访问的 URL（本地路径 / 预签名 URL / CDN 地址）"""
+        return public_url(value)
+
     class Config:
         from_attributes = True
@@ -0,0 +1,144 @@
+"""
+provider 熔断器
+
+每个 provider 一个熔断器，统计最近 PROVIDER_BREAKER_WINDOW_SECONDS 秒内请求的
+错误率和慢请求率：
+- closed: 正常放行。窗口内请求数达到 PROVIDER_BREAKER_MIN_REQUESTS，且错误率达到
+  PROVIDER_BREAKER_ERROR_RATE 或慢请求率达到 PROVIDER_BREAKER_SLOW_CALL_RATE 时熔断
+- open: 拒绝请求（路由直接换用下一个 provider，全部熔断时任务立即失败），
+  PROVIDER_BREAKER_OPEN_SECONDS 秒后进入 half_open
+- half_open: 只放行 PROVIDER_BREAKER_HALF_OPEN_PROBES 个探测请求，
+  探测成功恢复 closed，失败重新 open
+
+状态只在本进程内统计，多个 worker 进程各自熔断。
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个 provider 的熔断器"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.open_count = 0  # 累计熔断次数
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (时间, 是否失败, 是否慢请求)
+        self._probes = 0  # half_open 时正在进行的探测请求
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        是否放行一个请求
+
+        half_open 时放行的请求占用一个探测名额，调用方必须随后调用
+        record_success / record_failure / release 之一。
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < settings.PROVIDER_BREAKER_OPEN_SECONDS:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= settings.PROVIDER_BREAKER_HALF_OPEN_PROBES:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self, elapsed: float) -> None:
+        """记录成功的请求"""
+        slow = elapsed >= settings.PROVIDER_BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if slow:
+                    self._open()
+                else:
+                    self._close()
+                return
+            self._record(failed=False, slow=slow)
+
+    def record_failure(self) -> None:
+        """记录失败的请求"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                self._open()
+                return
+            self._record(failed=True, slow=False)
+
+    def release(self) -> None:
+        """请求被取消（不计入统计），归还探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        now = time.monotonic()
+        self._calls.append((now, failed, slow))
+        self._trim(now)
+
+        if self.state != CLOSED or len(self._calls) < settings.PROVIDER_BREAKER_MIN_REQUESTS:
+            return
+        error_rate, slow_rate = self._rates()
+        if (
+            error_rate >= settings.PROVIDER_BREAKER_ERROR_RATE
+            or slow_rate >= settings.PROVIDER_BREAKER_SLOW_CALL_RATE
+        ):
+            self._open()
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - settings.PROVIDER_BREAKER_WINDOW_SECONDS
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _rates(self) -> Tuple[float, float]:
+        """窗口内的 (错误率, 慢请求率)"""
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return failures / total, slow / total
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.open_count += 1
+        self._calls.clear()
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.opened_at = None
+        self._calls.clear()
+
+    def snapshot(self) -> Dict:
+        """当前状态（运维接口）"""
+        with self._lock:
+            self._trim(time.monotonic())
+            error_rate, slow_rate = self._rates()
+            retry_in = None
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                retry_in = round(max(settings.PROVIDER_BREAKER_OPEN_SECONDS - elapsed, 0.0), 1)
+            return {
+                "state": self.state,
+                "window_requests": len(self._calls),
+                "error_rate": round(error_rate, 3),
+                "slow_call_rate": round(slow_rate, 3),
+                # 健康分：1 表示窗口内没有失败和慢请求，熔断时为 0
+                "health_score": 0.0 if self.state == OPEN else round(1 - max(error_rate, slow_rate), 3),
+                "open_count": self.open_count,
+                "half_open_in": retry_in,
+            }
@@ -1,72 +1,227 @@
 """
 图像生成服务
 """
+import asyncio
+import base64
+import contextlib
+import json
 import logging
-import httpx
 import uuid
 import os
+import tempfile
 from datetime import datetime
-from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
 
+from app.core.database import session_scope
 from app.models.image import GenerationJob, GenerationStatus, UploadedImage, GenerationStyle
-from app.services.image_generation_client import create_image_client
+from app.services.provider_registry import image_client_registry
+from app.services.provider_router import ProviderChainError, count_retries, provider_router
+from app.services.image_generation_client import guess_image_mime_type
+from app.services.image_processing import create_result_renditions, ensure_normalized_source
+from app.services.result_cache import (
+    backfill_content_hash,
+    find_cached_result,
+    link_cached_result,
+    result_cache_key,
+)
+from app.services.http_client import http_clients, request_timeout
+from app.services.job_events import job_event_broker
 from app.core.config import settings
+from app.core.storage import GENERATED, storage_key, storage_url
+from app.services.storage_backend import get_storage
 
 logger = logging.getLogger(__name__)
 
 
-async def download_image(url: str, save_path: str, timeout: int = 30) -> None:
+# 生成结果 MIME 类型对应的文件扩展名
+MIME_EXTENSIONS: Dict[str, str] = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+}
+
+# 流式下载的块大小（字节）
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# base64 分块解码的块大小（字符数，必须是 4 的倍数）
+BASE64_CHUNK_CHARS = 256 * 1024
+
+
+def parse_data_uri_header(data_uri: str) -> Tuple[int, Optional[str]]:
     """
-    下载图片到本地
+    解析 data URI 头部
 
     Args:
-        url: 图片 URL
+        data_uri: 形如 data:image/png;base64,... 的字符串
+
+    Returns:
+        (base64 数据起始偏移, MIME 类型)
+
+    Raises:
+        Exception: 不是合法的 base64 data URI
+    """
+    comma = data_uri.find(",", 0, 256)
+    if comma == -1 or not data_uri[:comma].endswith(";base64"):
+        raise Exception("无效的 base64 图片数据")
+    mime_type = data_uri[len("data:"):comma - len(";base64")] or None
+    return comma + 1, mime_type
+
+
+def save_base64_image(data: str, save_path: str, offset: int = 0) -> int:
+    """
+    分块解码 base64 并写入文件
+
+    每次只解码 BASE64_CHUNK_CHARS 个字符，内存中不会出现完整的解码副本。
+
+    Args:
+        data: base64 字符串（可以是完整的 data URI，配合 offset 使用）
         save_path: 保存路径
-        timeout: 超时时间（秒）
+        offset: base64 数据在 data 中的起始位置
+
+    Returns:
+        写入的字节数
+    """
+    written = 0
+    carry = ""
+    try:
+        with open(save_path, "wb") as f:
+            for start in range(offset, len(data), BASE64_CHUNK_CHARS):
+                # 去掉换行等空白字符，保证按 4 字符对齐
+                chunk = "".join((carry + data[start:start + BASE64_CHUNK_CHARS]).split())
+                usable = len(chunk) - len(chunk) % 4
+                carry = chunk[usable:]
+                if usable:
+                    written += f.write(base64.b64decode(chunk[:usable]))
+
+            if carry:
+                raise ValueError("base64 数据长度不完整")
+    except Exception as e:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise Exception(f"解码生成图片失败：{str(e)}") from e
+
+    return written
+
+
+def _replace_extension(path: str, mime_type: Optional[str]) -> str:
+    """按 MIME 类型修正文件扩展名"""
+    extension = MIME_EXTENSIONS.get(mime_type)
+    if not extension:
+        return path
+    return os.path.splitext(path)[0] + extension
+
+
+async def download_image(url: str, save_path: str, timeout: Optional[float] = None) -> str:
+    """
+    流式下载图片到本地
+
+    - 校验 Content-Type 必须是图片
+    - 超过 MAX_RESULT_FILE_SIZE 立即中止
+    - 分块写入同目录的临时文件（写盘在线程池中执行），完成后原子重命名
+
+    Args:
+        url: 图片 URL
+        save_path: 保存路径（扩展名会按实际 Content-Type 修正）
+        timeout: 超时时间（秒），默认 DOWNLOAD_TIMEOUT
+
+    Returns:
+        实际保存路径
 
     Raises:
         Exception: 下载失败
     """
+    max_size = settings.MAX_RESULT_FILE_SIZE
+    temp_path = None
+
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.get(url)
+        client = http_clients.get("download")
+        async with client.stream(
+            "GET",
+            url,
+            timeout=request_timeout(timeout or settings.DOWNLOAD_TIMEOUT),
+            follow_redirects=True
+        ) as response:
             response.raise_for_status()
 
-            with open(save_path, "wb") as f:
-                f.write(response.content)
+            mime_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if not mime_type.startswith("image/"):
+                raise Exception(f"返回的不是图片（Content-Type: {mime_type or '未知'}）")
+
+            content_length = response.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > max_size:
+                raise Exception(f"图片大小超过限制（{int(content_length)} 字节）")
 
-            logger.info(f"Downloaded image to {save_path}")
+            save_path = _replace_extension(save_path, mime_type)
+            fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(save_path),
+                suffix=".part"
+            )
+
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise Exception(f"图片大小超过限制（>{max_size} 字节）")
+                    await asyncio.to_thread(f.write, chunk)
+
+        os.replace(temp_path, save_path)
+        temp_path = None
+
+        logger.info(f"Downloaded image to {save_path} ({size / 1024:.1f} KB)")
+        return save_path
 
     except Exception as e:
         logger.error(f"Failed to download image: {e}")
         raise Exception(f"下载生成图片失败：{str(e)}")
 
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
 
-async def process_generation_job(job_id: str, db: Session) -> None:
-    """
-    处理生成任务（后台任务）
 
-    1. 更新状态为 PROCESSING
-    2. 获取源图片和风格信息
-    3. 调用 Veo3 API
-    4. 下载并保存生成结果
-    5. 更新任务状态为 COMPLETED 或 FAILED
+async def _prepare_source(source_key: str, source_path: str, provider: str) -> Dict:
+    """
+    获取发送给 provider 的源图片
 
-    Args:
-        job_id: 任务 ID
-        db: 数据库会话
+    Returns:
+        {"path": str, "mime_type": str}，规范化失败时回退到原图
     """
     try:
-        # 查询任务
+        return await ensure_normalized_source(source_key, source_path, provider)
+    except Exception as e:
+        logger.warning(f"源图片规范化失败，使用原图 - {source_key}: {e}")
+        return {"path": source_path, "mime_type": guess_image_mime_type(source_path)}
+
+
+async def _create_renditions(job_id: str, generated_path: str) -> Optional[Dict]:
+    """生成结果的派生版本，失败时只记录日志（客户端回退到原图）"""
+    try:
+        stem = os.path.splitext(os.path.basename(generated_path))[0]
+        return await create_result_renditions(generated_path, stem)
+    except Exception as e:
+        logger.warning(f"Job {job_id} 生成派生版本失败: {e}")
+        return None
+
+
+def _load_job_context(job_id: str, worker_id: Optional[str]) -> Optional[Dict]:
+    """
+    在短事务中读取任务所需的全部数据
+
+    Returns:
+        任务上下文（纯数据，不持有会话）；任务不存在或已不归该 worker 处理时返回 None
+
+    Raises:
+        Exception: 源图片或风格不存在
+    """
+    with session_scope() as db:
         job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
         if not job:
-            logger.error(f"Job {job_id} not found")
-            return
+            return None
 
-        # 更新状态为处理中
-        job.status = GenerationStatus.PROCESSING
-        db.commit()
-        logger.info(f"Job {job_id} status updated to PROCESSING")
+        if job.status != GenerationStatus.PROCESSING or job.claimed_by != worker_id:
+            logger.warning(f"Job {job_id} is no longer claimed by this worker, skipping")
+            return None
 
         # 获取源图片
         source_image = db.query(UploadedImage).filter(
@@ -84,100 +239,278 @@ async def process_generation_job(job_id: str, db: Session) -> None:
         if not style:
             raise Exception("风格不存在")
 
-        # 获取源图片的本地路径
-        source_image_local_path = source_image.storage_path.replace("/uploads/", "uploads/")
-        if not source_image_local_path.startswith("uploads/"):
-            source_image_local_path = f"uploads/{source_image_local_path}"
+        return {
+            "source_image_id": source_image.id,
+            "source_storage_path": source_image.storage_path,
+            "content_hash": source_image.content_hash,
+            "prompt": style.prompt_template,
+            "cache_results": bool(style.cache_results),
+            "provider_chain": style.provider_chain,
+        }
 
-        # 构建 prompt
-        prompt = style.prompt_template
-
-        # 根据配置选择 API provider 和 key
-        provider = settings.IMAGE_PROVIDER
-        api_key = None
-        client_kwargs = {}
-
-        if provider == "google_ai":
-            api_key = settings.GOOGLE_AI_API_KEY
-            client_kwargs["project_id"] = settings.GOOGLE_PROJECT_ID
-            client_kwargs["location"] = settings.GOOGLE_LOCATION
-            client_kwargs["base_url_template"] = settings.GOOGLE_BASE_URL_TEMPLATE
-            client_kwargs["model"] = settings.GOOGLE_MODEL
-            if settings.GOOGLE_SERVICE_ACCOUNT_PATH:
-                client_kwargs["service_account_path"] = settings.GOOGLE_SERVICE_ACCOUNT_PATH
-        elif provider == "stability_ai":
-            api_key = settings.STABILITY_AI_API_KEY
-            client_kwargs["base_url"] = settings.STABILITY_AI_BASE_URL
-            client_kwargs["model"] = settings.STABILITY_AI_MODEL
-        elif provider == "replicate":
-            api_key = settings.REPLICATE_API_KEY
-            client_kwargs["base_url"] = settings.REPLICATE_BASE_URL
-            client_kwargs["model"] = settings.REPLICATE_MODEL
-        elif provider == "openrouter":
-            api_key = settings.OPENROUTER_API_KEY
-            client_kwargs["base_url"] = settings.OPENROUTER_BASE_URL
-            client_kwargs["model"] = settings.OPENROUTER_MODEL
-
-        # 创建图像生成客户端
-        image_client = create_image_client(
-            provider=provider,
-            api_key=api_key,
-            **client_kwargs
+
+def _finish_job(job_id: str, worker_id: Optional[str], **fields) -> bool:
+    """
+    在短事务中写入任务的最终状态
+
+    只有任务仍为 PROCESSING 且由该 worker 认领时才写入：租约过期后任务可能已被
+    其他 worker 重新认领，此时放弃本次结果，不覆盖新的处理。
+
+    Returns:
+        是否写入
+    """
+    with session_scope() as db:
+        updated = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == GenerationStatus.PROCESSING,
+            GenerationJob.claimed_by == worker_id
+        ).update(
+            fields,
+            synchronize_session=False
         )
+    return updated == 1
+
+
+def _attach_renditions(job_id: str, result_image_url: str, renditions: Dict) -> bool:
+    """
+    为已完成的任务补充派生版本
 
-        logger.info(f"Using {provider} provider for image generation")
+    只在任务仍是这次写入的结果时更新，避免覆盖之后的处理。
 
-        # 调用 API 生成图像
-        result = await image_client.generate_image(
-            prompt=prompt,
-            source_image_path=source_image_local_path
+    Returns:
+        是否写入
+    """
+    with session_scope() as db:
+        updated = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == GenerationStatus.COMPLETED,
+            GenerationJob.result_image_url == result_image_url
+        ).update(
+            {GenerationJob.renditions: renditions},
+            synchronize_session=False
         )
+    return updated == 1
 
-        # 从结果中获取生成的图片
-        generated_image_url = result.get("image_url")
-        if not generated_image_url:
-            raise Exception("API 未返回图片 URL")
 
-        # 下载或保存生成的图片
-        generated_filename = f"result_{uuid.uuid4()}.jpg"
-        generated_dir = os.path.join(settings.UPLOAD_DIR, "generated")
-        generated_path = os.path.join(generated_dir, generated_filename)
+async def _add_renditions(job_id: str, result_image_url: str) -> None:
+    """任务完成后生成缩略图等派生版本并推送更新，失败时只记录日志（客户端回退到原图）"""
+    try:
+        # 原图保存时保留了本地副本，对象存储也不需要重新下载
+        local_path = await asyncio.to_thread(get_storage().fetch, storage_key(result_image_url))
+        renditions = await _create_renditions(job_id, local_path)
+        if not renditions:
+            return
+        if not await asyncio.to_thread(_attach_renditions, job_id, result_image_url, renditions):
+            for formats in renditions.values():
+                for path in formats.values():
+                    await asyncio.to_thread(get_storage().delete, storage_key(path))
+            return
+    except Exception as e:
+        logger.warning(f"Job {job_id} 补充派生版本失败: {e}")
+        return
+
+    job_event_broker.publish(job_id)
+
+
+def _discard_result(job_id: str, result_image_url: str, renditions: Optional[Dict] = None) -> None:
+    """删除未能写入任务的生成结果（任务已不归本 worker）"""
+    logger.warning(f"Job {job_id} is no longer claimed by this worker, discarding result")
+    paths = [result_image_url]
+    for formats in (renditions or {}).values():
+        paths.extend(formats.values())
+    for path in paths:
+        try:
+            get_storage().delete(storage_key(path))
+        except Exception as e:
+            logger.debug(f"删除结果文件失败（忽略）- {path}: {e}")
 
-        # 检查是否是 base64 格式
-        if generated_image_url.startswith("data:image"):
-            # 处理 base64 图片
-            import base64
-            import re
 
-            # 提取 base64 数据
-            base64_data = re.sub(r'^data:image\/\w+;base64,', '', generated_image_url)
-            image_data = base64.b64decode(base64_data)
+async def process_generation_job(job_id: str, worker_id: Optional[str] = None) -> None:
+    """
+    处理生成任务（由 worker 池在认领任务后调用）
+
+    1. 确认任务仍由该 worker 认领（PROCESSING）
+    2. 获取源图片和风格信息
+    3. 风格开启结果缓存时查找相同输入的已完成任务，命中则直接完成
+    4. 按 provider 链调用图像生成 API，暂时性错误先重试，仍失败时切换到下一个 provider
+    5. 下载并保存生成结果
+    6. 更新任务状态为 COMPLETED 或 FAILED
+    7. 完成后再生成缩略图等派生版本，单独写入并推送（不拖慢结果返回）
+
+    任务自行管理数据库会话：每次读取或状态变更都是独立的短事务，
+    调用 provider 期间不持有任何连接。最终状态只在任务仍归该 worker 时写入。
 
-            # 保存到本地
-            with open(generated_path, "wb") as f:
-                f.write(image_data)
+    Args:
+        job_id: 任务 ID
+        worker_id: 认领任务的 worker 标识（claimed_by）
+    """
+    try:
+        context = await asyncio.to_thread(_load_job_context, job_id, worker_id)
+        if context is None:
+            return
+
+        logger.info(f"Job {job_id} status updated to PROCESSING")
+        job_event_broker.publish(job_id)
+
+        # 获取源图片的本地路径（对象存储会下载到本地缓存）
+        source_image_local_path = await asyncio.to_thread(
+            get_storage().fetch, storage_key(context["source_storage_path"])
+        )
 
+        # 构建 prompt
+        prompt = context["prompt"]
+
+        # provider 尝试顺序（首选 provider 失败时在本任务内切换到下一个）
+        chain = provider_router.chain(context["provider_chain"])
+        provider = chain[0]
+        image_client = image_client_registry.get(provider)
+
+        logger.info(f"Using provider chain {chain} for image generation")
+
+        # 风格开启了结果缓存时，相同源图 + prompt + 模型直接复用已有结果
+        # 积分在创建任务时已按正常价格扣除，命中缓存不退还（缓存只节省上游调用）
+        content_hash = context["content_hash"]
+        cache_key = None
+        if context["cache_results"]:
+            if not content_hash:
+                content_hash = await asyncio.to_thread(
+                    backfill_content_hash, context["source_image_id"], source_image_local_path
+                )
+            cache_key = result_cache_key(
+                content_hash, prompt, provider, getattr(image_client, "model", None)
+            )
+            cached = await asyncio.to_thread(find_cached_result, cache_key)
+            if cached:
+                result_image_url = await asyncio.to_thread(link_cached_result, cached)
+                finished = await asyncio.to_thread(
+                    _finish_job,
+                    job_id,
+                    worker_id,
+                    status=GenerationStatus.COMPLETED,
+                    result_image_url=result_image_url,
+                    renditions=cached["renditions"],
+                    cache_key=cache_key,
+                    api_response=json.dumps({"cache_hit": True, "cached_job_id": cached["job_id"]}),
+                    completed_at=datetime.utcnow()
+                )
+                if not finished:
+                    if result_image_url != cached["result_image_url"]:
+                        await asyncio.to_thread(_discard_result, job_id, result_image_url)
+                    return
+                job_event_broker.publish(job_id)
+                logger.info(f"Job {job_id} completed from result cache (job {cached['job_id']})")
+                return
+
+        source_key = content_hash or context["source_image_id"]
+
+        async def attempt(candidate: str, client) -> Dict:
+            # 使用按 provider 规范化的派生图（EXIF 旋转、缩放、去元数据）；
+            # 派生图和编码载荷按内容哈希复用，重复上传的图片共享同一份
+            source = await _prepare_source(source_key, source_image_local_path, candidate)
+
+            # 调用 API 生成图像（同一图片同一派生图的编码载荷跨任务复用），
+            # 同一 provider 的并发请求数受 PROVIDER_MAX_CONCURRENCY 限制
+            async with image_client_registry.limit(candidate) or contextlib.nullcontext():
+                return await client.generate_image(
+                    prompt=prompt,
+                    source_image_path=source["path"],
+                    source_mime_type=source["mime_type"],
+                    source_cache_key=f"{source_key}:{os.path.basename(source['path'])}"
+                )
+
+        used_provider, result, attempts = await provider_router.generate(chain, attempt)
+        if used_provider != provider:
+            logger.info(f"Job {job_id} generated by fallback provider {used_provider}")
+            if cache_key:
+                # 结果缓存键按实际生成结果的 provider 和模型计算
+                cache_key = result_cache_key(
+                    content_hash, prompt, used_provider,
+                    getattr(image_client_registry.get(used_provider), "model", None)
+                )
+
+        # 从结果中获取生成的图片（原始 base64 或 URL / data URI）
+        image_base64 = result.get("image_base64")
+        generated_image_url = result.get("image_url")
+        mime_type = result.get("mime_type")
+        base64_offset = 0
+
+        if not image_base64 and generated_image_url and generated_image_url.startswith("data:image"):
+            # data URI：只解析头部，从逗号之后开始解码，不复制整个字符串
+            image_base64 = generated_image_url
+            base64_offset, mime_type = parse_data_uri_header(generated_image_url)
+            generated_image_url = None
+
+        if not image_base64 and not generated_image_url:
+            raise Exception("API 未返回图片 URL")
+
+        # 下载或保存生成的图片
+        extension = MIME_EXTENSIONS.get(mime_type, ".jpg")
+        generated_filename = f"result_{uuid.uuid4()}{extension}"
+        # 先写入 TEMP_DIR，完成后交给存储后端
+        generated_path = os.path.join(settings.TEMP_DIR, generated_filename)
+
+        if image_base64:
+            # 分块解码并写入文件（在线程池中执行，不阻塞事件循环）
+            await asyncio.to_thread(save_base64_image, image_base64, generated_path, base64_offset)
+            del image_base64, result
             logger.info(f"Saved base64 image to {generated_path}")
         else:
-            # 从 URL 下载图片
-            await download_image(generated_image_url, generated_path)
+            # 从 URL 下载图片（扩展名按实际 Content-Type 修正）
+            generated_path = await download_image(generated_image_url, generated_path)
+            generated_filename = os.path.basename(generated_path)
+
+        result_image_url = storage_url(GENERATED, generated_filename)
+        try:
+            # 保存原图（对象存储保留本地副本，随后生成派生版本时使用）
+            await asyncio.to_thread(
+                get_storage().put_file,
+                generated_path,
+                storage_key(result_image_url),
+                guess_image_mime_type(generated_path),
+                True
+            )
+        finally:
+            if os.path.exists(generated_path):
+                os.remove(generated_path)
 
         # 更新任务状态为完成
-        job.status = GenerationStatus.COMPLETED
-        job.result_image_url = f"/uploads/generated/{generated_filename}"
-        job.completed_at = datetime.utcnow()
-        db.commit()
+        finished = await asyncio.to_thread(
+            _finish_job,
+            job_id,
+            worker_id,
+            status=GenerationStatus.COMPLETED,
+            result_image_url=result_image_url,
+            cache_key=cache_key,
+            api_response=json.dumps(
+                {"provider": used_provider, "retries": count_retries(attempts), "attempts": attempts},
+                ensure_ascii=False
+            ),
+            completed_at=datetime.utcnow()
+        )
+        if not finished:
+            await asyncio.to_thread(_discard_result, job_id, result_image_url)
+            return
 
+        job_event_broker.publish(job_id)
         logger.info(f"Job {job_id} completed successfully")
 
+        # 结果已返回给客户端，再补充派生版本
+        await _add_renditions(job_id, result_image_url)
+
     except Exception as e:
         logger.error(f"Job {job_id} failed: {e}")
 
-        # 更新任务状态为失败
+        # 更新任务状态为失败（provider 全部失败时记录每次尝试和重试）
+        fields = {"status": GenerationStatus.FAILED, "error_message": str(e)}
+        if isinstance(e, ProviderChainError):
+            fields["api_response"] = json.dumps(
+                {"retries": count_retries(e.attempts), "attempts": e.attempts},
+                ensure_ascii=False
+            )
         try:
-            job.status = GenerationStatus.FAILED
-            job.error_message = str(e)
-            db.commit()
+            if await asyncio.to_thread(_finish_job, job_id, worker_id, **fields):
+                job_event_broker.publish(job_id)
+            else:
+                logger.warning(f"Job {job_id} is no longer claimed by this worker, failure not recorded")
         except Exception as commit_error:
             logger.error(f"Failed to update job status: {commit_error}")
-            db.rollback()
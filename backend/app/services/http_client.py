@@ -0,0 +1,107 @@
+"""
+进程级共享的 HTTP 客户端
+
+每个 provider（以及结果下载）使用一个长连接 httpx.AsyncClient，
+复用 TCP / TLS 连接，避免每次任务和每次轮询都重新握手。
+在应用启动时创建，关闭时释放。
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+
+def _provider_timeout(name: str) -> float:
+    """各 provider 的默认读取超时"""
+    timeouts = {
+        "google_ai": settings.GOOGLE_AI_TIMEOUT,
+        "stability_ai": settings.STABILITY_AI_TIMEOUT,
+        "replicate": settings.REPLICATE_TIMEOUT,
+        "openrouter": settings.OPENROUTER_TIMEOUT,
+        "download": settings.DOWNLOAD_TIMEOUT,
+    }
+    return timeouts.get(name, 60)
+
+
+def request_timeout(read: float) -> httpx.Timeout:
+    """
+    单次请求的超时
+
+    按请求传入的 timeout 会整体替换客户端默认值，provider 自定义读取超时时
+    也要带上连接超时，否则连接阶段会等满读取超时。
+    """
+    return httpx.Timeout(read, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def configured_clients() -> List[str]:
+    """默认预先创建的客户端：当前 provider、备用 provider 和结果下载"""
+    names = [settings.IMAGE_PROVIDER, *settings.IMAGE_PROVIDER_FALLBACKS.split(","), "download"]
+    return list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+
+class HTTPClientManager:
+    """按名称管理共享的 httpx.AsyncClient"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        http2 = settings.HTTP2_ENABLED
+        if http2 and not H2_AVAILABLE:
+            logger.warning("HTTP2_ENABLED 已开启但未安装 h2，回退到 HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = request_timeout(_provider_timeout(name))
+
+        logger.info(f"创建共享 HTTP 客户端 - {name}, HTTP/2: {http2}")
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        获取指定名称的共享客户端，不存在时创建
+
+        Args:
+            name: provider 名称（如 "google_ai"）或 "download"
+
+        Returns:
+            长连接客户端，调用方不要关闭
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+            self._clients[name] = client
+        return client
+
+    def start(self, names: Optional[Iterable[str]] = None) -> None:
+        """预先创建客户端（默认当前 provider、IMAGE_PROVIDER_FALLBACKS 中的备用 provider 和结果下载）"""
+        for name in names or configured_clients():
+            self.get(name)
+
+    async def aclose(self) -> None:
+        """关闭所有客户端并释放连接"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"关闭 HTTP 客户端失败: {e}")
+
+
+# 全局客户端管理器
+http_clients = HTTPClientManager()
@@ -5,12 +5,16 @@ import httpx
 import asyncio
 import random
 import logging
-import base64
 import json
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, Optional, Literal
 from abc import ABC, abstractmethod
 from pathlib import Path
 
+from app.services.http_client import http_clients, request_timeout
+from app.services.payload_cache import ENCODING_BASE64, ENCODING_RAW, load_source_payload
+
 logger = logging.getLogger(__name__)
 
 # Google Auth imports (可选依赖)
@@ -22,8 +26,88 @@ except ImportError:
     GOOGLE_AUTH_AVAILABLE = False
     logger.warning("google-auth 未安装，Google Vertex AI 认证功能不可用")
 
+# 在 token 过期前多久开始刷新
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
 ImageProvider = Literal["mock", "google_ai", "stability_ai", "replicate", "openrouter"]
 
+# 暂时性错误的 HTTP 状态码（超时、限流、服务端错误），稍后重试或换用其他 provider 可能成功
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回等待秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class ProviderError(Exception):
+    """
+    provider 调用失败
+
+    Attributes:
+        provider: 服务提供商
+        status_code: HTTP 状态码（超时等没有响应的错误为 None）
+        retryable: 是否可以在同一 provider 安全重试（限流、5xx 等 provider 明确拒绝处理的错误，
+            以及请求还没有发出的连接超时）；读写超时不可重试：请求可能已经在 provider 端执行并计费
+            （见 retry_policy）
+        retry_after: provider 要求的等待时间（秒，来自 Retry-After 响应头）
+    """
+
+    def __init__(
+        self,
+        message: str,
+        provider: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, provider: str, response: httpx.Response, message: str) -> "ProviderError":
+        """按 HTTP 响应的状态码和 Retry-After 创建错误"""
+        return cls(
+            message,
+            provider,
+            status_code=response.status_code,
+            retryable=response.status_code in RETRYABLE_STATUS_CODES,
+            retry_after=parse_retry_after(response.headers.get("retry-after")),
+        )
+
+    @classmethod
+    def from_timeout(cls, provider: str, error: httpx.TimeoutException) -> "ProviderError":
+        """按超时发生的阶段创建错误：建立连接或等待连接池时超时，请求还没有发出，可以重试"""
+        return cls(
+            "图像生成超时，请稍后重试",
+            provider,
+            retryable=isinstance(error, (httpx.ConnectTimeout, httpx.PoolTimeout)),
+        )
+
+
+def guess_image_mime_type(path: str) -> str:
+    """根据扩展名推断图片 MIME 类型（调用方未提供 source_mime_type 时使用）"""
+    lower = path.lower()
+    if lower.endswith(".png"):
+        return "image/png"
+    if lower.endswith(".webp"):
+        return "image/webp"
+    return "image/jpeg"
+
 
 class ImageGenerationClient(ABC):
     """图像生成客户端基类"""
@@ -40,18 +124,34 @@ class ImageGenerationClient(ABC):
 
         Args:
             prompt: 文本提示词
-            source_image_path: 源图片本地路径
+            source_image_path: 源图片本地路径（通常是规范化后的派生图）
             **kwargs: 其他参数
+                source_mime_type: 源图片的真实 MIME 类型
+                source_cache_key: 源图片载荷缓存键（见 payload_cache）
 
         Returns:
             {
-                "image_url": str,  # 生成图片的 URL 或 base64
-                "provider": str,   # 使用的服务提供商
-                "metadata": dict   # 额外的元数据
+                "image_url": str,     # 生成图片的 URL（也可以是 data URI）
+                "image_base64": str,  # 或：原始 base64 数据（不带 data URI 前缀）
+                "mime_type": str,     # image_base64 的 MIME 类型
+                "provider": str,      # 使用的服务提供商
+                "metadata": dict      # 额外的元数据
             }
 
+            image_url 与 image_base64 二选一。base64 结果直接返回 provider 响应中的
+            字符串，不要再拼接成 data URI，由调用方分块解码写入文件。
+
         Raises:
-            Exception: API 调用失败
+            ProviderError: provider 返回错误状态码或超时
+            Exception: 其他 API 调用失败
+        """
+        pass
+
+    def close(self) -> None:  # noqa: B027  可选钩子，没有后台任务的客户端不需要实现
+        """
+        停止客户端的后台任务（客户端被替换或进程退出时由注册表调用）
+
+        HTTP 连接池由 http_clients 统一管理，这里不关闭。
         """
         pass
 
@@ -110,7 +210,7 @@ class GoogleAIClient(ImageGenerationClient):
         base_url_template: str = "https://{location}-aiplatform.googleapis.com/v1",
         model: str = "publishers/google/models/imagen-4.0-generate-001",
         service_account_path: Optional[str] = None,
-        timeout: int = 90
+        timeout: float = 90
     ):
         self.api_key = api_key
         self.project_id = project_id
@@ -119,6 +219,10 @@ class GoogleAIClient(ImageGenerationClient):
         self.timeout = timeout
         self.service_account_path = service_account_path
         self.credentials = None
+        self._auth_request = None
+        self._refresh_task: Optional[asyncio.Future] = None
+        self._refresher_task: Optional[asyncio.Task] = None
+        self._closed = False
 
         # Vertex AI endpoint - 根据 location 动态生成
         self.base_url = base_url_template.format(location=location)
@@ -150,21 +254,101 @@ class GoogleAIClient(ImageGenerationClient):
                     logger.warning(f"✗ 未找到 ADC 凭证: {e}")
                     logger.info("提示: 运行 'gcloud auth application-default login' 设置凭证")
 
-    def _get_access_token(self) -> Optional[str]:
-        """获取 OAuth2 Access Token"""
+    def _token_expires_soon(self) -> bool:
+        """token 是否缺失或即将在 TOKEN_REFRESH_MARGIN 内过期"""
+        if not self.credentials.token:
+            return True
+        expiry = self.credentials.expiry  # google-auth 使用无时区的 UTC 时间
+        if expiry is None:
+            return not self.credentials.valid
+        return datetime.utcnow() + TOKEN_REFRESH_MARGIN >= expiry
+
+    def _refresh_credentials_sync(self) -> None:
+        """同步刷新凭证（阻塞 HTTP 调用，只能在线程池中执行）"""
+        if self._auth_request is None:
+            from google.auth.transport.requests import Request
+            self._auth_request = Request()
+        self.credentials.refresh(self._auth_request)
+
+    def _start_refresh(self) -> asyncio.Future:
+        """
+        在线程池中启动 token 刷新，已有进行中的刷新时直接复用
+
+        刷新任务保存在 _refresh_task 中，失败由 _on_refresh_done 记录，
+        没有调用方等待的后台刷新也不会丢失异常。
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(
+                asyncio.to_thread(self._refresh_credentials_sync)
+            )
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Future) -> None:
+        """记录刷新失败"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"刷新 access token 失败: {task.exception()}")
+
+    async def _refresh_token(self) -> None:
+        """
+        等待 token 刷新完成
+
+        并发调用共享同一个进行中的刷新；调用方被取消时刷新继续完成。
+        """
+        await asyncio.shield(self._start_refresh())
+
+    async def _token_refresh_loop(self) -> None:
+        """后台任务：在 token 过期前主动刷新"""
+        while True:
+            expiry = self.credentials.expiry
+            if expiry is None:
+                return
+
+            delay = (expiry - TOKEN_REFRESH_MARGIN - datetime.utcnow()).total_seconds()
+            await asyncio.sleep(max(delay, 0))
+
+            try:
+                await self._refresh_token()
+                logger.debug(f"Access token 已在后台刷新，过期时间: {self.credentials.expiry}")
+            except Exception:
+                # 失败已由 _on_refresh_done 记录，稍后重试
+                await asyncio.sleep(30)
+
+    async def _get_access_token(self) -> Optional[str]:
+        """
+        获取 OAuth2 Access Token
+
+        - token 有效：直接返回
+        - token 即将过期但仍可用：返回当前 token，同时在后台刷新
+        - token 缺失或已过期：等待（共享的）线程池刷新完成
+        """
         if not self.credentials:
             return None
 
         try:
-            from google.auth.transport.requests import Request
-            # 刷新 token（如果已过期）
-            if not self.credentials.valid:
-                self.credentials.refresh(Request())
+            if self._token_expires_soon():
+                if self.credentials.token and self.credentials.valid:
+                    # 不等待，先返回当前 token
+                    self._start_refresh()
+                else:
+                    await self._refresh_token()
+
+            if not self._closed and (self._refresher_task is None or self._refresher_task.done()):
+                self._refresher_task = asyncio.create_task(self._token_refresh_loop())
+
             return self.credentials.token
         except Exception as e:
             logger.error(f"获取 access token 失败: {e}")
             return None
 
+    def close(self) -> None:
+        """停止后台刷新 token；进行中的请求仍可使用当前 token 完成"""
+        self._closed = True
+        if self._refresher_task is not None and not self._refresher_task.done():
+            self._refresher_task.cancel()
+        self._refresher_task = None
+
     async def generate_image(
         self,
         prompt: str,
@@ -182,7 +366,7 @@ class GoogleAIClient(ImageGenerationClient):
         headers = {"Content-Type": "application/json"}
 
         # 优先使用 Service Account Token，否则使用 API Key
-        access_token = self._get_access_token()
+        access_token = await self._get_access_token()
         if access_token:
             headers["Authorization"] = f"Bearer {access_token}"
             logger.debug("使用 Service Account Bearer Token 认证")
@@ -192,9 +376,10 @@ class GoogleAIClient(ImageGenerationClient):
             logger.warning("使用 API Key 认证（Vertex AI 不支持，可能失败）")
 
         # 读取并编码源图片
-        with open(source_image_path, "rb") as f:
-            image_bytes = f.read()
-            image_base64 = base64.b64encode(image_bytes).decode()
+        image_base64 = await load_source_payload(
+            source_image_path, ENCODING_BASE64, kwargs.get("source_cache_key")
+        )
+        source_mime_type = kwargs.get("source_mime_type") or guess_image_mime_type(source_image_path)
 
         # 判断模型类型并构建相应的请求格式
         is_gemini = "gemini" in self.model.lower()
@@ -207,7 +392,7 @@ class GoogleAIClient(ImageGenerationClient):
                     "parts": [
                         {
                             "inline_data": {
-                                "mime_type": "image/jpeg",
+                                "mime_type": source_mime_type,
                                 "data": image_base64
                             }
                         },
@@ -252,75 +437,79 @@ class GoogleAIClient(ImageGenerationClient):
             endpoint = f"{self.base_url}/projects/{self.project_id}/locations/{self.location}/{self.model}:predict"
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                model_name = "Gemini" if is_gemini else "Imagen"
-                logger.info(f"Calling Google {model_name} with prompt: {prompt[:100]}...")
-                logger.debug(f"Vertex AI endpoint: {endpoint}")
-
-                response = await client.post(
-                    endpoint,
-                    json=payload,
-                    headers=headers
-                )
-
-                response.raise_for_status()
-                result = response.json()
-
-                logger.debug(f"Google AI response: {result}")
-
-                # 解析响应 - Gemini 和 Imagen 的响应格式不同
-                if is_gemini:
-                    # Gemini 响应格式: {"candidates": [{"content": {"parts": [{"inlineData": {...}}]}}]}
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            for part in candidate["content"]["parts"]:
-                                # 注意: API 返回的是 inlineData (驼峰命名), 不是 inline_data
-                                if "inlineData" in part:
-                                    image_data = part["inlineData"].get("data")
-                                    if image_data:
-                                        return {
-                                            "image_url": f"data:image/png;base64,{image_data}",
-                                            "provider": "google_ai",
-                                            "metadata": {
-                                                "model": self.model,
-                                                "prompt": prompt
-                                            }
+            client = http_clients.get("google_ai")
+            model_name = "Gemini" if is_gemini else "Imagen"
+            logger.info(f"Calling Google {model_name} with prompt: {prompt[:100]}...")
+            logger.debug(f"Vertex AI endpoint: {endpoint}")
+
+            response = await client.post(
+                endpoint,
+                json=payload,
+                headers=headers,
+                timeout=request_timeout(self.timeout)
+            )
+
+            response.raise_for_status()
+            result = response.json()
+
+            # 不记录完整响应：其中包含数 MB 的 base64 图片数据
+            logger.debug(f"Google AI response keys: {list(result.keys())}")
+
+            # 解析响应 - Gemini 和 Imagen 的响应格式不同
+            if is_gemini:
+                # Gemini 响应格式: {"candidates": [{"content": {"parts": [{"inlineData": {...}}]}}]}
+                if "candidates" in result and len(result["candidates"]) > 0:
+                    candidate = result["candidates"][0]
+                    if "content" in candidate and "parts" in candidate["content"]:
+                        for part in candidate["content"]["parts"]:
+                            # 注意: API 返回的是 inlineData (驼峰命名), 不是 inline_data
+                            if "inlineData" in part:
+                                image_data = part["inlineData"].get("data")
+                                if image_data:
+                                    return {
+                                        "image_base64": image_data,
+                                        "mime_type": part["inlineData"].get("mimeType", "image/png"),
+                                        "provider": "google_ai",
+                                        "metadata": {
+                                            "model": self.model,
+                                            "prompt": prompt
                                         }
-                    raise Exception("No image data in Gemini response")
-                else:
-                    # Imagen 响应格式: {"predictions": [{"bytesBase64Encoded": "..."}]}
-                    if "predictions" in result and len(result["predictions"]) > 0:
-                        prediction = result["predictions"][0]
-                        image_data = None
-                        if "bytesBase64Encoded" in prediction:
-                            image_data = prediction["bytesBase64Encoded"]
-                        elif "image" in prediction:
-                            if isinstance(prediction["image"], dict) and "bytesBase64Encoded" in prediction["image"]:
-                                image_data = prediction["image"]["bytesBase64Encoded"]
-                            elif isinstance(prediction["image"], str):
-                                image_data = prediction["image"]
-
-                        if not image_data:
-                            logger.error(f"Unexpected response structure: {prediction}")
-                            raise Exception("No image data in response")
+                                    }
+                raise Exception("No image data in Gemini response")
+            else:
+                # Imagen 响应格式: {"predictions": [{"bytesBase64Encoded": "..."}]}
+                if "predictions" in result and len(result["predictions"]) > 0:
+                    prediction = result["predictions"][0]
+                    image_data = None
+                    if "bytesBase64Encoded" in prediction:
+                        image_data = prediction["bytesBase64Encoded"]
+                    elif "image" in prediction:
+                        if isinstance(prediction["image"], dict) and "bytesBase64Encoded" in prediction["image"]:
+                            image_data = prediction["image"]["bytesBase64Encoded"]
+                        elif isinstance(prediction["image"], str):
+                            image_data = prediction["image"]
+
+                    if not image_data:
+                        logger.error(f"Unexpected response structure: {prediction}")
+                        raise Exception("No image data in response")
 
-                        return {
-                            "image_url": f"data:image/png;base64,{image_data}",
-                            "provider": "google_ai",
-                            "metadata": {
-                                "model": self.model,
-                                "prompt": prompt
-                            }
+                    return {
+                        "image_base64": image_data,
+                        "mime_type": prediction.get("mimeType", "image/png"),
+                        "provider": "google_ai",
+                        "metadata": {
+                            "model": self.model,
+                            "prompt": prompt
                         }
-                    raise Exception("No predictions returned from Imagen")
+                    }
+                raise Exception("No predictions returned from Imagen")
 
-        except httpx.TimeoutException:
-            logger.error("Google AI API timeout")
-            raise Exception("图像生成超时，请稍后重试")
+        except httpx.TimeoutException as e:
+            logger.error(f"Google AI API timeout: {e!r}")
+            raise ProviderError.from_timeout("google_ai", e) from e
         except httpx.HTTPStatusError as e:
             logger.error(f"Google AI API error: {e.response.status_code}")
-            raise Exception(f"Google AI API 错误: {e.response.text}")
+            raise ProviderError.from_response("google_ai", e.response, f"Google AI API 错误: {e.response.text}")
 
 
 class StabilityAIClient(ImageGenerationClient):
@@ -337,7 +526,7 @@ class StabilityAIClient(ImageGenerationClient):
         api_key: str,
         base_url: str = "https://api.stability.ai",
         model: str = "stable-diffusion-xl-1024-v1-0",
-        timeout: int = 90
+        timeout: float = 90
     ):
         self.api_key = api_key
         self.base_url = base_url
@@ -359,12 +548,15 @@ class StabilityAIClient(ImageGenerationClient):
         }
 
         # 准备文件上传
-        with open(source_image_path, "rb") as f:
-            image_bytes = f.read()
+        image_bytes = await load_source_payload(
+            source_image_path, ENCODING_RAW, kwargs.get("source_cache_key")
+        )
+        source_mime_type = kwargs.get("source_mime_type") or guess_image_mime_type(source_image_path)
+        source_filename = "image." + source_mime_type.split("/")[-1]
 
         # 构建 multipart form data
         files = {
-            "init_image": ("image.png", image_bytes, "image/png"),
+            "init_image": (source_filename, image_bytes, source_mime_type),
         }
 
         data = {
@@ -377,50 +569,53 @@ class StabilityAIClient(ImageGenerationClient):
         }
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Calling Stability AI with prompt: {prompt[:100]}...")
-
-                endpoint = f"{self.base_url}/v1/generation/{self.model}/image-to-image"
-                logger.debug(f"Stability AI endpoint: {endpoint}")
-
-                response = await client.post(
-                    endpoint,
-                    headers=headers,
-                    files=files,
-                    data=data
-                )
-
-                response.raise_for_status()
-                result = response.json()
-
-                # 解析响应
-                if "artifacts" in result and len(result["artifacts"]) > 0:
-                    artifact = result["artifacts"][0]
-                    image_base64 = artifact.get("base64")
-
-                    return {
-                        "image_url": f"data:image/png;base64,{image_base64}",
-                        "provider": "stability_ai",
-                        "metadata": {
-                            "model": "sdxl-1.0",
-                            "seed": artifact.get("seed"),
-                            "finish_reason": artifact.get("finishReason")
-                        }
+            client = http_clients.get("stability_ai")
+            logger.info(f"Calling Stability AI with prompt: {prompt[:100]}...")
+
+            endpoint = f"{self.base_url}/v1/generation/{self.model}/image-to-image"
+            logger.debug(f"Stability AI endpoint: {endpoint}")
+
+            response = await client.post(
+                endpoint,
+                headers=headers,
+                files=files,
+                data=data,
+                timeout=request_timeout(self.timeout)
+            )
+
+            response.raise_for_status()
+            result = response.json()
+
+            # 解析响应
+            if "artifacts" in result and len(result["artifacts"]) > 0:
+                artifact = result["artifacts"][0]
+                image_base64 = artifact.get("base64")
+
+                return {
+                    "image_base64": image_base64,
+                    "mime_type": "image/png",
+                    "provider": "stability_ai",
+                    "metadata": {
+                        "model": "sdxl-1.0",
+                        "seed": artifact.get("seed"),
+                        "finish_reason": artifact.get("finishReason")
                     }
-                else:
-                    raise Exception("No artifacts returned from Stability AI")
+                }
+            else:
+                raise Exception("No artifacts returned from Stability AI")
 
-        except httpx.TimeoutException:
-            logger.error("Stability AI timeout")
-            raise Exception("图像生成超时，请稍后重试")
+        except httpx.TimeoutException as e:
+            logger.error(f"Stability AI timeout: {e!r}")
+            raise ProviderError.from_timeout("stability_ai", e) from e
         except httpx.HTTPStatusError as e:
             logger.error(f"Stability AI error: {e.response.status_code} - {e.response.text}")
             if e.response.status_code == 402:
-                raise Exception("Stability AI: 积分不足，请充值")
+                message = "Stability AI: 积分不足，请充值"
             elif e.response.status_code == 429:
-                raise Exception("Stability AI: 请求过于频繁，请稍后重试")
+                message = "Stability AI: 请求过于频繁，请稍后重试"
             else:
-                raise Exception(f"Stability AI 错误: {e.response.text}")
+                message = f"Stability AI 错误: {e.response.text}"
+            raise ProviderError.from_response("stability_ai", e.response, message)
 
 
 class ReplicateClient(ImageGenerationClient):
@@ -437,7 +632,7 @@ class ReplicateClient(ImageGenerationClient):
         api_key: str,
         base_url: str = "https://api.replicate.com/v1",
         model: str = "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-        timeout: int = 120
+        timeout: float = 120
     ):
         self.api_key = api_key
         self.base_url = base_url
@@ -460,10 +655,11 @@ class ReplicateClient(ImageGenerationClient):
         }
 
         # 读取并编码图片
-        with open(source_image_path, "rb") as f:
-            image_bytes = f.read()
-            image_base64 = base64.b64encode(image_bytes).decode()
-            image_data_uri = f"data:image/png;base64,{image_base64}"
+        image_base64 = await load_source_payload(
+            source_image_path, ENCODING_BASE64, kwargs.get("source_cache_key")
+        )
+        source_mime_type = kwargs.get("source_mime_type") or guess_image_mime_type(source_image_path)
+        image_data_uri = f"data:{source_mime_type};base64,{image_base64}"
 
         # 使用配置的模型
         payload = {
@@ -479,59 +675,80 @@ class ReplicateClient(ImageGenerationClient):
         }
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Calling Replicate with prompt: {prompt[:100]}...")
-
-                # 创建预测
-                response = await client.post(
-                    f"{self.base_url}/predictions",
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                prediction = response.json()
-
-                prediction_id = prediction["id"]
-                logger.info(f"Replicate prediction created: {prediction_id}")
-
-                # 轮询等待结果
-                max_attempts = 60  # 最多等待 60 次
-                for attempt in range(max_attempts):
-                    await asyncio.sleep(2)  # 每 2 秒检查一次
+            client = http_clients.get("replicate")
+            logger.info(f"Calling Replicate with prompt: {prompt[:100]}...")
+
+            # 创建预测
+            response = await client.post(
+                f"{self.base_url}/predictions",
+                json=payload,
+                headers=headers,
+                timeout=request_timeout(self.timeout)
+            )
+            response.raise_for_status()
+            prediction = response.json()
+
+            prediction_id = prediction["id"]
+            logger.info(f"Replicate prediction created: {prediction_id}")
+
+            # 轮询等待结果。预测已经创建并计费：查询失败时继续轮询，
+            # 错误不交给路由重试（重试会重新创建一个计费的预测）
+            max_attempts = 60  # 最多等待 60 次
+            for _ in range(max_attempts):
+                await asyncio.sleep(2)  # 每 2 秒检查一次
 
+                try:
                     status_response = await client.get(
                         f"{self.base_url}/predictions/{prediction_id}",
-                        headers=headers
+                        headers=headers,
+                        timeout=request_timeout(self.timeout)
                     )
                     status_response.raise_for_status()
-                    status = status_response.json()
-
-                    if status["status"] == "succeeded":
-                        output = status.get("output")
-                        if output and len(output) > 0:
-                            return {
-                                "image_url": output[0],  # Replicate 返回图片 URL
-                                "provider": "replicate",
-                                "metadata": {
-                                    "prediction_id": prediction_id,
-                                    "model": self.model
-                                }
+                except httpx.TransportError as e:
+                    logger.warning(f"Replicate prediction {prediction_id} 查询失败，继续轮询: {e!r}")
+                    continue
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in RETRYABLE_STATUS_CODES:
+                        raise ProviderError(
+                            f"Replicate 查询预测失败: {e.response.text}",
+                            "replicate",
+                            status_code=e.response.status_code
+                        ) from e
+                    logger.warning(
+                        f"Replicate prediction {prediction_id} 查询失败（{e.response.status_code}），继续轮询"
+                    )
+                    continue
+                status = status_response.json()
+
+                if status["status"] == "succeeded":
+                    output = status.get("output")
+                    if output and len(output) > 0:
+                        return {
+                            "image_url": output[0],  # Replicate 返回图片 URL
+                            "provider": "replicate",
+                            "metadata": {
+                                "prediction_id": prediction_id,
+                                "model": self.model
                             }
-                        else:
-                            raise Exception("Replicate 未返回输出")
+                        }
+                    else:
+                        raise Exception("Replicate 未返回输出")
 
-                    elif status["status"] == "failed":
-                        error = status.get("error", "Unknown error")
-                        raise Exception(f"Replicate 生成失败: {error}")
+                elif status["status"] == "failed":
+                    error = status.get("error", "Unknown error")
+                    raise Exception(f"Replicate 生成失败: {error}")
 
-                raise Exception("Replicate 生成超时")
+            raise Exception("Replicate 生成超时")
 
-        except httpx.TimeoutException:
-            logger.error("Replicate timeout")
-            raise Exception("图像生成超时，请稍后重试")
+        except httpx.TimeoutException as e:
+            logger.error(f"Replicate timeout: {e!r}")
+            raise ProviderError.from_timeout("replicate", e) from e
         except httpx.HTTPStatusError as e:
+            # 只有创建预测的请求会走到这里（预测未创建，可以按状态码重试）
             logger.error(f"Replicate error: {e.response.status_code}")
-            raise Exception(f"Replicate 错误: {e.response.text}")
+            raise ProviderError.from_response(
+                "replicate", e.response, f"Replicate 错误: {e.response.text}"
+            ) from e
 
 
 class OpenRouterClient(ImageGenerationClient):
@@ -548,7 +765,7 @@ class OpenRouterClient(ImageGenerationClient):
         api_key: str,
         base_url: str = "https://openrouter.ai/api/v1",
         model: str = "google/gemini-2.5-flash",
-        timeout: int = 90
+        timeout: float = 90
     ):
         self.api_key = api_key
         self.base_url = base_url
@@ -574,16 +791,12 @@ class OpenRouterClient(ImageGenerationClient):
         }
 
         # 读取并编码源图片
-        with open(source_image_path, "rb") as f:
-            image_bytes = f.read()
-            image_base64 = base64.b64encode(image_bytes).decode()
+        image_base64 = await load_source_payload(
+            source_image_path, ENCODING_BASE64, kwargs.get("source_cache_key")
+        )
 
         # 确定图片 MIME 类型
-        mime_type = "image/jpeg"
-        if source_image_path.lower().endswith(".png"):
-            mime_type = "image/png"
-        elif source_image_path.lower().endswith(".webp"):
-            mime_type = "image/webp"
+        mime_type = kwargs.get("source_mime_type") or guess_image_mime_type(source_image_path)
 
         # 构建 OpenAI 兼容的请求格式
         # 对于 Gemini 图像生成，需要明确请求生成图像
@@ -611,109 +824,113 @@ class OpenRouterClient(ImageGenerationClient):
         }
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Calling OpenRouter ({self.model}) with prompt: {prompt[:100]}...")
-
-                endpoint = f"{self.base_url}/chat/completions"
-                logger.debug(f"OpenRouter endpoint: {endpoint}")
-
-                response = await client.post(
-                    endpoint,
-                    json=payload,
-                    headers=headers
-                )
-
-                response.raise_for_status()
-                result = response.json()
-
-                logger.debug(f"OpenRouter response: {result}")
-
-                # 解析响应
-                if "choices" in result and len(result["choices"]) > 0:
-                    choice = result["choices"][0]
-                    message = choice.get("message", {})
-
-                    # 检查 images 数组（OpenRouter Gemini 特有格式）
-                    images = message.get("images", [])
-                    if images and len(images) > 0:
-                        for img in images:
-                            if isinstance(img, dict) and img.get("type") == "image_url":
-                                url = img.get("image_url", {}).get("url", "")
-                                if url:
-                                    return {
-                                        "image_url": url,
-                                        "provider": "openrouter",
-                                        "metadata": {
-                                            "model": self.model,
-                                            "prompt": prompt
-                                        }
+            client = http_clients.get("openrouter")
+            logger.info(f"Calling OpenRouter ({self.model}) with prompt: {prompt[:100]}...")
+
+            endpoint = f"{self.base_url}/chat/completions"
+            logger.debug(f"OpenRouter endpoint: {endpoint}")
+
+            response = await client.post(
+                endpoint,
+                json=payload,
+                headers=headers,
+                timeout=request_timeout(self.timeout)
+            )
+
+            response.raise_for_status()
+            result = response.json()
+
+            # 不记录完整响应：其中可能包含数 MB 的 base64 图片数据
+            logger.debug(f"OpenRouter response keys: {list(result.keys())}")
+
+            # 解析响应
+            if "choices" in result and len(result["choices"]) > 0:
+                choice = result["choices"][0]
+                message = choice.get("message", {})
+
+                # 检查 images 数组（OpenRouter Gemini 特有格式）
+                images = message.get("images", [])
+                if images and len(images) > 0:
+                    for img in images:
+                        if isinstance(img, dict) and img.get("type") == "image_url":
+                            url = img.get("image_url", {}).get("url", "")
+                            if url:
+                                return {
+                                    "image_url": url,
+                                    "provider": "openrouter",
+                                    "metadata": {
+                                        "model": self.model,
+                                        "prompt": prompt
                                     }
+                                }
 
-                    content = message.get("content")
-
-                    # content 可能是字符串或数组（多模态响应）
-                    if isinstance(content, list):
-                        # 多模态响应：遍历查找图像
-                        for part in content:
-                            if isinstance(part, dict):
-                                # 检查 inline_data 格式
-                                if "inline_data" in part:
-                                    inline_data = part["inline_data"]
-                                    mime = inline_data.get("mime_type", "image/png")
-                                    data = inline_data.get("data", "")
+                content = message.get("content")
+
+                # content 可能是字符串或数组（多模态响应）
+                if isinstance(content, list):
+                    # 多模态响应：遍历查找图像
+                    for part in content:
+                        if isinstance(part, dict):
+                            # 检查 inline_data 格式
+                            if "inline_data" in part:
+                                inline_data = part["inline_data"]
+                                mime = inline_data.get("mime_type", "image/png")
+                                data = inline_data.get("data", "")
+                                return {
+                                    "image_base64": data,
+                                    "mime_type": mime,
+                                    "provider": "openrouter",
+                                    "metadata": {
+                                        "model": self.model,
+                                        "prompt": prompt
+                                    }
+                                }
+                            # 检查 image_url 格式
+                            if part.get("type") == "image_url":
+                                url = part.get("image_url", {}).get("url", "")
+                                if url:
                                     return {
-                                        "image_url": f"data:{mime};base64,{data}",
+                                        "image_url": url,
                                         "provider": "openrouter",
                                         "metadata": {
                                             "model": self.model,
                                             "prompt": prompt
                                         }
                                     }
-                                # 检查 image_url 格式
-                                if part.get("type") == "image_url":
-                                    url = part.get("image_url", {}).get("url", "")
-                                    if url:
-                                        return {
-                                            "image_url": url,
-                                            "provider": "openrouter",
-                                            "metadata": {
-                                                "model": self.model,
-                                                "prompt": prompt
-                                            }
-                                        }
-                        # 没有找到图像，记录内容
-                        logger.warning(f"OpenRouter multimodal response without image: {content}")
-                        raise Exception("OpenRouter 未返回图像数据")
-                    elif isinstance(content, str):
-                        # 字符串响应：检查是否是 base64 图像
-                        if content.startswith("data:image"):
-                            return {
-                                "image_url": content,
-                                "provider": "openrouter",
-                                "metadata": {
-                                    "model": self.model,
-                                    "prompt": prompt
-                                }
+                    # 没有找到图像，记录内容
+                    logger.warning(f"OpenRouter multimodal response without image: {content}")
+                    raise Exception("OpenRouter 未返回图像数据")
+                elif isinstance(content, str):
+                    # 字符串响应：检查是否是 base64 图像
+                    if content.startswith("data:image"):
+                        return {
+                            "image_url": content,
+                            "provider": "openrouter",
+                            "metadata": {
+                                "model": self.model,
+                                "prompt": prompt
                             }
-                        else:
-                            logger.warning(f"OpenRouter returned text instead of image: {content[:500]}")
-                            raise Exception("OpenRouter 未返回图像数据，请检查模型是否支持图像生成")
+                        }
+                    else:
+                        logger.warning(f"OpenRouter returned text instead of image: {content[:500]}")
+                        raise Exception("OpenRouter 未返回图像数据，请检查模型是否支持图像生成")
 
-                raise Exception("No choices returned from OpenRouter")
+            raise Exception("No choices returned from OpenRouter")
 
-        except httpx.TimeoutException:
-            logger.error("OpenRouter timeout")
-            raise Exception("图像生成超时，请稍后重试")
+        except httpx.TimeoutException as e:
+            logger.error(f"OpenRouter timeout: {e!r}")
+            raise ProviderError.from_timeout("openrouter", e) from e
         except httpx.HTTPStatusError as e:
             logger.error(f"OpenRouter error: {e.response.status_code} - {e.response.text}")
             if e.response.status_code == 401:
-                raise Exception("OpenRouter: API Key 无效")
+                message = "OpenRouter: API Key 无效"
             elif e.response.status_code == 402:
-                raise Exception("OpenRouter: 积分不足，请充值")
+                message = "OpenRouter: 积分不足，请充值"
             elif e.response.status_code == 429:
-                raise Exception("OpenRouter: 请求过于频繁，请稍后重试")
+                message = "OpenRouter: 请求过于频繁，请稍后重试"
             else:
-                raise Exception(f"OpenRouter 错误: {e.response.text}")
+                message = f"OpenRouter 错误: {e.response.text}"
+            raise ProviderError.from_response("openrouter", e.response, message)
 
 
 def create_image_client(
@@ -0,0 +1,336 @@
+"""
+源图片规范化和生成结果的派生版本
+
+每张上传图片按 provider 的最佳输入尺寸生成一份派生图：
+- 按 EXIF 方向旋转
+- 按 provider 的输入限制调整尺寸（最长边、边长倍数，或裁切到 SDXL 允许的尺寸）
+- 去除 EXIF 等元数据，统一重新编码为 JPEG（MIME 类型准确）
+
+解码和编码是 CPU 密集操作，在独立的进程池中执行；派生图写入
+uploads/derived（按图片内容哈希命名），同一内容和尺寸只生成一次，
+之后所有风格的任务以及重复上传的相同图片直接复用。派生图只是本地缓存，
+可以随时重新生成，不写入存储后端。
+
+生成结果保存后同样在进程池中生成多种尺寸的 WebP（Pillow 支持时还有 AVIF）版本，
+历史记录、画廊等列表页只需下载缩略图。
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from app.core.config import settings
+from app.core.storage import GENERATED, storage_key, storage_url
+from app.services.storage_backend import get_storage
+
+logger = logging.getLogger(__name__)
+
+# SDXL 允许的输入尺寸（宽, 高），img2img 的 init_image 必须是其中之一
+SDXL_DIMENSIONS: List[Tuple[int, int]] = [
+    (1024, 1024),
+    (1152, 896),
+    (1216, 832),
+    (1344, 768),
+    (1536, 640),
+    (640, 1536),
+    (768, 1344),
+    (832, 1216),
+    (896, 1152),
+]
+
+# 源图片规格（名称用于派生图文件名，同一规格的 provider 共享派生图）：
+# - max_side: 最长边（像素），等比缩小
+# - multiple: 宽高裁切为该值的倍数
+# - sizes: 允许的尺寸，裁切到宽高比最接近的一个
+SOURCE_SPECS: Dict[str, Dict] = {
+    # Gemini 按 768x768 切块计费，1536 为 2x2 块
+    "gemini": {"max_side": 1536},
+    "sdxl": {"sizes": SDXL_DIMENSIONS},
+    "sdxl_free": {"max_side": 1024, "multiple": 8},
+    "small": {"max_side": 512},
+    "default": {"max_side": 1024},
+}
+
+# 各 provider 使用的源图片规格
+PROVIDER_SOURCE_SPECS: Dict[str, str] = {
+    "google_ai": "gemini",
+    "openrouter": "gemini",
+    "stability_ai": "sdxl",
+    "replicate": "sdxl_free",
+    "mock": "small",
+}
+DEFAULT_SOURCE_SPEC = "default"
+
+# 派生图 JPEG 质量
+NORMALIZED_JPEG_QUALITY = 90
+
+# 生成结果的派生尺寸（最长边，None 表示原始尺寸）
+RESULT_RENDITION_SIDES: Dict[str, Optional[int]] = {
+    "thumb": 256,
+    "medium": 768,
+    "full": None,
+}
+
+# 派生格式及编码质量（AVIF 需要 Pillow 的 AVIF 支持，不可用时跳过）
+RESULT_RENDITION_FORMATS: Dict[str, Dict] = {
+    "avif": {"format": "AVIF", "mime_type": "image/avif", "quality": 60},
+    "webp": {"format": "WEBP", "mime_type": "image/webp", "quality": 80, "method": 4},
+}
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取（懒加载）图片处理进程池"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """关闭图片处理进程池"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def closest_dimensions(size: Tuple[int, int], allowed: List[Tuple[int, int]]) -> Tuple[int, int]:
+    """宽高比与 size 最接近的允许尺寸"""
+    ratio = size[0] / size[1]
+    return min(allowed, key=lambda dims: abs(math.log(dims[0] / dims[1] / ratio)))
+
+
+def _fit_spec(image: Image.Image, spec: Dict) -> Image.Image:
+    """按源图片规格缩放 / 裁切"""
+    if "sizes" in spec:
+        # 缩放到覆盖目标尺寸后居中裁切
+        return ImageOps.fit(image, closest_dimensions(image.size, spec["sizes"]), Image.LANCZOS)
+
+    max_side = spec["max_side"]
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    multiple = spec.get("multiple")
+    if multiple:
+        width, height = image.size
+        left, top = (width % multiple) // 2, (height % multiple) // 2
+        image = image.crop((left, top, left + width - width % multiple, top + height - height % multiple))
+    return image
+
+
+def normalize_image(source_path: str, target_path: str, spec: Dict) -> Dict:
+    """
+    生成规范化的派生图（同步，在进程池中执行）
+
+    Args:
+        source_path: 原图路径
+        target_path: 派生图保存路径
+        spec: 源图片规格（SOURCE_SPECS 的值）
+
+    Returns:
+        {"path": str, "mime_type": str, "width": int, "height": int, "file_size": int}
+    """
+    if "sizes" in spec:
+        draft_side = max(max(dims) for dims in spec["sizes"])
+    else:
+        draft_side = spec["max_side"]
+
+    with Image.open(source_path) as image:
+        # JPEG 可以在解码阶段直接按比例缩小，减少解码工作量
+        image.draft("RGB", (draft_side, draft_side))
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            # 透明背景合成到白色背景上
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        image = _fit_spec(image, spec)
+
+        # 先写临时文件再原子替换，并发生成同一派生图时不会读到半个文件
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # 不传 exif / icc_profile 参数，元数据不会写入派生图
+                image.save(f, format="JPEG", quality=NORMALIZED_JPEG_QUALITY, optimize=True)
+            os.replace(temp_path, target_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        width, height = image.size
+
+    return {
+        "path": target_path,
+        "mime_type": "image/jpeg",
+        "width": width,
+        "height": height,
+        "file_size": os.path.getsize(target_path),
+    }
+
+
+def available_rendition_formats() -> List[str]:
+    """当前 Pillow 支持的派生格式"""
+    return [name for name in RESULT_RENDITION_FORMATS if features.check(name)]
+
+
+def render_renditions(source_path: str, output_dir: str, stem: str, formats: List[str]) -> List[Dict]:
+    """
+    生成结果图片的多尺寸、多格式版本（同步，在进程池中执行）
+
+    Args:
+        source_path: 生成结果的本地路径
+        output_dir: 输出目录
+        stem: 输出文件名前缀
+        formats: 输出格式（RESULT_RENDITION_FORMATS 的键）
+
+    Returns:
+        [{"size": str, "format": str, "path": str, "mime_type": str, "width": int, "height": int}]
+    """
+    renditions = []
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for size, max_side in RESULT_RENDITION_SIDES.items():
+            if max_side is not None and max(image.size) <= max_side:
+                # 原图已经不大于该尺寸，由 full 版本覆盖
+                continue
+
+            resized = image
+            if max_side is not None:
+                resized = image.copy()
+                resized.thumbnail((max_side, max_side), Image.LANCZOS)
+
+            for name in formats:
+                spec = RESULT_RENDITION_FORMATS[name]
+                options = {key: value for key, value in spec.items() if key not in ("format", "mime_type")}
+                path = os.path.join(output_dir, f"{stem}_{size}.{name}")
+                resized.save(path, format=spec["format"], **options)
+                renditions.append({
+                    "size": size,
+                    "format": name,
+                    "path": path,
+                    "mime_type": spec["mime_type"],
+                    "width": resized.width,
+                    "height": resized.height,
+                })
+
+    return renditions
+
+
+async def create_result_renditions(source_path: str, stem: str) -> Dict[str, Dict[str, str]]:
+    """
+    为生成结果创建派生版本并保存到存储后端
+
+    Args:
+        source_path: 生成结果的本地路径
+        stem: 生成结果的文件名（不含扩展名）
+
+    Returns:
+        {尺寸: {格式: 存储路径}}，如 {"thumb": {"webp": "/uploads/generated/..."}}
+    """
+    loop = asyncio.get_running_loop()
+    renditions = await loop.run_in_executor(
+        get_process_pool(),
+        render_renditions,
+        source_path,
+        settings.TEMP_DIR,
+        stem,
+        available_rendition_formats(),
+    )
+
+    result: Dict[str, Dict[str, str]] = {}
+    storage = get_storage()
+    try:
+        for rendition in renditions:
+            storage_path = storage_url(GENERATED, os.path.basename(rendition["path"]))
+            await asyncio.to_thread(
+                storage.put_file, rendition["path"], storage_key(storage_path), rendition["mime_type"]
+            )
+            result.setdefault(rendition["size"], {})[rendition["format"]] = storage_path
+    finally:
+        for rendition in renditions:
+            if os.path.exists(rendition["path"]):
+                os.remove(rendition["path"])
+
+    return result
+
+
+def source_spec(provider: str) -> str:
+    """provider 的源图片规格名称"""
+    return PROVIDER_SOURCE_SPECS.get(provider, DEFAULT_SOURCE_SPEC)
+
+
+def derivative_path(source_key: str, spec_name: str) -> str:
+    """派生图的本地路径"""
+    return os.path.join(settings.UPLOAD_DIR, "derived", f"{source_key}_{spec_name}.jpg")
+
+
+async def ensure_normalized_source(
+    source_key: str,
+    source_path: str,
+    provider: str
+) -> Dict:
+    """
+    获取 provider 对应的规范化派生图，不存在时在进程池中生成
+
+    同一派生图的并发请求共享一次生成。
+
+    Args:
+        source_key: 图片内容哈希（早期上传没有哈希时为上传图片 ID）
+        source_path: 原图本地路径
+        provider: 服务提供商
+
+    Returns:
+        {"path": str, "mime_type": str}
+    """
+    spec_name = source_spec(provider)
+    target_path = derivative_path(source_key, spec_name)
+
+    if os.path.exists(target_path):
+        return {"path": target_path, "mime_type": "image/jpeg"}
+
+    future = _in_flight.get(target_path)
+    if future is None:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_process_pool(), normalize_image, source_path, target_path, SOURCE_SPECS[spec_name]
+        )
+        _in_flight[target_path] = future
+        future.add_done_callback(lambda _: _in_flight.pop(target_path, None))
+
+    result = await asyncio.shield(future)
+    logger.info(
+        f"已生成规范化源图 - {source_key}: {result['width']}x{result['height']}, "
+        f"{result['file_size'] / 1024:.1f}KB"
+    )
+    return {"path": result["path"], "mime_type": result["mime_type"]}
+
+
+async def prepare_upload_derivative(source_key: str, storage_path: str) -> None:
+    """上传完成后为当前 provider 预生成派生图（后台任务，失败不影响上传）"""
+    try:
+        source_path = await asyncio.to_thread(get_storage().fetch, storage_key(storage_path))
+        await ensure_normalized_source(source_key, source_path, settings.IMAGE_PROVIDER)
+    except Exception as e:
+        logger.warning(f"预生成规范化源图失败 - {source_key}: {e}")
@@ -0,0 +1,257 @@
+"""
+生成任务状态推送
+
+进程内的发布 / 订阅：任务流水线在每次状态变化（认领、排队位置前移、PROCESSING、
+COMPLETED / FAILED）时发布通知，SSE 端点收到通知后读取一次任务并推送给客户端，
+取代客户端每隔一两秒的轮询请求。不能保持 SSE 连接的客户端可以使用长轮询
+（GET /generations/{job_id}?wait=秒数，见 wait_for_job_change）。
+
+通知只是「该任务有变化」的信号，不携带数据：推送内容始终以数据库为准，
+多次通知会被合并。是否有变化按数据库中的稳定字段判断（状态、排队位置、错误信息、
+结果和派生版本的存储路径），不比较响应中每次读取都会变化的预签名 URL。
+
+worker 运行在独立进程（GENERATION_WORKERS_IN_API=False）时收不到进程内通知，
+SSE / 长轮询退化为按 GENERATION_EVENTS_POLL_INTERVAL 在服务端读取数据库，
+仍然不需要客户端发起请求。
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import session_scope
+from app.models.image import GenerationJob, GenerationStatus
+from app.schemas.generation import GenerationJobResponse
+
+logger = logging.getLogger(__name__)
+
+# 没有状态变化时发送心跳的间隔（秒），防止代理断开空闲连接
+HEARTBEAT_INTERVAL = 15.0
+
+# 终止状态，推送后关闭连接
+TERMINAL_STATUSES = {GenerationStatus.COMPLETED.value, GenerationStatus.FAILED.value}
+
+_Subscriber = Tuple[asyncio.AbstractEventLoop, asyncio.Queue]
+
+# 判断任务是否有变化的状态键，见 load_job_state
+StateKey = Tuple
+
+
+class JobEventBroker:
+    """
+    进程内的任务状态通知
+
+    publish 可以在任意线程调用；订阅者的队列容量为 1，未处理的通知会被合并。
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: str) -> _Subscriber:
+        """订阅任务的状态变化（在事件循环中调用）"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=1))
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, job_id: str, subscriber: _Subscriber) -> None:
+        """取消订阅"""
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def publish(self, job_id: str) -> None:
+        """通知某个任务发生了变化"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        self._notify(subscribers)
+
+    def publish_all(self) -> None:
+        """通知所有订阅者（排队位置整体前移等影响所有排队任务的变化）"""
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        self._notify(subscribers)
+
+    @staticmethod
+    def _notify(subscribers) -> None:
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                pass
+
+
+def _offer(queue: asyncio.Queue) -> None:
+    if queue.empty():
+        queue.put_nowait(None)
+
+
+# 全局通知实例
+job_event_broker = JobEventBroker()
+
+
+def queue_position(db: Session, job: GenerationJob) -> Optional[int]:
+    """
+    排队中任务的位置（1 表示下一个被处理）
+
+    按认领顺序（created_at, id）统计排在前面的 PENDING 任务数，查询时计算，
+    认领任务时不需要改写其他排队任务。不在排队中时返回 None。
+    """
+    if job.status != GenerationStatus.PENDING:
+        return None
+    ahead = db.query(func.count(GenerationJob.id)).filter(
+        GenerationJob.status == GenerationStatus.PENDING,
+        or_(
+            GenerationJob.created_at < job.created_at,
+            and_(GenerationJob.created_at == job.created_at, GenerationJob.id < job.id),
+        )
+    ).scalar()
+    return (ahead or 0) + 1
+
+
+def job_response(db: Session, job: GenerationJob) -> GenerationJobResponse:
+    """任务的 API 响应（包含实时计算的排队位置）"""
+    response = GenerationJobResponse.model_validate(job)
+    response.queue_position = queue_position(db, job)
+    return response
+
+
+def load_job_state(job_id: str) -> Optional[Tuple[StateKey, Dict]]:
+    """
+    在短事务中读取任务
+
+    Returns:
+        (状态键, 与 GET /generations/{job_id} 相同的 JSON 数据)，任务不存在返回 None。
+        状态键只由数据库中的稳定字段组成，用于判断是否需要推送。
+    """
+    with session_scope() as db:
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if job is None:
+            return None
+        response = job_response(db, job)
+        key = (
+            response.status,
+            response.queue_position,
+            job.error_message,
+            job.result_image_url,
+            json.dumps(job.renditions, sort_keys=True),
+        )
+        return key, response.model_dump(mode="json")
+
+
+def load_job_snapshot(job_id: str) -> Optional[Dict]:
+    """在短事务中读取任务，返回与 GET /generations/{job_id} 相同的 JSON 数据"""
+    state = load_job_state(job_id)
+    return state[1] if state else None
+
+
+def _wait_timeout() -> float:
+    """等待通知的超时：收不到进程内通知时按 GENERATION_EVENTS_POLL_INTERVAL 读取数据库"""
+    if settings.GENERATION_WORKERS_IN_API:
+        return HEARTBEAT_INTERVAL
+    return min(settings.GENERATION_EVENTS_POLL_INTERVAL, HEARTBEAT_INTERVAL)
+
+
+async def wait_for_job_change(job_id: str, timeout: float) -> Optional[Dict]:
+    """
+    长轮询：等待任务状态变化
+
+    先订阅再读取当前状态，读取之后发布的通知不会丢失。等待期间不占用数据库连接，
+    只在收到通知（或轮询间隔到期）时用短事务读取一次任务。
+
+    Args:
+        job_id: 任务 ID
+        timeout: 最长等待时间（秒）
+
+    Returns:
+        任务数据：状态、排队位置或结果变化后立即返回，任务已完成 / 失败时不等待，
+        超时返回当前数据；任务不存在返回 None
+    """
+    subscriber = job_event_broker.subscribe(job_id)
+    try:
+        state = await asyncio.to_thread(load_job_state, job_id)
+        deadline = time.monotonic() + timeout
+        poll_timeout = _wait_timeout()
+
+        while state is not None and state[1]["status"] not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(subscriber[1].get(), timeout=min(poll_timeout, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+            current = await asyncio.to_thread(load_job_state, job_id)
+            if current is None or current[0] != state[0]:
+                return current[1] if current else None
+            state = current
+        return state[1] if state else None
+    finally:
+        job_event_broker.unsubscribe(job_id, subscriber)
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_job_events(job_id: str, initial: Tuple[StateKey, Dict]) -> AsyncIterator[str]:
+    """
+    任务状态的 SSE 事件流
+
+    先推送当前状态，之后状态键每次变化推送一次 status 事件；
+    任务完成或失败后结束。单个连接最长保持 GENERATION_EVENTS_MAX_STREAM_SECONDS，
+    之后由 EventSource 自动重连。
+
+    Args:
+        job_id: 任务 ID
+        initial: 当前任务状态（load_job_state 的返回值）
+    """
+    wait_timeout = _wait_timeout()
+
+    subscriber = job_event_broker.subscribe(job_id)
+    deadline = time.monotonic() + settings.GENERATION_EVENTS_MAX_STREAM_SECONDS
+    last_heartbeat = time.monotonic()
+    state: Optional[Tuple[StateKey, Dict]] = initial
+    last_sent: Optional[StateKey] = None
+
+    try:
+        yield f"retry: {int(settings.GENERATION_EVENTS_POLL_INTERVAL * 1000)}\n\n"
+
+        while True:
+            if state is None:
+                yield format_sse("error", {"detail": "生成任务不存在"})
+                return
+
+            key, snapshot = state
+            if key != last_sent:
+                yield format_sse("status", snapshot)
+                last_sent = key
+                last_heartbeat = time.monotonic()
+
+            if snapshot["status"] in TERMINAL_STATUSES or time.monotonic() > deadline:
+                return
+
+            try:
+                await asyncio.wait_for(subscriber[1].get(), timeout=wait_timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    yield ": keepalive\n\n"
+                    last_heartbeat = time.monotonic()
+
+            state = await asyncio.to_thread(load_job_state, job_id)
+    finally:
+        job_event_broker.unsubscribe(job_id, subscriber)
@@ -0,0 +1,365 @@
+"""
+生成任务队列
+
+以 generation_jobs 表作为持久化队列：
+- API 只负责写入 PENDING 任务并唤醒 worker
+- worker 池以原子方式认领任务（PENDING -> PROCESSING），写入 started_at、lease_expires_at
+  和 claimed_by，attempts 加一（PostgreSQL 使用 FOR UPDATE SKIP LOCKED，其他数据库使用条件更新），
+  因此可以在多台机器上运行任意多个 worker 进程（见 app.worker）
+- 排队位置不存储，查询时按创建时间在 PENDING 任务中的排名计算（见 job_events.queue_position），
+  认领只修改被认领的一行
+- 处理期间 worker 定期续租（推后 lease_expires_at），完成 / 失败只在任务仍归本 worker 时写入
+- 进程重启不会丢失 PENDING 任务；中断的 PROCESSING 任务在租约过期后重新入队，
+  被认领超过 GENERATION_JOB_MAX_ATTEMPTS 次的任务直接标记失败
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.image import GenerationJob, GenerationStatus
+from app.services.generation_service import process_generation_job
+from app.services.job_events import job_event_broker
+
+logger = logging.getLogger(__name__)
+
+
+def _lease_deadline(now: datetime) -> datetime:
+    """从 now 起算一个租约周期后的到期时间"""
+    return now + timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS)
+
+
+def _claim_skip_locked(db: Session, worker_id: Optional[str]) -> Optional[str]:
+    """PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED 认领队首任务"""
+    job = db.query(GenerationJob).filter(
+        GenerationJob.status == GenerationStatus.PENDING
+    ).order_by(
+        GenerationJob.created_at, GenerationJob.id
+    ).with_for_update(skip_locked=True).first()
+
+    if job is None:
+        db.rollback()
+        return None
+
+    now = datetime.utcnow()
+    job.status = GenerationStatus.PROCESSING
+    job.started_at = now
+    job.lease_expires_at = _lease_deadline(now)
+    job.claimed_by = worker_id
+    job.attempts = (job.attempts or 0) + 1
+    job_id = job.id
+    db.commit()
+    return job_id
+
+
+def _claim_conditional(
+    db: Session,
+    worker_id: Optional[str],
+    max_attempts: int
+) -> Optional[str]:
+    """
+    其他数据库（SQLite）: 通过 claimed_by 列做条件更新认领
+
+    先选出最早的候选任务，再用带状态和 claimed_by 条件的 UPDATE 抢占；
+    并发 worker 抢同一任务时只有一个 UPDATE 命中，其余重试下一个候选。
+    """
+    for _ in range(max_attempts):
+        candidate = db.query(GenerationJob.id).filter(
+            GenerationJob.status == GenerationStatus.PENDING
+        ).order_by(GenerationJob.created_at, GenerationJob.id).first()
+
+        if candidate is None:
+            return None
+
+        now = datetime.utcnow()
+        claimed = db.query(GenerationJob).filter(
+            GenerationJob.id == candidate.id,
+            GenerationJob.status == GenerationStatus.PENDING,
+            GenerationJob.claimed_by.is_(None)
+        ).update(
+            {
+                GenerationJob.status: GenerationStatus.PROCESSING,
+                GenerationJob.started_at: now,
+                GenerationJob.lease_expires_at: _lease_deadline(now),
+                GenerationJob.claimed_by: worker_id,
+                GenerationJob.attempts: func.coalesce(GenerationJob.attempts, 0) + 1,
+            },
+            synchronize_session=False
+        )
+
+        if claimed == 1:
+            db.commit()
+            return candidate.id
+
+        # 已被其他 worker 认领
+        db.rollback()
+
+    return None
+
+
+def claim_next_job(
+    db: Session,
+    worker_id: Optional[str] = None,
+    max_attempts: int = 3
+) -> Optional[str]:
+    """
+    原子认领队首的 PENDING 任务
+
+    多个 worker 进程可以同时对同一个数据库调用；每个任务只会被一个 worker 认领。
+
+    Args:
+        db: 数据库会话
+        worker_id: 认领者标识，写入 claimed_by
+        max_attempts: 竞争失败时的最大重试次数（仅条件更新模式）
+
+    Returns:
+        认领到的任务 ID，队列为空时返回 None
+    """
+    if db.bind.dialect.name == "postgresql":
+        return _claim_skip_locked(db, worker_id)
+    return _claim_conditional(db, worker_id, max_attempts)
+
+
+def renew_job_lease(db: Session, job_id: str, worker_id: Optional[str]) -> bool:
+    """
+    续租：把处理中任务的 lease_expires_at 推后一个租约周期
+
+    Returns:
+        任务仍归该 worker 所有（PROCESSING 且 claimed_by 一致）时返回 True
+    """
+    renewed = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status == GenerationStatus.PROCESSING,
+        GenerationJob.claimed_by == worker_id
+    ).update(
+        {GenerationJob.lease_expires_at: _lease_deadline(datetime.utcnow())},
+        synchronize_session=False
+    )
+    db.commit()
+    return renewed == 1
+
+
+def requeue_stale_jobs(db: Session) -> int:
+    """
+    回收租约过期的 PROCESSING 任务
+
+    worker 进程崩溃或重启时正在处理的任务会停留在 PROCESSING；正常处理的任务
+    会被定期续租，lease_expires_at 已过即视为中断（没有租约的旧数据按 started_at
+    超过 GENERATION_JOB_LEASE_SECONDS 判断）。
+    已被认领 GENERATION_JOB_MAX_ATTEMPTS 次的任务标记为失败，其余重新入队。
+
+    Returns:
+        回收的任务数（重新入队 + 标记失败）
+    """
+    now = datetime.utcnow()
+    deadline = now - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS)
+    max_attempts = settings.GENERATION_JOB_MAX_ATTEMPTS
+    stale = db.query(GenerationJob).filter(
+        GenerationJob.status == GenerationStatus.PROCESSING,
+        or_(
+            GenerationJob.lease_expires_at < now,
+            and_(GenerationJob.lease_expires_at.is_(None), GenerationJob.started_at < deadline)
+        )
+    )
+
+    # 反复中断的任务（例如每次都拖垮 worker）不再重试
+    failed = stale.filter(
+        func.coalesce(GenerationJob.attempts, 0) >= max_attempts
+    ).update(
+        {
+            GenerationJob.status: GenerationStatus.FAILED,
+            GenerationJob.error_message: f"任务处理中断 {max_attempts} 次，已停止重试",
+        },
+        synchronize_session=False
+    )
+    if failed:
+        logger.warning(f"{failed} 个生成任务中断次数达到上限，已标记失败")
+
+    requeued = stale.filter(
+        func.coalesce(GenerationJob.attempts, 0) < max_attempts
+    ).update(
+        {
+            GenerationJob.status: GenerationStatus.PENDING,
+            GenerationJob.started_at: None,
+            GenerationJob.lease_expires_at: None,
+            GenerationJob.claimed_by: None,
+        },
+        synchronize_session=False
+    )
+
+    db.commit()
+    return requeued + failed
+
+
+def _run_with_session(fn, *args):
+    """在独立会话中执行同步数据库操作（供 asyncio.to_thread 调用）"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+class GenerationWorkerPool:
+    """
+    生成任务 worker 池
+
+    在事件循环中运行固定数量的 worker 协程，每个 worker 循环认领并处理任务，
+    因此同时进行的 provider 调用数不会超过 concurrency。
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.concurrency = concurrency or settings.GENERATION_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval or settings.GENERATION_QUEUE_POLL_INTERVAL
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._last_sweep = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """启动 worker 池"""
+        if self._tasks:
+            return
+
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+        await self._sweep_stale_jobs()
+
+        for index in range(self.concurrency):
+            task = asyncio.create_task(
+                self._worker_loop(index),
+                name=f"generation-worker-{index}"
+            )
+            self._tasks.append(task)
+
+        logger.info(f"生成任务 worker 池已启动 - ID: {self.worker_id}, 并发数: {self.concurrency}")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        停止 worker 池
+
+        等待正在处理的任务完成，超时后取消；被取消的任务会在租约过期后重新入队。
+        """
+        if not self._tasks:
+            return
+
+        self._stopping = True
+        self.notify()
+
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        self._tasks.clear()
+        logger.info("生成任务 worker 池已停止")
+
+    def notify(self) -> None:
+        """有新任务入队时唤醒空闲 worker"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _sweep_stale_jobs(self) -> None:
+        """回收其他节点中断的任务（多节点部署时任一 worker 都可以回收）"""
+        self._last_sweep = time.monotonic()
+        try:
+            requeued = await asyncio.to_thread(_run_with_session, requeue_stale_jobs)
+        except Exception as e:
+            logger.error(f"回收中断任务失败: {e}")
+            return
+        if requeued:
+            logger.warning(f"已回收 {requeued} 个中断的生成任务")
+            job_event_broker.publish_all()
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker_loop(self, index: int) -> None:
+        logger.debug(f"generation-worker-{index} 已启动")
+
+        while not self._stopping:
+            try:
+                job_id = await asyncio.to_thread(
+                    _run_with_session, claim_next_job, self.worker_id
+                )
+            except Exception as e:
+                logger.error(f"generation-worker-{index} 认领任务失败: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if job_id is None:
+                # 空闲时由 0 号 worker 定期回收过期租约
+                sweep_interval = settings.GENERATION_JOB_LEASE_SECONDS / 2
+                if index == 0 and time.monotonic() - self._last_sweep > sweep_interval:
+                    await self._sweep_stale_jobs()
+                await self._wait_for_work()
+                continue
+
+            logger.info(f"generation-worker-{index} 认领任务 - ID: {job_id}")
+            # 被认领的任务进入 PROCESSING，其余排队任务的位置前移
+            job_event_broker.publish_all()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"generation-worker-{index} 处理任务异常 - ID: {job_id}: {e}")
+
+        logger.debug(f"generation-worker-{index} 已退出")
+
+    async def _run_job(self, job_id: str) -> None:
+        """处理任务，期间定期续租；租约丢失（任务已被回收）时取消处理"""
+        job_task = asyncio.create_task(process_generation_job(job_id, self.worker_id))
+        lease_task = asyncio.create_task(self._hold_lease(job_id, job_task))
+        try:
+            await job_task
+        except asyncio.CancelledError:
+            # 只吞掉因租约丢失而取消的任务，worker 池停止时的取消照常传播
+            if not lease_task.done() or lease_task.cancelled():
+                raise
+        finally:
+            lease_task.cancel()
+            await asyncio.gather(lease_task, return_exceptions=True)
+
+    async def _hold_lease(self, job_id: str, job_task: asyncio.Task) -> None:
+        """每 1/3 租约时长续租一次，直到任务结束"""
+        interval = settings.GENERATION_JOB_LEASE_SECONDS / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await asyncio.to_thread(
+                    _run_with_session, renew_job_lease, job_id, self.worker_id
+                )
+            except Exception as e:
+                # 暂时的数据库错误：下次再试，租约在过期前还有两次机会
+                logger.warning(f"任务续租失败 - ID: {job_id}: {e}")
+                continue
+
+            if not renewed:
+                logger.warning(f"任务租约已失效（已被回收或重新认领），停止处理 - ID: {job_id}")
+                job_task.cancel()
+                return
+
+
+# 全局 worker 池实例
+generation_worker_pool = GenerationWorkerPool()
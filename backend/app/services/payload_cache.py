@@ -0,0 +1,119 @@
+"""
+源图片载荷缓存
+
+同一张上传图片经常被用于多个风格，每个任务都要读取源图片并做 base64 编码。
+这里按 (缓存键, 编码格式) 缓存编码后的载荷：
+- LRU 淘汰
+- 按字节数限制总容量，超过单条上限的载荷不缓存
+"""
+import asyncio
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[bytes, str]
+
+# 支持的编码格式
+ENCODING_RAW = "raw"        # 原始字节（如 multipart 上传）
+ENCODING_BASE64 = "base64"  # base64 字符串（JSON 请求体）
+
+
+def _read_payload(path: str, encoding: str) -> Payload:
+    """读取文件并编码（同步，在线程池中执行）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if encoding == ENCODING_BASE64:
+        return base64.b64encode(data).decode()
+    return data
+
+
+class SourcePayloadCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Payload]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: Tuple[str, str]) -> Optional[Payload]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key: Tuple[str, str], payload: Payload) -> None:
+        size = len(payload)
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous)
+
+            self._entries[key] = payload
+            self._total_bytes += size
+
+            # 淘汰最久未使用的条目直到容量达标
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+
+# 全局源图片载荷缓存
+source_payload_cache = SourcePayloadCache(
+    max_bytes=settings.SOURCE_PAYLOAD_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.SOURCE_PAYLOAD_CACHE_MAX_ENTRY_BYTES,
+)
+
+
+async def load_source_payload(
+    path: str,
+    encoding: str = ENCODING_RAW,
+    cache_key: Optional[str] = None
+) -> Payload:
+    """
+    获取源图片载荷，命中缓存时跳过磁盘读取和编码
+
+    Args:
+        path: 源图片路径
+        encoding: ENCODING_RAW 或 ENCODING_BASE64
+        cache_key: 缓存键（通常由图片 ID 和派生图变体组成），为空时不缓存
+
+    Returns:
+        bytes（raw）或 str（base64）
+    """
+    if cache_key:
+        payload = source_payload_cache.get((cache_key, encoding))
+        if payload is not None:
+            logger.debug(f"源图片载荷命中缓存 - {cache_key} ({encoding})")
+            return payload
+
+    payload = await asyncio.to_thread(_read_payload, path, encoding)
+
+    if cache_key:
+        source_payload_cache.put((cache_key, encoding), payload)
+    return payload
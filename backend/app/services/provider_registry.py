@@ -0,0 +1,149 @@
+"""
+图像生成客户端注册表
+
+每个 provider 的客户端只构建一次并在任务间复用（包括 Service Account 凭证
+和 token 缓存），仅当对应配置变化时才重新构建，避免在每个任务中重复读取
+凭证文件或调用 google.auth.default()。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.image_generation_client import (
+    ImageGenerationClient,
+    create_image_client,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_provider_config(provider: str) -> Tuple[Optional[str], Dict]:
+    """
+    根据配置构建 provider 的 API key 和客户端参数
+
+    Args:
+        provider: 服务提供商
+
+    Returns:
+        (api_key, client_kwargs)
+    """
+    api_key = None
+    client_kwargs = {}
+
+    if provider == "google_ai":
+        api_key = settings.GOOGLE_AI_API_KEY
+        client_kwargs["project_id"] = settings.GOOGLE_PROJECT_ID
+        client_kwargs["location"] = settings.GOOGLE_LOCATION
+        client_kwargs["base_url_template"] = settings.GOOGLE_BASE_URL_TEMPLATE
+        client_kwargs["model"] = settings.GOOGLE_MODEL
+        client_kwargs["timeout"] = settings.GOOGLE_AI_TIMEOUT
+        if settings.GOOGLE_SERVICE_ACCOUNT_PATH:
+            client_kwargs["service_account_path"] = settings.GOOGLE_SERVICE_ACCOUNT_PATH
+    elif provider == "stability_ai":
+        api_key = settings.STABILITY_AI_API_KEY
+        client_kwargs["base_url"] = settings.STABILITY_AI_BASE_URL
+        client_kwargs["model"] = settings.STABILITY_AI_MODEL
+        client_kwargs["timeout"] = settings.STABILITY_AI_TIMEOUT
+    elif provider == "replicate":
+        api_key = settings.REPLICATE_API_KEY
+        client_kwargs["base_url"] = settings.REPLICATE_BASE_URL
+        client_kwargs["model"] = settings.REPLICATE_MODEL
+        client_kwargs["timeout"] = settings.REPLICATE_TIMEOUT
+    elif provider == "openrouter":
+        api_key = settings.OPENROUTER_API_KEY
+        client_kwargs["base_url"] = settings.OPENROUTER_BASE_URL
+        client_kwargs["model"] = settings.OPENROUTER_MODEL
+        client_kwargs["timeout"] = settings.OPENROUTER_TIMEOUT
+
+    return api_key, client_kwargs
+
+
+def _config_fingerprint(api_key: Optional[str], client_kwargs: Dict) -> str:
+    """配置指纹：配置项或凭证文件变化时改变"""
+    config = {"api_key": api_key, **client_kwargs}
+
+    # Service Account 文件被替换（如密钥轮换）时也需要重新加载
+    service_account_path = client_kwargs.get("service_account_path")
+    if service_account_path:
+        try:
+            config["service_account_mtime"] = os.stat(service_account_path).st_mtime_ns
+        except OSError:
+            config["service_account_mtime"] = None
+
+    raw = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ImageClientRegistry:
+    """按 provider 缓存图像生成客户端"""
+
+    def __init__(self):
+        self._clients: Dict[str, Tuple[str, ImageGenerationClient]] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+
+    def get(self, provider: Optional[str] = None) -> ImageGenerationClient:
+        """
+        获取 provider 的客户端，首次使用或配置变化时构建
+
+        Args:
+            provider: 服务提供商，默认 settings.IMAGE_PROVIDER
+
+        Returns:
+            图像生成客户端实例
+
+        Raises:
+            ValueError: provider 不支持或配置不完整
+        """
+        provider = provider or settings.IMAGE_PROVIDER
+        api_key, client_kwargs = get_provider_config(provider)
+        fingerprint = _config_fingerprint(api_key, client_kwargs)
+
+        cached = self._clients.get(provider)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        client = create_image_client(provider=provider, api_key=api_key, **client_kwargs)
+        self._clients[provider] = (fingerprint, client)
+
+        if cached is not None:
+            # 旧客户端的后台任务（如 token 刷新）不再需要
+            logger.info(f"{provider} 配置已变化，重新创建客户端")
+            cached[1].close()
+        return client
+
+    def limit(self, provider: str) -> Optional[asyncio.Semaphore]:
+        """
+        provider 的并发限制（PROVIDER_MAX_CONCURRENCY）
+
+        批量任务等大量任务同时被认领时，同一 provider 的请求数不超过限制，
+        超出的任务在本进程内排队等待。限制只在本进程内生效，多个 worker 进程
+        对同一 provider 的总并发是进程数 × PROVIDER_MAX_CONCURRENCY。
+
+        Returns:
+            信号量，未限制时返回 None
+        """
+        if settings.PROVIDER_MAX_CONCURRENCY <= 0:
+            return None
+        semaphore = self._limits.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(settings.PROVIDER_MAX_CONCURRENCY)
+            self._limits[provider] = semaphore
+        return semaphore
+
+    def clear(self) -> None:
+        """关闭并清空缓存的客户端（进程退出时调用）"""
+        clients = [client for _, client in self._clients.values()]
+        self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"关闭图像生成客户端失败: {e}")
+
+
+# 全局客户端注册表
+image_client_registry = ImageClientRegistry()
@@ -0,0 +1,398 @@
+"""
+多 provider 路由与故障切换
+
+每个任务按顺序尝试一条 provider 链（风格的 provider_chain，未设置时为
+IMAGE_PROVIDER + IMAGE_PROVIDER_FALLBACKS）：当前 provider 失败（超时、限流、
+5xx、额度不足等）时，在同一个任务内立即换用下一个 provider，而不是让任务失败。
+
+每个 provider 的健康状况（成功 / 失败次数、耗时）在进程内统计，并有一个熔断器
+（见 circuit_breaker）：熔断中的 provider 直接跳过，不再占用 worker 和连接，
+链中所有 provider 都熔断时任务立即失败。
+
+对冲请求（PROVIDER_HEDGE_ENABLED）：provider 调用超过其最近耗时的
+PROVIDER_HEDGE_PERCENTILE 分位数仍未返回时，向链中的下一个 provider（没有时为同一个
+provider）再发一个请求，采用先返回的结果并取消另一个。对冲请求数受 HedgeBudget 限制，
+最多占全部请求的 PROVIDER_HEDGE_BUDGET，provider 费用只会小幅增加。
+
+暂时性错误（429、503、连接重置等）先按重试策略在同一 provider 重试（见 retry_policy），
+重试次数用尽或错误不可重试时再切换 provider。每次请求（包括重试）都记录在尝试记录中。
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.circuit_breaker import OPEN, CircuitBreaker
+from app.services.image_generation_client import ImageGenerationClient, ProviderError
+from app.services.provider_registry import image_client_registry
+from app.services.retry_policy import RetryBudget, is_retryable, retry_delay
+
+logger = logging.getLogger(__name__)
+
+# 平均耗时的平滑系数（指数加权移动平均）
+LATENCY_EWMA_ALPHA = 0.2
+
+# 计算耗时分位数的样本数（最近的成功请求）
+LATENCY_WINDOW = 200
+
+# 对冲预算统计的请求数（最近的请求）
+HEDGE_BUDGET_WINDOW = 1000
+
+# 单次尝试：用给定 provider 的客户端生成图像（负责按 provider 准备源图片）
+Attempt = Callable[[str, ImageGenerationClient], Awaitable[Dict]]
+
+
+def parse_provider_chain(value: Optional[str]) -> List[str]:
+    """解析逗号分隔的 provider 列表（去重，保持顺序）"""
+    if not value:
+        return []
+    return list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+
+
+def describe_error(error: Exception) -> Dict:
+    """失败尝试的摘要（写入任务的 api_response）"""
+    status_code = error.status_code if isinstance(error, ProviderError) else None
+    return {"error": str(error)[:500], "status_code": status_code, "retryable": is_retryable(error)}
+
+
+def count_retries(attempts: List[Dict]) -> int:
+    """尝试记录中的重试次数"""
+    return sum(1 for record in attempts if record.get("retry"))
+
+
+def is_provider_fault(error: Exception) -> bool:
+    """
+    错误是否计入 provider 的熔断统计
+
+    请求本身的问题（400、413、422 等 4xx）不代表 provider 故障；
+    鉴权 / 额度（401、402、403）、限流、5xx、超时和其他异常都计入。
+    """
+    if isinstance(error, ProviderError) and error.status_code is not None:
+        status_code = error.status_code
+        if 400 <= status_code < 500:
+            return status_code in (401, 402, 403) or error.retryable
+    return True
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class ProviderHealth:
+    """单个 provider 的健康统计"""
+
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latency: Optional[float] = None  # 成功请求的平均耗时（秒）
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record_success(self, elapsed: float) -> None:
+        self.successes += 1
+        self.latencies.append(elapsed)
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += LATENCY_EWMA_ALPHA * (elapsed - self.latency)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """最近成功请求耗时的分位数（最近秩法），没有样本时返回 None"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        rank = max(math.ceil(percentile / 100 * len(ordered)), 1)
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def snapshot(self) -> Dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "latency": _round(self.latency),
+            "latency_p95": _round(self.latency_percentile(95)),
+        }
+
+
+class HedgeBudget:
+    """
+    对冲请求预算
+
+    最近 HEDGE_BUDGET_WINDOW 次请求中，对冲请求的比例不超过 PROVIDER_HEDGE_BUDGET。
+    """
+
+    def __init__(self, window: int = HEDGE_BUDGET_WINDOW):
+        self._recent: Deque[bool] = deque(maxlen=window)
+
+    def record_request(self) -> None:
+        """记录一次普通请求"""
+        self._recent.append(False)
+
+    def try_acquire(self) -> bool:
+        """预算允许时记录一次对冲请求并返回 True"""
+        hedged = sum(self._recent) + 1
+        if hedged > settings.PROVIDER_HEDGE_BUDGET * len(self._recent):
+            return False
+        self._recent.append(True)
+        return True
+
+
+class ProviderChainError(Exception):
+    """provider 链中所有 provider 都失败（消息为最后一个错误）"""
+
+    def __init__(self, message: str, attempts: List[Dict]):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class ProviderRouter:
+    """按 provider 链生成图像，失败时切换到下一个 provider，慢请求可以发出对冲请求"""
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.hedge_budget = HedgeBudget()
+
+    def health(self, provider: str) -> ProviderHealth:
+        """provider 的健康统计"""
+        health = self._health.get(provider)
+        if health is None:
+            health = ProviderHealth()
+            self._health[provider] = health
+        return health
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """provider 的熔断器"""
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(provider)
+            self._breakers[provider] = breaker
+        return breaker
+
+    def chain(self, style_chain: Optional[str] = None) -> List[str]:
+        """
+        任务的 provider 尝试顺序
+
+        未配置（缺少 API key 等）的 provider 被跳过；熔断中的 provider 在调用时跳过。
+
+        Args:
+            style_chain: 风格指定的 provider 链（逗号分隔），未设置时使用全局配置
+
+        Raises:
+            ValueError: 链中没有可用的 provider
+        """
+        configured = parse_provider_chain(style_chain) or parse_provider_chain(
+            f"{settings.IMAGE_PROVIDER},{settings.IMAGE_PROVIDER_FALLBACKS}"
+        )
+
+        available = []
+        for provider in configured:
+            try:
+                image_client_registry.get(provider)
+            except ValueError as e:
+                logger.warning(f"跳过未配置的 provider {provider}: {e}")
+                continue
+            available.append(provider)
+
+        if not available:
+            raise ValueError(f"没有可用的图像生成 provider: {', '.join(configured)}")
+        return available
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """
+        等待多久后发出对冲请求
+
+        Returns:
+            秒数；未开启对冲或耗时样本不足时返回 None
+        """
+        if not settings.PROVIDER_HEDGE_ENABLED:
+            return None
+        health = self.health(provider)
+        if len(health.latencies) < settings.PROVIDER_HEDGE_MIN_SAMPLES:
+            return None
+        threshold = health.latency_percentile(settings.PROVIDER_HEDGE_PERCENTILE)
+        return max(threshold, settings.PROVIDER_HEDGE_MIN_DELAY)
+
+    async def generate(self, chain: List[str], attempt: Attempt) -> Tuple[str, Dict, List[Dict]]:
+        """
+        依次尝试 provider 链，返回第一个成功的结果
+
+        熔断中的 provider 被跳过（不发请求）。
+
+        Args:
+            chain: provider 尝试顺序（见 chain）
+            attempt: 单次尝试
+
+        Returns:
+            (成功的 provider, 生成结果, 每次尝试的记录)
+
+        Raises:
+            ProviderChainError: 所有 provider 都失败或熔断
+        """
+        attempts: List[Dict] = []
+        failed: Set[str] = set()
+        budget = RetryBudget()
+        last_error: Optional[Exception] = None
+
+        for index, provider in enumerate(chain):
+            if provider in failed:
+                # 已经作为对冲目标失败过
+                continue
+            if not self.breaker(provider).allow_request():
+                attempts.append({"provider": provider, "skipped": "circuit_open"})
+                logger.info(f"{provider} 熔断中，跳过")
+                continue
+            try:
+                winner, result = await self._call_with_hedge(chain, index, attempt, attempts, failed, budget)
+            except Exception as e:
+                last_error = e
+                remaining = [name for name in chain[index + 1:] if name not in failed]
+                if remaining:
+                    logger.warning(f"{provider} 生成失败，切换到 {remaining[0]}")
+                continue
+            return winner, result, attempts
+
+        if last_error is None:
+            raise ProviderChainError("图像生成服务暂时不可用（所有 provider 熔断中），请稍后重试", attempts)
+        raise ProviderChainError(str(last_error), attempts)
+
+    async def _call_with_hedge(
+        self,
+        chain: List[str],
+        index: int,
+        attempt: Attempt,
+        attempts: List[Dict],
+        failed: Set[str],
+        budget: RetryBudget
+    ) -> Tuple[str, Dict]:
+        """
+        调用 chain[index]（调用方已通过熔断器放行），超过对冲阈值仍未返回时
+        向下一个 provider 发出对冲请求
+
+        采用先成功的结果，另一个请求被取消；都失败时抛出最后一个错误。
+        """
+        provider = chain[index]
+        self.hedge_budget.record_request()
+        tasks = {asyncio.create_task(self._call(provider, attempt, attempts, budget)): provider}
+
+        try:
+            delay = self.hedge_delay(provider)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                hedge_provider = None if done else self._hedge_target(chain, index, failed)
+                if hedge_provider is not None:
+                    logger.info(f"{provider} 超过 {delay:.1f}s 未返回，对冲请求 {hedge_provider}")
+                    hedge = asyncio.create_task(self._call(hedge_provider, attempt, attempts, budget, hedge=True))
+                    tasks[hedge] = hedge_provider
+
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task], task.result()
+                    failed.add(tasks[task])
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # 取消落后的请求（以及任务本身被取消时的所有请求）
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _hedge_target(self, chain: List[str], index: int, failed: Set[str]) -> Optional[str]:
+        """
+        对冲请求的 provider：链中后面第一个未熔断的 provider，没有时为当前 provider
+
+        Returns:
+            provider（已通过熔断器放行并占用对冲预算），预算不足或都熔断时返回 None
+        """
+        candidates = [name for name in chain[index + 1:] if name not in failed] + [chain[index]]
+        for candidate in candidates:
+            if self.breaker(candidate).allow_request():
+                if self.hedge_budget.try_acquire():
+                    return candidate
+                self.breaker(candidate).release()
+                return None
+        return None
+
+    async def _call(
+        self,
+        provider: str,
+        attempt: Attempt,
+        attempts: List[Dict],
+        budget: RetryBudget,
+        hedge: bool = False
+    ) -> Dict:
+        """
+        调用一个 provider，可重试的错误按重试策略在同一 provider 重试
+
+        每次请求记录尝试结果、provider 健康统计和熔断器（被取消的请求不计入）。
+        调用方已通过熔断器放行第一次请求，重试前重新检查熔断器。
+        """
+        retry = 0
+        while True:
+            record: Dict = {"provider": provider}
+            if hedge:
+                record["hedge"] = True
+            if retry:
+                record["retry"] = retry
+            attempts.append(record)
+
+            started = time.monotonic()
+            try:
+                result = await attempt(provider, image_client_registry.get(provider))
+            except asyncio.CancelledError:
+                self.breaker(provider).release()
+                record.update(elapsed=round(time.monotonic() - started, 3), cancelled=True)
+                raise
+            except Exception as e:
+                elapsed = time.monotonic() - started
+                self.health(provider).record_failure()
+                if is_provider_fault(e):
+                    self.breaker(provider).record_failure()
+                else:
+                    self.breaker(provider).release()
+                record.update(elapsed=round(elapsed, 3), **describe_error(e))
+                logger.warning(f"{provider} 生成失败（{elapsed:.1f}s）: {e}")
+
+                # 本次失败已触发熔断时不再重试
+                delay = retry_delay(e, retry)
+                if delay is None or self.breaker(provider).state == OPEN or not budget.try_spend():
+                    raise
+                record["backoff"] = round(delay, 3)
+                logger.info(f"{delay:.1f}s 后重试 {provider}（第 {retry + 1} 次）")
+                await asyncio.sleep(delay)
+                if not self.breaker(provider).allow_request():
+                    raise
+                retry += 1
+                continue
+
+            elapsed = time.monotonic() - started
+            self.health(provider).record_success(elapsed)
+            self.breaker(provider).record_success(elapsed)
+            record["elapsed"] = round(elapsed, 3)
+            return result
+
+    def snapshot(self, providers: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        provider 的健康统计和熔断状态（运维接口）
+
+        Args:
+            providers: 额外包含的 provider（如配置的链中还没有请求过的 provider）
+        """
+        names = list(dict.fromkeys([*(providers or []), *self._health, *self._breakers]))
+        return {
+            name: {**self.health(name).snapshot(), "breaker": self.breaker(name).snapshot()}
+            for name in names
+        }
+
+
+# 全局路由实例
+provider_router = ProviderRouter()
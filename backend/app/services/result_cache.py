@@ -0,0 +1,118 @@
+"""
+生成结果缓存
+
+按内容寻址：缓存键 = SHA-256(源图内容哈希 + prompt + provider + 模型)。
+开启了 cache_results 的风格在调用 provider 之前先查找缓存键相同且已完成的任务，
+命中时直接在存储内为新任务复制已有的生成结果（本地为硬链接），不再调用 provider。
+
+有意保持随机性的风格不开启 cache_results，每次都会重新生成。
+"""
+import hashlib
+import logging
+import os
+import uuid
+from typing import Dict, Optional
+
+from app.core.database import session_scope
+from app.core.storage import GENERATED, storage_key, storage_url
+from app.models.image import GenerationJob, GenerationStatus, UploadedImage
+from app.services.storage_backend import get_storage
+
+logger = logging.getLogger(__name__)
+
+# 计算文件哈希时的读取块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_file_sha256(path: str) -> str:
+    """分块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_cache_key(content_hash: str, prompt: str, provider: str, model: Optional[str]) -> str:
+    """
+    计算生成结果的缓存键
+
+    Args:
+        content_hash: 源图片内容的 SHA-256
+        prompt: 实际发送的 prompt
+        provider: 服务提供商
+        model: 模型名称（没有模型概念的 provider 传 None）
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    parts = [content_hash, prompt, provider, model or ""]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def backfill_content_hash(source_image_id: str, source_path: str) -> str:
+    """
+    计算并回填源图片的内容哈希
+
+    上传时已经计算并保存；早期上传的图片没有哈希，首次用到时在这里补上。
+    """
+    content_hash = compute_file_sha256(source_path)
+    with session_scope() as db:
+        db.query(UploadedImage).filter(UploadedImage.id == source_image_id).update(
+            {UploadedImage.content_hash: content_hash},
+            synchronize_session=False
+        )
+    return content_hash
+
+
+def find_cached_result(cache_key: str) -> Optional[Dict]:
+    """
+    查找缓存键相同且结果文件仍然存在的已完成任务
+
+    派生版本不复制，命中的新任务直接引用（文件内容不会改变）。
+
+    Returns:
+        {"job_id": str, "result_image_url": str, "key": str, "renditions": dict}，未命中返回 None
+    """
+    with session_scope() as db:
+        rows = db.query(
+            GenerationJob.id, GenerationJob.result_image_url, GenerationJob.renditions
+        ).filter(
+            GenerationJob.cache_key == cache_key,
+            GenerationJob.status == GenerationStatus.COMPLETED,
+            GenerationJob.result_image_url.isnot(None)
+        ).order_by(GenerationJob.completed_at.desc()).limit(5).all()
+
+    for job_id, result_image_url, renditions in rows:
+        key = storage_key(result_image_url)
+        if get_storage().exists(key):
+            return {
+                "job_id": job_id,
+                "result_image_url": result_image_url,
+                "key": key,
+                "renditions": renditions,
+            }
+    return None
+
+
+def link_cached_result(cached: Dict) -> str:
+    """
+    在存储内为新任务复制一份缓存结果
+
+    本地存储使用硬链接（不复制数据），对象存储使用服务端复制。每个任务仍然拥有
+    独立的文件名，删除其中一个不影响其他任务；复制失败时直接复用原文件。
+
+    Args:
+        cached: find_cached_result 的返回值
+
+    Returns:
+        新任务的 result_image_url
+    """
+    extension = os.path.splitext(cached["key"])[1]
+    result_image_url = storage_url(GENERATED, f"result_{uuid.uuid4()}{extension}")
+    try:
+        get_storage().copy(cached["key"], storage_key(result_image_url))
+    except Exception as e:
+        logger.debug(f"复制缓存结果失败，复用原文件: {e}")
+        return cached["result_image_url"]
+    return result_image_url
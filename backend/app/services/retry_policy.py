@@ -0,0 +1,80 @@
+"""
+provider 调用的重试策略
+
+只重试可以安全重发的错误，按状态码分类：
+- 408、425、429、500、502、503、504：provider 明确表示暂时无法处理
+- 建立连接阶段的错误：连接失败、连接超时、等待连接池超时（请求还没有发出）
+读写超时和连接中途断开（请求可能已经在 provider 端执行并计费）、鉴权 / 额度错误
+（401、402、403）和其他 4xx 不在同一 provider 重试，交给故障切换（见 provider_router）。
+
+等待时间为带抖动的指数退避（full jitter）：random(0, min(上限, 基数 * 2^n))，
+provider 返回 Retry-After 时至少等待该时长；Retry-After 超过 PROVIDER_RETRY_MAX_DELAY
+时不再等待，直接切换 provider。
+
+同一 provider 最多重试 PROVIDER_RETRY_MAX_ATTEMPTS 次，每个任务所有 provider 的重试
+总数不超过 PROVIDER_RETRY_JOB_BUDGET（RetryBudget），避免故障期间的重试放大负载。
+"""
+import random
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.image_generation_client import ProviderError
+
+
+def is_retryable(error: Exception) -> bool:
+    """错误是否可以在同一 provider 安全重试"""
+    if isinstance(error, ProviderError):
+        # 由客户端判断（见 ProviderError.retryable）：按状态码创建的错误只有 RETRYABLE_STATUS_CODES
+        # 可重试，读写超时和已经创建了计费任务之后的错误不可重试
+        return error.retryable
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def backoff_delay(retry: int, retry_after: Optional[float] = None) -> float:
+    """
+    第 retry 次重试（从 0 开始）前的等待时间
+
+    Args:
+        retry: 已经重试的次数
+        retry_after: provider 要求的等待时间（秒）
+    """
+    ceiling = min(settings.PROVIDER_RETRY_MAX_DELAY, settings.PROVIDER_RETRY_BASE_DELAY * (2 ** retry))
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_delay(error: Exception, retry: int) -> Optional[float]:
+    """
+    失败后是否在同一 provider 重试
+
+    Args:
+        error: 本次调用的错误
+        retry: 该 provider 已经重试的次数
+
+    Returns:
+        重试前的等待秒数；不应重试时返回 None
+    """
+    if retry >= settings.PROVIDER_RETRY_MAX_ATTEMPTS or not is_retryable(error):
+        return None
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None and retry_after > settings.PROVIDER_RETRY_MAX_DELAY:
+        return None
+    return backoff_delay(retry, retry_after)
+
+
+class RetryBudget:
+    """单个任务的重试预算"""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.remaining = settings.PROVIDER_RETRY_JOB_BUDGET if limit is None else limit
+
+    def try_spend(self) -> bool:
+        """预算允许时扣减一次并返回 True"""
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
@@ -0,0 +1,382 @@
+"""
+存储后端
+
+上传图片和生成结果通过 StorageBackend 读写，由 STORAGE_BACKEND 选择实现：
+- local: 文件保存在 UPLOAD_DIR，由 API 进程的 /uploads 静态挂载提供访问
+- s3: S3 兼容对象存储（AWS S3、MinIO 等），客户端通过预签名 URL 或 CDN 直接下载，
+  图片字节不经过 API 进程，API 和 worker 节点也不需要共享磁盘
+
+存储键就是 app.core.storage 中的相对路径（如 images/ab/cd/<文件名>）。
+所有方法都是同步的（boto3 没有异步接口），在异步代码中通过 asyncio.to_thread 调用。
+"""
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.storage import UPLOADS_URL_PREFIX, storage_key
+
+logger = logging.getLogger(__name__)
+
+# boto3 (可选依赖，仅 s3 后端需要)
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+# 对象存储中的文件名都带内容哈希或 UUID，内容永不改变，可以长期缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageBackend(ABC):
+    """存储后端基类"""
+
+    @abstractmethod
+    def put_file(
+        self,
+        local_path: str,
+        key: str,
+        content_type: Optional[str] = None,
+        keep_local: bool = False
+    ) -> None:
+        """
+        把本地文件保存到 key（调用后 local_path 不再存在）
+
+        Args:
+            local_path: 本地文件路径（通常是 TEMP_DIR 下的临时文件）
+            key: 存储键
+            content_type: MIME 类型，不传时按扩展名推断
+            keep_local: 远程后端是否在本地保留一份副本（之后 fetch 不用再下载）
+        """
+
+    @abstractmethod
+    def fetch(self, key: str) -> str:
+        """
+        获取文件的本地路径，远程后端会先下载到本地缓存目录
+
+        Raises:
+            FileNotFoundError: 文件不存在
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """文件是否存在"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """删除文件（不存在时忽略）"""
+
+    @abstractmethod
+    def copy(self, source_key: str, target_key: str) -> None:
+        """在存储内部复制文件，不经过本地"""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """客户端访问文件的 URL"""
+
+
+class LocalStorage(StorageBackend):
+    """本地文件系统存储"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put_file(
+        self,
+        local_path: str,
+        key: str,
+        content_type: Optional[str] = None,
+        keep_local: bool = False
+    ) -> None:
+        target_path = self.path(key)
+        if os.path.abspath(local_path) == os.path.abspath(target_path):
+            return
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # TEMP_DIR 与 UPLOAD_DIR 通常在同一文件系统，原子重命名不复制数据
+        shutil.move(local_path, target_path)
+
+    def fetch(self, key: str) -> str:
+        path = self.path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def delete(self, key: str) -> None:
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        target_path = self.path(target_key)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            # 硬链接不复制数据
+            os.link(self.path(source_key), target_path)
+        except OSError:
+            shutil.copyfile(self.path(source_key), target_path)
+
+    def url(self, key: str) -> str:
+        return UPLOADS_URL_PREFIX + key
+
+
+class S3Storage(StorageBackend):
+    """
+    S3 兼容对象存储
+
+    fetch 下载的文件和 put_file(keep_local=True) 保留的副本缓存在 UPLOAD_DIR/cache 下
+    （worker 规范化源图需要本地文件）。缓存总大小超过 cache_max_bytes 时按最近使用时间
+    （文件 mtime，命中时刷新）淘汰到上限的 80%。字节数在进程内累计，超限时才扫描目录，
+    扫描结果同时校正其他进程写入的文件。
+
+    预签名 URL 在有效期的前 80% 内复用（最多缓存 PRESIGN_CACHE_SIZE 个），
+    同一张图片在列表、状态推送等接口中返回相同的 URL，浏览器缓存也能命中。
+    """
+
+    CACHE_LOW_WATERMARK = 0.8
+    PRESIGN_CACHE_SIZE = 10000
+    PRESIGN_REUSE_RATIO = 0.8
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        force_path_style: bool = False,
+        presign_expires: int = 3600,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None
+    ):
+        if not BOTO3_AVAILABLE:
+            raise RuntimeError("STORAGE_BACKEND=s3 需要安装 boto3（pip install -r requirements.txt）")
+        if not bucket:
+            raise ValueError("STORAGE_BACKEND=s3 需要配置 S3_BUCKET")
+
+        self.bucket = bucket
+        self.presign_expires = presign_expires
+        self.cache_dir = cache_dir or os.path.join(settings.UPLOAD_DIR, "cache")
+        self.cache_max_bytes = settings.S3_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes
+        self._cache_bytes: Optional[int] = None  # 首次写入缓存时扫描目录初始化
+        self._cache_lock = threading.Lock()
+        self._urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (URL, 复用截止时间)
+        self._urls_lock = threading.Lock()
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            config=BotoConfig(
+                signature_version="s3v4",
+                s3={"addressing_style": "path" if force_path_style else "auto"},
+            ),
+        )
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _scan_cache(self) -> List[Tuple[float, int, str]]:
+        """缓存目录中的文件 (mtime, 大小, 路径)，跳过下载中的 .part 文件"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _cache_added(self, path: str) -> None:
+        """新文件写入缓存后累计大小，超过上限时淘汰最久未使用的文件（保留刚写入的文件）"""
+        size = os.path.getsize(path)
+        with self._cache_lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(entry[1] for entry in self._scan_cache())
+            else:
+                self._cache_bytes += size
+            if self.cache_max_bytes <= 0 or self._cache_bytes <= self.cache_max_bytes:
+                return
+
+            entries = sorted(self._scan_cache())
+            total = sum(entry[1] for entry in entries)
+            target = self.cache_max_bytes * self.CACHE_LOW_WATERMARK
+            evicted = 0
+            for _, cached_size, cached in entries:
+                if total <= target:
+                    break
+                if cached == path:
+                    continue
+                try:
+                    os.remove(cached)
+                except FileNotFoundError:
+                    pass
+                total -= cached_size
+                evicted += 1
+            self._cache_bytes = total
+        if evicted:
+            logger.info(f"S3 本地缓存超过上限，已淘汰 {evicted} 个文件")
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """缓存命中时刷新 mtime，作为最近使用时间"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def put_file(
+        self,
+        local_path: str,
+        key: str,
+        content_type: Optional[str] = None,
+        keep_local: bool = False
+    ) -> None:
+        content_type = content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.client.upload_file(
+            local_path,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+        )
+
+        if keep_local:
+            cache_path = self._cache_path(key)
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            shutil.move(local_path, cache_path)
+            os.utime(cache_path)
+            self._cache_added(cache_path)
+        else:
+            os.remove(local_path)
+
+    def fetch(self, key: str) -> str:
+        cache_path = self._cache_path(key)
+        if os.path.exists(cache_path):
+            self._touch(cache_path)
+            return cache_path
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".part")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, temp_path)
+            os.replace(temp_path, cache_path)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key) from e
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._cache_added(cache_path)
+        return cache_path
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        with self._urls_lock:
+            self._urls.pop(key, None)
+        cache_path = self._cache_path(key)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=target_key,
+            CopySource={"Bucket": self.bucket, "Key": source_key},
+            MetadataDirective="COPY",
+        )
+
+    def url(self, key: str) -> str:
+        now = time.monotonic()
+        with self._urls_lock:
+            cached = self._urls.get(key)
+            if cached is not None and cached[1] > now:
+                self._urls.move_to_end(key)
+                return cached[0]
+
+        # 预签名只是本地计算签名，不发起网络请求
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.presign_expires,
+        )
+        with self._urls_lock:
+            self._urls[key] = (url, now + self.presign_expires * self.PRESIGN_REUSE_RATIO)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.PRESIGN_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        return url
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """获取（懒加载）当前配置的存储后端"""
+    global _storage
+    if _storage is None:
+        backend = settings.STORAGE_BACKEND.lower()
+        if backend == "local":
+            _storage = LocalStorage(settings.UPLOAD_DIR)
+        elif backend == "s3":
+            _storage = S3Storage(
+                bucket=settings.S3_BUCKET,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region=settings.S3_REGION,
+                access_key_id=settings.S3_ACCESS_KEY_ID,
+                secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+                force_path_style=settings.S3_FORCE_PATH_STYLE,
+                presign_expires=settings.S3_PRESIGN_EXPIRES,
+            )
+        else:
+            raise ValueError(f"不支持的存储后端: {settings.STORAGE_BACKEND}")
+        logger.info(f"存储后端: {backend}")
+    return _storage
+
+
+def public_url(storage_path: Optional[str]) -> Optional[str]:
+    """
+    数据库中的存储路径转换为客户端访问的 URL
+
+    - 配置了 CDN_BASE_URL: CDN 地址
+    - local: /uploads/... 相对路径（保持不变）
+    - s3: 预签名 URL
+    已经是完整 URL 的值原样返回。
+    """
+    if not storage_path or storage_path.startswith(("http://", "https://")):
+        return storage_path
+
+    key = storage_key(storage_path)
+    if settings.CDN_BASE_URL:
+        return f"{settings.CDN_BASE_URL.rstrip('/')}/{key}"
+    return get_storage().url(key)
@@ -0,0 +1,152 @@
+"""
+按内容寻址的上传存储
+
+上传文件以内容 SHA-256 命名保存在存储后端的 images/ 分片目录下，image_blobs 表记录每个文件
+被多少条 UploadedImage 引用：
+- 重复上传（客户端重试很常见）只新增一条 UploadedImage 并增加引用数，不再写入文件
+- 新文件先登记引用再写入，文件只在引用数条件递减到 0 时删除（release_blob），
+  并发上传同一内容不会删掉对方仍在使用的文件
+
+调用方负责事务：除 register_blob 和 acquire_blob_reference 外，这里的函数都不提交。
+"""
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.storage import IMAGES, storage_key, storage_url
+from app.models.image import ImageBlob
+from app.services.storage_backend import get_storage
+
+logger = logging.getLogger(__name__)
+
+# 按真实 MIME 类型确定的文件扩展名（不信任客户端文件名）
+BLOB_EXTENSIONS: Dict[str, str] = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+
+
+def blob_storage_path(content_hash: str, mime_type: str) -> str:
+    """内容哈希对应的存储路径（/uploads/images/ab/cd/<哈希><扩展名>）"""
+    return storage_url(IMAGES, f"{content_hash}{BLOB_EXTENSIONS.get(mime_type, '')}")
+
+
+def find_blob(db: Session, content_hash: str) -> Optional[ImageBlob]:
+    """
+    查找已保存的相同内容文件
+
+    记录存在但文件已丢失时视为不存在，由下一次上传重新写入。
+    """
+    blob = db.query(ImageBlob).filter(ImageBlob.content_hash == content_hash).first()
+    if blob is None or not get_storage().exists(storage_key(blob.storage_path)):
+        return None
+    return blob
+
+
+def add_blob_reference(db: Session, content_hash: str, storage_path: Optional[str] = None) -> bool:
+    """
+    引用数加 1（原子 UPDATE，不依赖已加载的对象）
+
+    Args:
+        storage_path: 同时更新存储路径（文件丢失后重新写入时）
+
+    Returns:
+        记录是否仍然存在（最后一个引用可能刚被并发释放）
+    """
+    values = {ImageBlob.ref_count: ImageBlob.ref_count + 1}
+    if storage_path is not None:
+        values[ImageBlob.storage_path] = storage_path
+    updated = db.query(ImageBlob).filter(ImageBlob.content_hash == content_hash).update(
+        values,
+        synchronize_session=False
+    )
+    return updated > 0
+
+
+def acquire_blob_reference(db: Session, content_hash: str) -> bool:
+    """
+    为已保存的文件持有一个引用（独立提交）
+
+    Returns:
+        是否成功；文件已被释放时返回 False，调用方按新文件重新写入
+    """
+    if not add_blob_reference(db, content_hash):
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def register_blob(
+    db: Session,
+    content_hash: str,
+    storage_path: str,
+    file_size: int,
+    width: int,
+    height: int,
+    mime_type: str
+) -> None:
+    """
+    登记即将写入的文件并持有一个引用（独立提交）
+
+    在写入文件之前调用：写入失败时调用方通过 release_blob 释放引用。
+    并发上传同一内容时只有一个 INSERT 成功，其余回退为增加引用数；
+    文件丢失后重新写入的情况下更新已有记录。
+    """
+    if add_blob_reference(db, content_hash, storage_path):
+        db.commit()
+        return
+
+    db.add(ImageBlob(
+        content_hash=content_hash,
+        storage_path=storage_path,
+        file_size=file_size,
+        width=width,
+        height=height,
+        mime_type=mime_type,
+        ref_count=1,
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        add_blob_reference(db, content_hash, storage_path)
+        db.commit()
+
+
+def release_blob(db: Session, content_hash: str) -> bool:
+    """
+    释放一个引用，最后一个引用释放时删除文件和记录
+
+    记录只在引用数仍为 0 时删除（条件 DELETE），与并发的 add_blob_reference 互斥：
+    先增加引用的一方保住文件，后到的一方看到记录已删除后重新写入。
+
+    Returns:
+        文件是否已被删除
+    """
+    storage_path = db.query(ImageBlob.storage_path).filter(
+        ImageBlob.content_hash == content_hash
+    ).scalar()
+    if storage_path is None:
+        return False
+
+    db.query(ImageBlob).filter(
+        ImageBlob.content_hash == content_hash,
+        ImageBlob.ref_count > 0
+    ).update(
+        {ImageBlob.ref_count: ImageBlob.ref_count - 1},
+        synchronize_session=False
+    )
+    deleted = db.query(ImageBlob).filter(
+        ImageBlob.content_hash == content_hash,
+        ImageBlob.ref_count <= 0
+    ).delete(synchronize_session=False)
+    if not deleted:
+        return False
+
+    get_storage().delete(storage_key(storage_path))
+    logger.info(f"已删除无引用的上传文件 - {content_hash}")
+    return True
@@ -0,0 +1,65 @@
+"""
+独立的生成任务 worker 进程
+
+从数据库队列认领 PENDING 任务并调用 process_generation_job 处理，
+可以在多个核心 / 多台机器上同时运行，只需连接同一个数据库：
+
+    python -m app.worker
+    python -m app.worker --concurrency 8
+
+此时 API 进程只负责接收上传和查询状态，可设置 GENERATION_WORKERS_IN_API=False。
+"""
+import argparse
+import asyncio
+import signal
+from typing import Optional
+
+import app.models  # noqa: F401  注册所有模型，保证 create_all 建表完整
+from app.core.config import settings
+from app.core.database import Base, engine
+from app.core.logging_config import setup_logging
+from app.services.http_client import http_clients
+from app.services.image_processing import shutdown_process_pool
+from app.services.job_queue import GenerationWorkerPool
+from app.services.provider_registry import image_client_registry
+
+logger = setup_logging()
+
+
+async def run_worker(concurrency: Optional[int] = None) -> None:
+    """运行 worker 池，直到收到 SIGINT / SIGTERM"""
+    pool = GenerationWorkerPool(concurrency=concurrency)
+    stop_event = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    http_clients.start()
+    await pool.start()
+    await stop_event.wait()
+
+    logger.info("收到退出信号，等待进行中的任务完成...")
+    await pool.stop()
+    image_client_registry.clear()
+    await http_clients.aclose()
+    shutdown_process_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PetsPhoto 生成任务 worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.GENERATION_WORKER_CONCURRENCY,
+        help="本进程同时处理的任务数"
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    logger.info(f"生成任务 worker 启动 - 图像提供商: {settings.IMAGE_PROVIDER}")
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
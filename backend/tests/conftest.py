@@ -0,0 +1,35 @@
+"""
+pytest 公共配置
+
+导入 app 之前设置测试环境：必填配置使用占位值，数据库固定为临时目录中的 SQLite
+（不会连到 .env 中配置的开发数据库）。
+"""
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="petsphoto-tests-")
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_TEST_DIR, "uploads")
+os.environ["TEMP_DIR"] = os.path.join(_TEST_DIR, "uploads", "temp")
+
+import pytest  # noqa: E402
+
+from app.core.database import Base, SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """每个测试使用空表，结束后删除"""
+    import app.models  # noqa: F401  注册所有模型
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,134 @@
+"""provider 熔断器状态转换"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import circuit_breaker as breaker_module
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(breaker_module, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_WINDOW_SECONDS", 60)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_SLOW_CALL_SECONDS", 10)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_SLOW_CALL_RATE", 0.8)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_OPEN_SECONDS", 30)
+    monkeypatch.setattr(settings, "PROVIDER_BREAKER_HALF_OPEN_PROBES", 1)
+    return clock
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_stays_closed_below_min_requests(clock):
+    breaker = CircuitBreaker("a")
+    for _ in range(3):
+        breaker.record_failure()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_on_error_rate(clock):
+    breaker = CircuitBreaker("a")
+    breaker.record_success(1)
+    breaker.record_success(1)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.open_count == 1
+    assert breaker.snapshot()["health_score"] == 0.0
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = CircuitBreaker("a")
+    for _ in range(4):
+        breaker.record_success(15)
+
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window(clock):
+    breaker = CircuitBreaker("a")
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 61
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["window_requests"] == 1
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("a")
+    open_breaker(breaker)
+
+    clock.now += 29
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["half_open_in"] == 1.0
+
+    clock.now += 1
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # 探测名额已被占用
+    assert not breaker.allow_request()
+
+    breaker.record_success(1)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("a")
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.open_count == 2
+    assert not breaker.allow_request()
+
+
+def test_half_open_slow_probe_reopens(clock):
+    breaker = CircuitBreaker("a")
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_success(15)
+
+    assert breaker.state == OPEN
+
+
+def test_released_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker("a")
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.release()
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
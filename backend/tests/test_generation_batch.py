@@ -0,0 +1,118 @@
+"""POST /generations/batch 和 GET /generations/batch/{batch_id}：整批扣减积分和批次归属"""
+import threading
+
+import pytest
+from fastapi import Depends, FastAPI, Header
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user
+from app.api.v1.endpoints import generations
+from app.core.database import get_db
+from app.models.image import GenerationJob, GenerationStyle, UploadedImage
+from app.models.user import User
+
+STYLES = ["cartoon", "oil", "sketch"]
+
+
+def header_user(x_test_user: str = Header(...), db=Depends(get_db)) -> User:
+    """测试用认证：按请求头中的邮箱取用户"""
+    return db.query(User).filter(User.email == x_test_user).one()
+
+
+def make_app(authenticated: bool = True) -> FastAPI:
+    app = FastAPI()
+    app.include_router(generations.router, prefix="/generations")
+    if authenticated:
+        app.dependency_overrides[get_current_user] = header_user
+    return app
+
+
+@pytest.fixture
+def data(db):
+    db.add(User(email="alice@example.com", credits=5))
+    db.add(User(email="bob@example.com", credits=5))
+    db.add(UploadedImage(
+        id="img",
+        user_id="1",
+        filename="cat.jpg",
+        storage_path="/uploads/images/cat.jpg",
+        file_size=100,
+        width=10,
+        height=10,
+        mime_type="image/jpeg",
+    ))
+    for style_id in STYLES:
+        db.add(GenerationStyle(id=style_id, name=style_id, prompt_template=f"{style_id} style"))
+    db.commit()
+
+
+def create_batch(client: TestClient, email: str = "alice@example.com"):
+    return client.post(
+        "/generations/batch",
+        json={"source_image_id": "img", "style_ids": STYLES},
+        headers={"X-Test-User": email},
+    )
+
+
+def credits(db, email: str) -> int:
+    db.expire_all()
+    return db.query(User).filter(User.email == email).one().credits
+
+
+def test_create_batch_deducts_whole_batch(db, data):
+    client = TestClient(make_app())
+
+    response = create_batch(client)
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["total"] == 3
+    assert sorted(job["style_id"] for job in body["jobs"]) == sorted(STYLES)
+    assert credits(db, "alice@example.com") == 2
+
+
+def test_create_batch_insufficient_credits_creates_nothing(db, data):
+    client = TestClient(make_app())
+    assert create_batch(client).status_code == 201
+
+    response = create_batch(client)
+
+    assert response.status_code == 400
+    assert credits(db, "alice@example.com") == 2
+    assert db.query(GenerationJob).count() == 3
+
+
+def test_concurrent_batches_cannot_overdraw(db, data):
+    # 5 个积分只够一批：并发提交时只有一批成功，积分不会被扣成负数
+    app = make_app()
+    barrier = threading.Barrier(4)
+    statuses = []
+
+    def submit() -> None:
+        with TestClient(app) as client:
+            barrier.wait()
+            statuses.append(create_batch(client).status_code)
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201, 400, 400, 400]
+    assert credits(db, "alice@example.com") == 2
+    assert db.query(GenerationJob).count() == 3
+
+
+def test_get_batch_only_for_owner(db, data):
+    client = TestClient(make_app())
+    batch_id = create_batch(client).json()["batch_id"]
+
+    owner = client.get(f"/generations/batch/{batch_id}", headers={"X-Test-User": "alice@example.com"})
+    other = client.get(f"/generations/batch/{batch_id}", headers={"X-Test-User": "bob@example.com"})
+    anonymous = TestClient(make_app(authenticated=False)).get(f"/generations/batch/{batch_id}")
+
+    assert owner.status_code == 200
+    assert owner.json()["batch_id"] == batch_id
+    assert other.status_code == 404
+    assert anonymous.status_code == 403
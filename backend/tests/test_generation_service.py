@@ -0,0 +1,276 @@
+"""生成服务：任务上下文读取、状态写入和结果保存"""
+import asyncio
+import base64
+import os
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.storage import storage_key
+from app.models.image import (
+    GenerationJob,
+    GenerationStatus,
+    GenerationStyle,
+    UploadedImage,
+)
+from app.services import generation_service
+from app.services.generation_service import (
+    _add_renditions,
+    _attach_renditions,
+    _finish_job,
+    _load_job_context,
+    download_image,
+    parse_data_uri_header,
+    process_generation_job,
+    save_base64_image,
+)
+from app.services.storage_backend import get_storage
+
+
+def add_claimed_job(db, worker_id: str = "w1", **fields) -> GenerationJob:
+    fields.setdefault("status", GenerationStatus.PROCESSING)
+    fields.setdefault("style_id", "cartoon")
+    job = GenerationJob(
+        id="job",
+        user_id="1",
+        source_image_id="img",
+        claimed_by=worker_id,
+        started_at=datetime.utcnow(),
+        **fields
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+@pytest.fixture
+def source(db):
+    db.add(UploadedImage(
+        id="img",
+        user_id="1",
+        filename="cat.jpg",
+        storage_path="/uploads/images/cat.jpg",
+        file_size=100,
+        width=10,
+        height=10,
+        mime_type="image/jpeg",
+    ))
+    db.add(GenerationStyle(id="cartoon", name="卡通", prompt_template="cartoon style"))
+    db.commit()
+
+
+def test_load_job_context_for_owner(db, source):
+    add_claimed_job(db)
+
+    context = _load_job_context("job", "w1")
+
+    assert context["source_storage_path"] == "/uploads/images/cat.jpg"
+    assert context["prompt"] == "cartoon style"
+    assert context["cache_results"] is False
+    # 读取完成后不占用连接
+    assert engine.pool.checkedout() == 0
+
+
+def test_load_job_context_skips_other_worker(db, source):
+    add_claimed_job(db, worker_id="w2")
+
+    assert _load_job_context("job", "w1") is None
+    assert _load_job_context("missing", "w1") is None
+
+
+def test_load_job_context_missing_style(db, source):
+    add_claimed_job(db, style_id="gone")
+
+    with pytest.raises(Exception, match="风格不存在"):
+        _load_job_context("job", "w1")
+
+
+def test_finish_job_only_for_owner(db):
+    add_claimed_job(db)
+
+    assert not _finish_job("job", "w2", status=GenerationStatus.FAILED, error_message="x")
+    assert _finish_job("job", "w1", status=GenerationStatus.COMPLETED, result_image_url="/r.png")
+    # 已完成的任务不会再被覆盖
+    assert not _finish_job("job", "w1", status=GenerationStatus.FAILED, error_message="x")
+
+    db.expire_all()
+    job = db.get(GenerationJob, "job")
+    assert job.status == GenerationStatus.COMPLETED
+    assert job.result_image_url == "/r.png"
+    assert job.error_message is None
+
+
+def test_process_job_records_failure_for_owner(db):
+    # 源图片不存在：任务由本 worker 标记失败
+    add_claimed_job(db)
+
+    asyncio.run(process_generation_job("job", "w1"))
+
+    db.expire_all()
+    job = db.get(GenerationJob, "job")
+    assert job.status == GenerationStatus.FAILED
+    assert job.error_message == "源图片不存在"
+
+
+def test_process_job_leaves_reclaimed_job_alone(db, source):
+    add_claimed_job(db, worker_id="w2")
+
+    asyncio.run(process_generation_job("job", "w1"))
+
+    db.expire_all()
+    job = db.get(GenerationJob, "job")
+    assert job.status == GenerationStatus.PROCESSING
+    assert job.claimed_by == "w2"
+
+
+def test_parse_data_uri_header():
+    offset, mime_type = parse_data_uri_header("data:image/webp;base64,AAAA")
+
+    assert offset == len("data:image/webp;base64,")
+    assert mime_type == "image/webp"
+    assert parse_data_uri_header("data:;base64,AAAA")[1] is None
+
+
+@pytest.mark.parametrize("data_uri", ["data:image/png,AAAA", "AAAA", "data:image/png;base64"])
+def test_parse_data_uri_header_rejects_non_base64(data_uri):
+    with pytest.raises(Exception, match="无效的 base64"):
+        parse_data_uri_header(data_uri)
+
+
+def test_save_base64_image_in_chunks(tmp_path, monkeypatch):
+    # 块边界不按 4 字符对齐，并混入换行
+    monkeypatch.setattr(generation_service, "BASE64_CHUNK_CHARS", 10)
+    payload = os.urandom(1000)
+    encoded = base64.b64encode(payload).decode()
+    data_uri = "data:image/png;base64," + "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    offset, _ = parse_data_uri_header(data_uri)
+    path = tmp_path / "result.png"
+
+    written = save_base64_image(data_uri, str(path), offset)
+
+    assert written == len(payload)
+    assert path.read_bytes() == payload
+
+
+def test_save_base64_image_removes_partial_file(tmp_path):
+    path = tmp_path / "result.png"
+
+    with pytest.raises(Exception, match="解码生成图片失败"):
+        save_base64_image("AAAAA", str(path))
+
+    assert not path.exists()
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """让 download_image 使用返回固定响应的 HTTP 客户端"""
+    def serve(response: httpx.Response) -> None:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: response))
+        monkeypatch.setattr(generation_service.http_clients, "get", lambda name: client)
+    return serve
+
+
+async def chunks(count: int, size: int = 1024):
+    for _ in range(count):
+        yield b"x" * size
+
+
+def test_download_image_fixes_extension(tmp_path, serve):
+    serve(httpx.Response(200, headers={"content-type": "image/webp"}, content=b"webp-data"))
+
+    path = asyncio.run(download_image("https://cdn.example.com/a", str(tmp_path / "result.jpg")))
+
+    assert path == str(tmp_path / "result.webp")
+    assert open(path, "rb").read() == b"webp-data"
+    assert os.listdir(tmp_path) == ["result.webp"]
+
+
+def test_download_image_rejects_declared_oversize(tmp_path, serve, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_RESULT_FILE_SIZE", 100)
+    serve(httpx.Response(200, headers={"content-type": "image/png"}, content=b"x" * 101))
+
+    with pytest.raises(Exception, match="大小超过限制"):
+        asyncio.run(download_image("https://cdn.example.com/a", str(tmp_path / "result.png")))
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_image_stops_streaming_oversize(tmp_path, serve, monkeypatch):
+    # 没有 Content-Length（分块传输）时按实际读取的字节数中止
+    monkeypatch.setattr(settings, "MAX_RESULT_FILE_SIZE", 4096)
+    serve(httpx.Response(200, headers={"content-type": "image/png"}, content=chunks(10)))
+
+    with pytest.raises(Exception, match="大小超过限制"):
+        asyncio.run(download_image("https://cdn.example.com/a", str(tmp_path / "result.png")))
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_image_rejects_non_image(tmp_path, serve):
+    serve(httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html>"))
+
+    with pytest.raises(Exception, match="不是图片"):
+        asyncio.run(download_image("https://cdn.example.com/a", str(tmp_path / "result.png")))
+
+    assert os.listdir(tmp_path) == []
+
+
+RESULT_URL = "/uploads/generated/ab/cd/result_1.png"
+RENDITIONS = {"thumb": {"webp": "/uploads/generated/ab/cd/result_1_thumb.webp"}}
+
+
+def store(storage_path: str, tmp_path) -> None:
+    local = tmp_path / os.path.basename(storage_path)
+    local.write_bytes(b"data")
+    get_storage().put_file(str(local), storage_key(storage_path))
+
+
+def test_attach_renditions_only_to_same_result(db):
+    add_claimed_job(db, status=GenerationStatus.COMPLETED, result_image_url=RESULT_URL)
+
+    assert not _attach_renditions("job", "/uploads/generated/ab/cd/other.png", RENDITIONS)
+    assert _attach_renditions("job", RESULT_URL, RENDITIONS)
+
+    db.expire_all()
+    assert db.get(GenerationJob, "job").renditions == RENDITIONS
+
+
+@pytest.fixture
+def fake_renditions(monkeypatch, tmp_path):
+    """派生版本直接写入存储，不经过进程池"""
+    published = []
+
+    async def create(source_path, stem):
+        for formats in RENDITIONS.values():
+            for path in formats.values():
+                store(path, tmp_path)
+        return RENDITIONS
+
+    monkeypatch.setattr(generation_service, "create_result_renditions", create)
+    monkeypatch.setattr(generation_service.job_event_broker, "publish", published.append)
+    store(RESULT_URL, tmp_path)
+    return published
+
+
+def test_add_renditions_after_completion(db, fake_renditions):
+    add_claimed_job(db, status=GenerationStatus.COMPLETED, result_image_url=RESULT_URL)
+
+    asyncio.run(_add_renditions("job", RESULT_URL))
+
+    db.expire_all()
+    assert db.get(GenerationJob, "job").renditions == RENDITIONS
+    assert fake_renditions == ["job"]
+
+
+def test_add_renditions_discards_files_for_replaced_result(db, fake_renditions):
+    add_claimed_job(db, status=GenerationStatus.COMPLETED, result_image_url="/uploads/generated/ab/cd/newer.png")
+
+    asyncio.run(_add_renditions("job", RESULT_URL))
+
+    db.expire_all()
+    assert db.get(GenerationJob, "job").renditions is None
+    assert not get_storage().exists(storage_key(RENDITIONS["thumb"]["webp"]))
+    assert fake_renditions == []
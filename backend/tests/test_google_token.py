@@ -0,0 +1,111 @@
+"""GoogleAIClient access token：共享刷新、提前后台刷新"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.image_generation_client import GoogleAIClient
+
+
+class FakeCredentials:
+    """模拟 google-auth 凭证：refresh 是阻塞调用"""
+
+    def __init__(self, token=None, expires_in=None, fail=False):
+        self.token = token
+        self.expiry = datetime.utcnow() + expires_in if expires_in is not None else None
+        self.fail = fail
+        self.refreshes = 0
+        self.threads = set()
+
+    @property
+    def valid(self) -> bool:
+        return bool(self.token) and (self.expiry is None or self.expiry > datetime.utcnow())
+
+    def refresh(self, request) -> None:
+        self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        if self.fail:
+            raise RuntimeError("refresh failed")
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+@pytest.fixture
+def make_client():
+    def make(credentials: FakeCredentials) -> GoogleAIClient:
+        client = GoogleAIClient(api_key="", project_id="project")
+        client.credentials = credentials
+        client._auth_request = object()
+        return client
+    return make
+
+
+def test_valid_token_is_not_refreshed(make_client):
+    credentials = FakeCredentials("token-0", timedelta(hours=1))
+    client = make_client(credentials)
+
+    async def run():
+        token = await client._get_access_token()
+        client.close()
+        return token
+
+    assert asyncio.run(run()) == "token-0"
+    assert credentials.refreshes == 0
+
+
+def test_expired_token_refreshed_once_for_concurrent_callers(make_client):
+    credentials = FakeCredentials("old", timedelta(minutes=-1))
+    client = make_client(credentials)
+
+    async def run():
+        tokens = await asyncio.gather(*(client._get_access_token() for _ in range(5)))
+        client.close()
+        return tokens
+
+    assert asyncio.run(run()) == ["token-1"] * 5
+    assert credentials.refreshes == 1
+    # 阻塞的刷新在线程池中执行，不占用事件循环线程
+    assert threading.get_ident() not in credentials.threads
+
+
+def test_expiring_token_returned_while_refreshing_in_background(make_client):
+    credentials = FakeCredentials("current", timedelta(minutes=2))
+    client = make_client(credentials)
+
+    async def run():
+        token = await client._get_access_token()
+        await client._refresh_task
+        client.close()
+        return token
+
+    assert asyncio.run(run()) == "current"
+    assert credentials.refreshes == 1
+    assert credentials.token == "token-1"
+
+
+def test_refresh_failure_returns_no_token(make_client):
+    client = make_client(FakeCredentials(fail=True))
+
+    async def run():
+        token = await client._get_access_token()
+        client.close()
+        return token
+
+    assert asyncio.run(run()) is None
+
+
+def test_close_stops_background_refresh(make_client):
+    client = make_client(FakeCredentials("token-0", timedelta(hours=1)))
+
+    async def run():
+        await client._get_access_token()
+        refresher = client._refresher_task
+        assert refresher is not None and not refresher.done()
+        client.close()
+        await asyncio.gather(refresher, return_exceptions=True)
+        return refresher
+
+    assert asyncio.run(run()).cancelled()
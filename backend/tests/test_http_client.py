@@ -0,0 +1,52 @@
+"""共享 HTTP 客户端：预创建和超时"""
+import asyncio
+
+import httpx
+
+from app.core.config import settings
+from app.services.http_client import HTTPClientManager, request_timeout
+
+
+def test_start_creates_fallback_clients(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "google_ai")
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER_FALLBACKS", "openrouter, stability_ai,google_ai")
+    manager = HTTPClientManager()
+
+    manager.start()
+
+    assert list(manager._clients) == ["google_ai", "openrouter", "stability_ai", "download"]
+    asyncio.run(manager.aclose())
+    assert manager._clients == {}
+
+
+def test_get_reuses_client():
+    manager = HTTPClientManager()
+
+    client = manager.get("replicate")
+
+    assert manager.get("replicate") is client
+    asyncio.run(manager.aclose())
+
+
+def test_request_timeout_keeps_connect_timeout():
+    timeout = request_timeout(120)
+
+    assert timeout.read == 120
+    assert timeout.connect == settings.HTTP_CONNECT_TIMEOUT
+
+
+def test_per_request_timeout_reaches_transport():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.update(request.extensions["timeout"])
+        return httpx.Response(200)
+
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await client.get("https://example.com", timeout=request_timeout(90))
+
+    asyncio.run(call())
+
+    assert seen["read"] == 90
+    assert seen["connect"] == settings.HTTP_CONNECT_TIMEOUT
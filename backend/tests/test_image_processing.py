@@ -0,0 +1,102 @@
+"""源图片规范化：按 provider 规格缩放和裁切"""
+import pytest
+from PIL import Image
+
+from app.services.image_processing import (
+    SDXL_DIMENSIONS,
+    SOURCE_SPECS,
+    available_rendition_formats,
+    closest_dimensions,
+    normalize_image,
+    render_renditions,
+    source_spec,
+)
+
+
+def make_source(tmp_path, size, exif_orientation=None) -> str:
+    path = tmp_path / "source.jpg"
+    image = Image.new("RGB", size, (200, 120, 40))
+    exif = Image.Exif()
+    if exif_orientation:
+        exif[0x0112] = exif_orientation
+    image.save(path, "JPEG", exif=exif)
+    return str(path)
+
+
+def normalize(tmp_path, size, provider, **kwargs):
+    target = tmp_path / "derived.jpg"
+    result = normalize_image(make_source(tmp_path, size, **kwargs), str(target), SOURCE_SPECS[source_spec(provider)])
+    with Image.open(target) as image:
+        assert image.size == (result["width"], result["height"])
+        assert not image.getexif()
+    return result["width"], result["height"]
+
+
+@pytest.mark.parametrize("size, expected", [
+    ((1000, 1000), (1024, 1024)),
+    ((4000, 3000), (1152, 896)),
+    ((1920, 1080), (1344, 768)),
+    ((3000, 1000), (1536, 640)),
+    ((1080, 1920), (768, 1344)),
+])
+def test_closest_sdxl_dimensions(size, expected):
+    assert closest_dimensions(size, SDXL_DIMENSIONS) == expected
+
+
+def test_stability_source_snaps_to_sdxl_size(tmp_path):
+    assert normalize(tmp_path, (4032, 3024), "stability_ai") == (1152, 896)
+    # 小图放大到允许的尺寸
+    assert normalize(tmp_path, (600, 800), "stability_ai") == (896, 1152)
+
+
+def test_gemini_source_keeps_two_by_two_tiles(tmp_path):
+    assert normalize(tmp_path, (4000, 3000), "google_ai") == (1536, 1152)
+    assert normalize(tmp_path, (4000, 3000), "openrouter") == (1536, 1152)
+    # 不放大小图
+    assert normalize(tmp_path, (800, 600), "google_ai") == (800, 600)
+
+
+def test_replicate_source_is_multiple_of_eight(tmp_path):
+    width, height = normalize(tmp_path, (3000, 2001), "replicate")
+
+    assert max(width, height) <= 1024
+    assert width % 8 == 0 and height % 8 == 0
+    assert (width, height) == (1024, 680)
+
+
+def test_exif_orientation_applied(tmp_path):
+    # orientation 6：需要顺时针旋转 90°，宽高互换
+    assert normalize(tmp_path, (4000, 3000), "google_ai", exif_orientation=6) == (1152, 1536)
+
+
+def test_unknown_provider_uses_default_spec(tmp_path):
+    assert source_spec("unknown") == "default"
+    assert normalize(tmp_path, (2048, 1024), "unknown") == (1024, 512)
+
+
+def test_render_renditions_sizes_and_formats(tmp_path):
+    source = tmp_path / "result.png"
+    Image.new("RGB", (1200, 900), (10, 20, 30)).save(source)
+    formats = available_rendition_formats()
+
+    renditions = render_renditions(str(source), str(tmp_path), "result", formats)
+
+    sizes = {(item["size"], item["format"]): (item["width"], item["height"]) for item in renditions}
+    for name in formats:
+        assert sizes[("thumb", name)] == (256, 192)
+        assert sizes[("medium", name)] == (768, 576)
+        assert sizes[("full", name)] == (1200, 900)
+    for item in renditions:
+        with Image.open(item["path"]) as image:
+            assert image.size == (item["width"], item["height"])
+
+
+def test_render_renditions_skips_sizes_larger_than_source(tmp_path):
+    source = tmp_path / "small.png"
+    Image.new("RGBA", (200, 100), (10, 20, 30, 128)).save(source)
+
+    renditions = render_renditions(str(source), str(tmp_path), "small", ["webp"])
+
+    assert [(item["size"], item["width"]) for item in renditions] == [("full", 200)]
+    with Image.open(renditions[0]["path"]) as image:
+        assert image.mode == "RGBA"
@@ -0,0 +1,113 @@
+"""POST /images/upload：分块读取和大小限制"""
+import io
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api.v1.endpoints import images
+from app.core.config import settings
+from app.core.storage import storage_key
+from app.models.image import ImageBlob, UploadedImage
+from app.services.storage_backend import get_storage
+from app.services.upload_storage import release_blob
+
+
+@pytest.fixture
+def client(db):
+    os.makedirs(settings.TEMP_DIR, exist_ok=True)
+    app = FastAPI()
+    app.include_router(images.router, prefix="/images")
+    return TestClient(app)
+
+
+def png_bytes(seed: int = 0, size: int = 256) -> bytes:
+    """不可压缩的 PNG（超过最小 1KB 限制）"""
+    image = Image.effect_noise((size, size), 50 + seed).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def multipart_body(data: bytes, filename: str = "cat.png", content_type: str = "image/png"):
+    boundary = "test-boundary"
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def test_upload_image(client, db):
+    data = png_bytes()
+
+    response = client.post("/images/upload", files={"file": ("cat.png", data, "image/png")})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["width"] == 256
+    assert body["file_size"] == len(data)
+    image = db.get(UploadedImage, body["id"])
+    assert image.mime_type == "image/png"
+    assert os.listdir(settings.TEMP_DIR) == []
+
+
+def test_duplicate_upload_reuses_blob(client, db):
+    data = png_bytes(seed=1)
+
+    first = client.post("/images/upload", files={"file": ("a.png", data, "image/png")}).json()
+    second = client.post("/images/upload", files={"file": ("b.png", data, "image/png")}).json()
+
+    assert first["id"] != second["id"]
+    assert first["storage_path"] == second["storage_path"]
+    blob = db.query(ImageBlob).one()
+    assert blob.ref_count == 2
+
+    # 两个引用都释放后才删除文件
+    key = storage_key(blob.storage_path)
+    release_blob(db, blob.content_hash)
+    db.commit()
+    assert get_storage().exists(key)
+    release_blob(db, blob.content_hash)
+    db.commit()
+    assert not get_storage().exists(key)
+
+
+def test_upload_rejects_unsupported_type(client, db):
+    response = client.post("/images/upload", files={"file": ("cat.gif", b"GIF89a", "image/gif")})
+
+    assert response.status_code == 400
+    assert db.query(ImageBlob).count() == 0
+
+
+def test_upload_rejects_declared_oversize(client, db, monkeypatch):
+    # 文件本身未超限，但 Content-Length 超过了请求体上限
+    data = png_bytes()
+    monkeypatch.setattr(images, "MAX_FILE_SIZE", len(data))
+    monkeypatch.setattr(images, "MULTIPART_OVERHEAD", 0)
+    body, content_type = multipart_body(data)
+
+    response = client.post("/images/upload", content=body, headers={"Content-Type": content_type})
+
+    assert response.status_code == 413
+    assert db.query(UploadedImage).count() == 0
+
+
+def test_upload_rejects_oversize_chunked_body(client, db, monkeypatch):
+    # 没有 Content-Length（分块传输）时由读取文件时的累计大小拒绝
+    monkeypatch.setattr(images, "MAX_FILE_SIZE", 4096)
+    body, content_type = multipart_body(png_bytes())
+
+    def chunks():
+        for start in range(0, len(body), 1000):
+            yield body[start:start + 1000]
+
+    response = client.post("/images/upload", content=chunks(), headers={"Content-Type": content_type})
+
+    assert response.status_code == 413
+    assert db.query(UploadedImage).count() == 0
+    assert db.query(ImageBlob).count() == 0
+    assert os.listdir(settings.TEMP_DIR) == []
@@ -0,0 +1,70 @@
+"""上传图片验证：格式、尺寸和损坏检测"""
+import pytest
+from PIL import Image, JpegImagePlugin
+
+from app.services import image_validation
+from app.services.image_validation import ImageValidationError, inspect_image
+
+
+def save(tmp_path, name: str, image_format: str, size=(320, 200), **params) -> str:
+    path = tmp_path / name
+    Image.effect_noise(size, 60).convert("RGB").save(path, image_format, **params)
+    return str(path)
+
+
+@pytest.mark.parametrize("name, image_format, mime_type", [
+    ("a.jpg", "JPEG", "image/jpeg"),
+    ("a.png", "PNG", "image/png"),
+    ("a.webp", "WEBP", "image/webp"),
+])
+def test_inspect_image(tmp_path, name, image_format, mime_type):
+    info = inspect_image(save(tmp_path, name, image_format))
+
+    assert info == {"format": image_format, "mime_type": mime_type, "width": 320, "height": 200}
+
+
+def test_jpeg_checked_in_draft_mode(tmp_path, monkeypatch):
+    path = save(tmp_path, "a.jpg", "JPEG", size=(800, 800))
+    drafts = []
+    original = JpegImagePlugin.JpegImageFile.draft
+
+    def record(self, mode, size):
+        drafts.append(size)
+        return original(self, mode, size)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", record)
+
+    assert inspect_image(path)["width"] == 800
+    assert drafts == [(100, 100)]
+
+
+@pytest.mark.parametrize("name, image_format", [("a.jpg", "JPEG"), ("a.png", "PNG")])
+def test_truncated_image_is_rejected(tmp_path, name, image_format):
+    path = save(tmp_path, name, image_format)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    with pytest.raises(ImageValidationError, match="损坏"):
+        inspect_image(path)
+
+
+def test_unsupported_format_is_rejected(tmp_path):
+    with pytest.raises(ImageValidationError, match="不支持的图片格式"):
+        inspect_image(save(tmp_path, "a.gif", "GIF"))
+
+
+def test_not_an_image(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(b"not an image" * 100)
+
+    with pytest.raises(ImageValidationError, match="无法识别"):
+        inspect_image(str(path))
+
+
+def test_too_many_pixels(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_validation, "MAX_IMAGE_PIXELS", 320 * 200 - 1)
+
+    with pytest.raises(ImageValidationError, match="像素过多"):
+        inspect_image(save(tmp_path, "a.png", "PNG"))
@@ -0,0 +1,220 @@
+"""任务状态推送：SSE 去重和长轮询"""
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.models.image import GenerationJob, GenerationStatus
+from app.schemas import generation as generation_schemas
+from app.services import job_events
+from app.services.job_events import job_event_broker, load_job_state, stream_job_events
+
+RESULT_URL = "/uploads/generated/ab/cd/result_1.png"
+
+
+@pytest.fixture(autouse=True)
+def signed_urls(monkeypatch):
+    """模拟预签名 URL：每次读取生成不同的签名"""
+    signatures = itertools.count()
+    monkeypatch.setattr(
+        generation_schemas,
+        "public_url",
+        lambda path: f"https://cdn.example.com{path}?sig={next(signatures)}" if path else path,
+    )
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """统计 SSE / 长轮询读取任务的次数"""
+    calls = []
+
+    def counting_load(job_id):
+        calls.append(job_id)
+        return load_job_state(job_id)
+
+    monkeypatch.setattr(job_events, "load_job_state", counting_load)
+    return calls
+
+
+def add_job(db, **fields) -> GenerationJob:
+    fields.setdefault("status", GenerationStatus.PROCESSING)
+    job = GenerationJob(id="job", user_id="1", source_image_id="img", style_id="cartoon", **fields)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def update_job(db, **fields) -> None:
+    db.query(GenerationJob).filter(GenerationJob.id == "job").update(fields)
+    db.commit()
+
+
+def parse_events(chunks) -> list:
+    events = []
+    for chunk in chunks:
+        if chunk.startswith("event: "):
+            name, data = chunk.strip().split("\n")
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def settle() -> None:
+    """等待推送方处理完通知并读取数据库"""
+    await asyncio.sleep(0.1)
+
+
+def test_state_key_ignores_presigned_urls(db):
+    add_job(db, result_image_url=RESULT_URL)
+
+    first_key, first = load_job_state("job")
+    second_key, second = load_job_state("job")
+
+    assert first["result_image_url"] != second["result_image_url"]
+    assert first_key == second_key
+    assert load_job_state("missing") is None
+
+
+def test_stream_skips_reads_without_changes(db, reads):
+    add_job(db, result_image_url=RESULT_URL)
+
+    async def run():
+        chunks = []
+
+        async def consume():
+            async for chunk in stream_job_events("job", load_job_state("job")):
+                chunks.append(chunk)
+
+        task = asyncio.create_task(consume())
+        await settle()
+        # 任务没有变化：每次通知都会读取数据库，但签名变化不产生新事件
+        for _ in range(3):
+            job_event_broker.publish("job")
+            await settle()
+        update_job(db, status=GenerationStatus.COMPLETED)
+        job_event_broker.publish("job")
+        await asyncio.wait_for(task, timeout=2)
+        return chunks
+
+    chunks = asyncio.run(run())
+
+    assert chunks[0].startswith("retry: ")
+    assert [(name, data["status"]) for name, data in parse_events(chunks)] == [
+        ("status", "processing"),
+        ("status", "completed"),
+    ]
+    assert len(reads) == 4
+
+
+def test_stream_pushes_rendition_changes(db):
+    add_job(db, result_image_url=RESULT_URL)
+    renditions = {"thumb": {"webp": "/uploads/generated/ab/cd/result_1_thumb.webp"}}
+
+    async def run():
+        chunks = []
+
+        async def consume():
+            async for chunk in stream_job_events("job", load_job_state("job")):
+                chunks.append(chunk)
+
+        task = asyncio.create_task(consume())
+        await settle()
+        update_job(db, renditions=renditions)
+        job_event_broker.publish("job")
+        await settle()
+        update_job(db, status=GenerationStatus.FAILED, error_message="上游错误")
+        job_event_broker.publish("job")
+        await asyncio.wait_for(task, timeout=2)
+        return chunks
+
+    events = parse_events(asyncio.run(run()))
+
+    assert len(events) == 3
+    assert events[0][1]["renditions"] is None
+    assert events[1][1]["renditions"]["thumb"]["webp"].startswith("https://cdn.example.com/")
+    assert events[2][1]["error_message"] == "上游错误"
+
+
+def test_stream_ends_after_max_lifetime(db, monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_EVENTS_MAX_STREAM_SECONDS", 0)
+    add_job(db)
+
+    async def run():
+        return [chunk async for chunk in stream_job_events("job", load_job_state("job"))]
+
+    chunks = asyncio.run(asyncio.wait_for(run(), timeout=2))
+
+    assert [name for name, _ in parse_events(chunks)] == ["status"]
+
+
+def test_stream_reports_missing_job(db):
+    add_job(db)
+
+    async def run():
+        chunks = []
+
+        async def consume():
+            async for chunk in stream_job_events("job", load_job_state("job")):
+                chunks.append(chunk)
+
+        task = asyncio.create_task(consume())
+        await settle()
+        db.query(GenerationJob).delete()
+        db.commit()
+        job_event_broker.publish("job")
+        await asyncio.wait_for(task, timeout=2)
+        return chunks
+
+    events = parse_events(asyncio.run(run()))
+
+    assert [name for name, _ in events] == ["status", "error"]
+
+
+def test_wait_returns_on_status_change(db):
+    add_job(db, status=GenerationStatus.PENDING)
+
+    async def run():
+        waiter = asyncio.create_task(job_events.wait_for_job_change("job", timeout=10))
+        await settle()
+        update_job(db, status=GenerationStatus.PROCESSING)
+        job_event_broker.publish("job")
+        start = time.monotonic()
+        snapshot = await asyncio.wait_for(waiter, timeout=2)
+        return snapshot, time.monotonic() - start
+
+    snapshot, waited = asyncio.run(run())
+
+    assert snapshot["status"] == "processing"
+    assert waited < 1
+
+
+def test_wait_ignores_notifications_without_changes(db, reads):
+    add_job(db, result_image_url=RESULT_URL)
+
+    async def run():
+        waiter = asyncio.create_task(job_events.wait_for_job_change("job", timeout=0.5))
+        await settle()
+        job_event_broker.publish("job")
+        await settle()
+        return await asyncio.wait_for(waiter, timeout=2)
+
+    snapshot = asyncio.run(run())
+
+    # 通知后读取了任务，但没有变化，等到超时才返回当前数据
+    assert snapshot["status"] == "processing"
+    assert len(reads) >= 2
+
+
+def test_wait_returns_terminal_job_immediately(db, reads):
+    add_job(db, status=GenerationStatus.COMPLETED, result_image_url=RESULT_URL)
+
+    snapshot = asyncio.run(asyncio.wait_for(job_events.wait_for_job_change("job", timeout=10), timeout=1))
+
+    assert snapshot["status"] == "completed"
+    assert len(reads) == 1
+
+
+def test_wait_for_missing_job(db):
+    assert asyncio.run(job_events.wait_for_job_change("missing", timeout=10)) is None
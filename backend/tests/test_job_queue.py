@@ -0,0 +1,124 @@
+"""生成任务队列：认领、续租和回收"""
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.image import GenerationJob, GenerationStatus
+from app.services.job_queue import claim_next_job, renew_job_lease, requeue_stale_jobs
+
+
+def add_job(db, job_id: str, created_at: datetime, **fields) -> GenerationJob:
+    fields.setdefault("status", GenerationStatus.PENDING)
+    job = GenerationJob(
+        id=job_id,
+        user_id="1",
+        source_image_id="img",
+        style_id="cartoon",
+        created_at=created_at,
+        **fields
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_claim_in_creation_order(db):
+    now = datetime.utcnow()
+    add_job(db, "second", now)
+    add_job(db, "first", now - timedelta(seconds=5))
+
+    assert claim_next_job(db, "w1") == "first"
+    assert claim_next_job(db, "w2") == "second"
+    assert claim_next_job(db, "w1") is None
+
+    db.expire_all()
+    job = db.get(GenerationJob, "first")
+    assert job.status == GenerationStatus.PROCESSING
+    assert job.claimed_by == "w1"
+    assert job.attempts == 1
+    assert job.started_at is not None
+    assert job.lease_expires_at > job.started_at
+
+
+def test_claimed_job_is_not_claimed_again(db):
+    add_job(db, "job", datetime.utcnow())
+
+    assert claim_next_job(db, "w1") == "job"
+    assert claim_next_job(db, "w2") is None
+
+
+def test_renew_lease_only_for_owner(db):
+    add_job(db, "job", datetime.utcnow())
+    claim_next_job(db, "w1")
+    db.expire_all()
+    claimed = db.get(GenerationJob, "job")
+    started_at, lease_expires_at = claimed.started_at, claimed.lease_expires_at
+
+    assert renew_job_lease(db, "job", "w1")
+    assert not renew_job_lease(db, "job", "w2")
+
+    # 续租只推后租约，started_at 保持认领时间
+    db.expire_all()
+    job = db.get(GenerationJob, "job")
+    assert job.started_at == started_at
+    assert job.lease_expires_at >= lease_expires_at
+
+
+def test_requeue_stale_jobs(db):
+    stale = datetime.utcnow() - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS + 60)
+    add_job(db, "stale", stale)
+    add_job(db, "fresh", datetime.utcnow())
+    claim_next_job(db, "w1")
+    claim_next_job(db, "w1")
+    db.query(GenerationJob).filter(GenerationJob.id == "stale").update(
+        {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    assert requeue_stale_jobs(db) == 1
+
+    db.expire_all()
+    job = db.get(GenerationJob, "stale")
+    assert job.status == GenerationStatus.PENDING
+    assert job.claimed_by is None
+    assert job.started_at is None
+    assert job.lease_expires_at is None
+    assert db.get(GenerationJob, "fresh").status == GenerationStatus.PROCESSING
+
+    # 重新入队的任务可以再次认领，认领次数累计
+    assert claim_next_job(db, "w2") == "stale"
+    db.expire_all()
+    assert db.get(GenerationJob, "stale").attempts == 2
+
+
+def test_requeue_legacy_job_without_lease(db):
+    # 新增 lease_expires_at 之前认领的任务按 started_at 判断
+    stale = datetime.utcnow() - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS + 60)
+    add_job(db, "legacy", stale, status=GenerationStatus.PROCESSING, claimed_by="w1", started_at=stale)
+    add_job(db, "running", stale, status=GenerationStatus.PROCESSING, claimed_by="w1", started_at=datetime.utcnow())
+
+    assert requeue_stale_jobs(db) == 1
+
+    db.expire_all()
+    assert db.get(GenerationJob, "legacy").status == GenerationStatus.PENDING
+    assert db.get(GenerationJob, "running").status == GenerationStatus.PROCESSING
+
+
+def test_requeue_fails_job_after_max_attempts(db):
+    stale = datetime.utcnow() - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS + 60)
+    add_job(
+        db,
+        "poison",
+        stale,
+        status=GenerationStatus.PROCESSING,
+        claimed_by="w1",
+        started_at=stale,
+        attempts=settings.GENERATION_JOB_MAX_ATTEMPTS,
+    )
+
+    assert requeue_stale_jobs(db) == 1
+
+    db.expire_all()
+    job = db.get(GenerationJob, "poison")
+    assert job.status == GenerationStatus.FAILED
+    assert job.error_message
+    assert claim_next_job(db, "w2") is None
@@ -0,0 +1,75 @@
+"""源图片载荷缓存：LRU 和字节数上限"""
+import asyncio
+import base64
+
+import pytest
+
+from app.services import payload_cache
+from app.services.payload_cache import (
+    ENCODING_BASE64,
+    ENCODING_RAW,
+    SourcePayloadCache,
+    load_source_payload,
+)
+
+
+def test_evicts_least_recently_used_within_byte_limit():
+    cache = SourcePayloadCache(max_bytes=10, max_entry_bytes=10)
+    cache.put(("a", "raw"), b"1234")
+    cache.put(("b", "raw"), b"1234")
+    assert cache.get(("a", "raw")) == b"1234"  # a 变为最近使用
+
+    cache.put(("c", "raw"), b"1234")
+
+    assert cache.total_bytes == 8
+    assert cache.get(("b", "raw")) is None
+    assert cache.get(("a", "raw")) == b"1234"
+    assert cache.get(("c", "raw")) == b"1234"
+
+
+def test_replacing_entry_updates_size():
+    cache = SourcePayloadCache(max_bytes=10, max_entry_bytes=10)
+    cache.put(("a", "raw"), b"12345678")
+    cache.put(("a", "raw"), b"12")
+
+    assert cache.total_bytes == 2
+
+
+def test_oversized_entry_is_not_cached():
+    cache = SourcePayloadCache(max_bytes=100, max_entry_bytes=4)
+    cache.put(("a", "raw"), b"1234")
+
+    cache.put(("big", "raw"), b"12345")
+
+    assert cache.get(("big", "raw")) is None
+    assert cache.get(("a", "raw")) == b"1234"
+    assert cache.total_bytes == 4
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = SourcePayloadCache(max_bytes=1024, max_entry_bytes=1024)
+    monkeypatch.setattr(payload_cache, "source_payload_cache", cache)
+    return cache
+
+
+def test_load_source_payload_reuses_encoded_payload(tmp_path, cache):
+    path = tmp_path / "source.jpg"
+    path.write_bytes(b"image-bytes")
+
+    first = asyncio.run(load_source_payload(str(path), ENCODING_BASE64, "img:derived"))
+    path.write_bytes(b"changed")
+    second = asyncio.run(load_source_payload(str(path), ENCODING_BASE64, "img:derived"))
+
+    assert first == second == base64.b64encode(b"image-bytes").decode()
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 不同编码格式分别缓存
+    assert asyncio.run(load_source_payload(str(path), ENCODING_RAW, "img:derived")) == b"changed"
+
+
+def test_load_source_payload_without_key_is_not_cached(tmp_path, cache):
+    path = tmp_path / "source.jpg"
+    path.write_bytes(b"image-bytes")
+
+    assert asyncio.run(load_source_payload(str(path))) == b"image-bytes"
+    assert cache.total_bytes == 0
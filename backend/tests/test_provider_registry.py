@@ -0,0 +1,67 @@
+"""provider 客户端注册表：缓存、配置变化时替换"""
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.services import provider_registry
+from app.services.image_generation_client import StabilityAIClient
+from app.services.provider_registry import ImageClientRegistry
+
+
+@pytest.fixture
+def stability(monkeypatch):
+    monkeypatch.setattr(settings, "STABILITY_AI_API_KEY", "key-1")
+
+
+def test_client_is_cached(stability):
+    registry = ImageClientRegistry()
+
+    client = registry.get("stability_ai")
+
+    assert isinstance(client, StabilityAIClient)
+    assert registry.get("stability_ai") is client
+
+
+def test_config_change_replaces_and_closes_client(stability, monkeypatch):
+    registry = ImageClientRegistry()
+    old = registry.get("stability_ai")
+    closed = []
+    monkeypatch.setattr(old, "close", lambda: closed.append(old))
+
+    monkeypatch.setattr(settings, "STABILITY_AI_API_KEY", "key-2")
+    new = registry.get("stability_ai")
+
+    assert new is not old
+    assert closed == [old]
+    assert registry.get("stability_ai") is new
+
+
+def test_service_account_rotation_changes_fingerprint(tmp_path):
+    path = tmp_path / "sa.json"
+    path.write_text("{}")
+    kwargs = {"service_account_path": str(path)}
+    before = provider_registry._config_fingerprint("k", kwargs)
+
+    path.write_text('{"rotated": true}')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert provider_registry._config_fingerprint("k", kwargs) != before
+
+
+def test_clear_closes_all_clients(stability, monkeypatch):
+    registry = ImageClientRegistry()
+    client = registry.get("stability_ai")
+    closed = []
+    monkeypatch.setattr(client, "close", lambda: closed.append(client))
+
+    registry.clear()
+
+    assert closed == [client]
+    assert registry.get("stability_ai") is not client
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        ImageClientRegistry().get("nope")
@@ -0,0 +1,182 @@
+"""provider 路由：故障切换和对冲请求"""
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from app.core.config import settings
+from app.services import provider_router as router_module
+from app.services.circuit_breaker import OPEN
+from app.services.image_generation_client import ProviderError
+from app.services.provider_router import HedgeBudget, ProviderChainError, ProviderRouter
+
+
+class FakeProviders:
+    """按预设结果响应的 provider：outcomes[provider] 依次为异常或返回值"""
+
+    def __init__(self, **outcomes: List):
+        self.outcomes: Dict[str, List] = {name: list(items) for name, items in outcomes.items()}
+        self.calls: List[str] = []
+
+    async def __call__(self, provider: str, client) -> Dict:
+        self.calls.append(provider)
+        outcome = self.outcomes[provider].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    """路由只需要 registry 能返回客户端，不发出真实请求"""
+    monkeypatch.setattr(router_module.image_client_registry, "get", lambda provider: object())
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_ENABLED", False)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_BASE_DELAY", 0.0)
+
+
+def generate(router: ProviderRouter, chain: List[str], providers: FakeProviders):
+    return asyncio.run(router.generate(chain, providers))
+
+
+def test_first_provider_success():
+    providers = FakeProviders(a=[{"image_url": "a"}], b=[])
+
+    provider, result, attempts = generate(ProviderRouter(), ["a", "b"], providers)
+
+    assert (provider, result) == ("a", {"image_url": "a"})
+    assert providers.calls == ["a"]
+    assert [record["provider"] for record in attempts] == ["a"]
+
+
+def test_failover_to_next_provider():
+    providers = FakeProviders(
+        a=[ProviderError("额度不足", "a", status_code=402)],
+        b=[{"image_url": "b"}],
+    )
+
+    provider, result, attempts = generate(ProviderRouter(), ["a", "b"], providers)
+
+    assert (provider, result) == ("b", {"image_url": "b"})
+    assert providers.calls == ["a", "b"]
+    assert attempts[0]["status_code"] == 402
+    assert attempts[0]["retryable"] is False
+    assert attempts[1]["provider"] == "b"
+
+
+def test_all_providers_fail():
+    providers = FakeProviders(
+        a=[ProviderError("a 失败", "a", status_code=400)],
+        b=[ValueError("b 失败")],
+    )
+
+    with pytest.raises(ProviderChainError) as exc_info:
+        generate(ProviderRouter(), ["a", "b"], providers)
+
+    assert str(exc_info.value) == "b 失败"
+    assert [record["provider"] for record in exc_info.value.attempts] == ["a", "b"]
+
+
+def test_open_breaker_is_skipped():
+    router = ProviderRouter()
+    router.breaker("a")._open()
+    providers = FakeProviders(a=[], b=[{"image_url": "b"}])
+
+    provider, _, attempts = generate(router, ["a", "b"], providers)
+
+    assert provider == "b"
+    assert providers.calls == ["b"]
+    assert attempts[0] == {"provider": "a", "skipped": "circuit_open"}
+
+
+def test_all_breakers_open():
+    router = ProviderRouter()
+    router.breaker("a")._open()
+
+    with pytest.raises(ProviderChainError, match="熔断"):
+        generate(router, ["a"], FakeProviders(a=[]))
+    assert router.breaker("a").state == OPEN
+
+
+def test_chain_skips_unconfigured_providers(monkeypatch):
+    def get(provider):
+        if provider == "missing":
+            raise ValueError("未配置")
+        return object()
+
+    monkeypatch.setattr(router_module.image_client_registry, "get", get)
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "missing")
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER_FALLBACKS", "a, b, a")
+
+    router = ProviderRouter()
+    assert router.chain() == ["a", "b"]
+    assert router.chain("b,missing") == ["b"]
+    with pytest.raises(ValueError):
+        router.chain("missing")
+
+
+def test_hedge_budget_needs_recent_requests(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_BUDGET", 0.05)
+    budget = HedgeBudget(window=1000)
+
+    assert not budget.try_acquire()
+
+    for _ in range(100):
+        budget.record_request()
+    acquired = sum(budget.try_acquire() for _ in range(10))
+    assert acquired == 5
+
+
+def test_hedge_budget_window_slides(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_BUDGET", 0.05)
+    budget = HedgeBudget(window=20)
+    for _ in range(20):
+        budget.record_request()
+
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    # 对冲记录移出窗口后预算恢复
+    for _ in range(20):
+        budget.record_request()
+    assert budget.try_acquire()
+
+
+def test_slow_request_is_hedged_to_next_provider(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_BUDGET", 1.0)
+    router = ProviderRouter()
+    router.health("a").record_success(0.01)
+
+    async def attempt(provider: str, client) -> Dict:
+        if provider == "a":
+            await asyncio.sleep(5)
+        return {"image_url": provider}
+
+    provider, result, attempts = asyncio.run(router.generate(["a", "b"], attempt))
+
+    assert (provider, result) == ("b", {"image_url": "b"})
+    hedged = [record for record in attempts if record.get("hedge")]
+    assert [record["provider"] for record in hedged] == ["b"]
+    # 落后的请求被取消，不计入熔断统计
+    assert next(record for record in attempts if record["provider"] == "a")["cancelled"] is True
+    assert router.breaker("a").snapshot()["window_requests"] == 0
+
+
+def test_no_hedge_without_budget(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_BUDGET", 0.0)
+    router = ProviderRouter()
+    router.health("a").record_success(0.01)
+
+    async def attempt(provider: str, client) -> Dict:
+        await asyncio.sleep(0.05)
+        return {"image_url": provider}
+
+    provider, _, attempts = asyncio.run(router.generate(["a", "b"], attempt))
+
+    assert provider == "a"
+    assert not any(record.get("hedge") for record in attempts)
@@ -0,0 +1,211 @@
+"""provider 重试策略和重试预算"""
+import asyncio
+from typing import Dict
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import image_generation_client as client_module
+from app.services import provider_router as router_module
+from app.services.image_generation_client import ProviderError, ReplicateClient
+from app.services.provider_router import ProviderChainError, ProviderRouter
+from app.services.retry_policy import (
+    RetryBudget,
+    backoff_delay,
+    is_retryable,
+    retry_delay,
+)
+
+
+def status_error(status_code: int, retry_after: str = None) -> ProviderError:
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(status_code, headers=headers)
+    return ProviderError.from_response("a", response, f"HTTP {status_code}")
+
+
+@pytest.fixture(autouse=True)
+def retry_settings(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_JOB_BUDGET", 3)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_BASE_DELAY", 1.0)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_DELAY", 20.0)
+
+
+@pytest.mark.parametrize("status_code", [408, 425, 429, 500, 502, 503, 504])
+def test_transient_status_codes_are_retryable(status_code):
+    assert is_retryable(status_error(status_code))
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 402, 403, 404, 422, 501])
+def test_other_status_codes_are_not_retryable(status_code):
+    assert not is_retryable(status_error(status_code))
+
+
+def test_connect_phase_errors_are_retryable():
+    # 请求还没有发出
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert is_retryable(httpx.ConnectTimeout("connect"))
+    assert is_retryable(httpx.PoolTimeout("pool"))
+    assert is_retryable(ProviderError.from_timeout("a", httpx.ConnectTimeout("connect")))
+    assert is_retryable(ProviderError.from_timeout("a", httpx.PoolTimeout("pool")))
+
+
+def test_errors_after_sending_are_not_retryable():
+    # 请求可能已经在 provider 端执行并计费
+    assert not is_retryable(httpx.RemoteProtocolError("reset"))
+    assert not is_retryable(httpx.ReadError("reset"))
+    assert not is_retryable(httpx.ReadTimeout("slow"))
+    assert not is_retryable(ProviderError.from_timeout("a", httpx.ReadTimeout("slow")))
+    assert not is_retryable(ProviderError.from_timeout("a", httpx.WriteTimeout("slow")))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_backoff_is_capped_full_jitter():
+    for retry in range(8):
+        ceiling = min(settings.PROVIDER_RETRY_MAX_DELAY, settings.PROVIDER_RETRY_BASE_DELAY * 2 ** retry)
+        assert 0 <= backoff_delay(retry) <= ceiling
+
+
+def test_retry_after_is_respected():
+    assert retry_delay(status_error(429, retry_after="5"), 0) >= 5
+    # 要求等待太久时直接切换 provider
+    assert retry_delay(status_error(429, retry_after="60"), 0) is None
+
+
+def test_retry_delay_stops_after_max_attempts():
+    error = status_error(503)
+    assert retry_delay(error, 0) is not None
+    assert retry_delay(error, 1) is not None
+    assert retry_delay(error, 2) is None
+    assert retry_delay(status_error(400), 0) is None
+
+
+def test_retry_budget():
+    budget = RetryBudget(limit=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert RetryBudget().remaining == settings.PROVIDER_RETRY_JOB_BUDGET
+
+
+class FlakyProvider:
+    """前 failures[provider] 次调用返回 503，之后成功"""
+
+    def __init__(self, **failures: int):
+        self.failures = failures
+        self.calls: Dict[str, int] = {}
+
+    async def __call__(self, provider: str, client) -> Dict:
+        self.calls[provider] = self.calls.get(provider, 0) + 1
+        if self.calls[provider] <= self.failures.get(provider, 0):
+            raise status_error(503)
+        return {"image_url": provider}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(router_module.image_client_registry, "get", lambda provider: object())
+    monkeypatch.setattr(settings, "PROVIDER_HEDGE_ENABLED", False)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_BASE_DELAY", 0.0)
+    return ProviderRouter()
+
+
+def test_router_retries_same_provider(router):
+    provider_calls = FlakyProvider(a=2)
+
+    provider, _, attempts = asyncio.run(router.generate(["a", "b"], provider_calls))
+
+    assert provider == "a"
+    assert provider_calls.calls == {"a": 3}
+    assert [record.get("retry") for record in attempts] == [None, 1, 2]
+
+
+def test_router_fails_over_after_max_attempts(router):
+    provider_calls = FlakyProvider(a=3)
+
+    provider, _, _ = asyncio.run(router.generate(["a", "b"], provider_calls))
+
+    assert provider == "b"
+    assert provider_calls.calls == {"a": 3, "b": 1}
+
+
+def test_retry_budget_is_shared_across_providers(router):
+    provider_calls = FlakyProvider(a=3, b=3)
+
+    with pytest.raises(ProviderChainError) as exc_info:
+        asyncio.run(router.generate(["a", "b"], provider_calls))
+
+    # a 重试 2 次，b 只剩 1 次预算
+    assert provider_calls.calls == {"a": 3, "b": 2}
+    assert sum(1 for record in exc_info.value.attempts if record.get("retry")) == 3
+
+
+def run_replicate(monkeypatch, handler) -> Dict:
+    """用 handler 模拟 Replicate API 调用 generate_image（跳过轮询间隔）"""
+    async def no_sleep(_):
+        return None
+
+    async def payload(*args):
+        return "AAAA"
+
+    async def run() -> Dict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(client_module.http_clients, "get", lambda name: client)
+            return await ReplicateClient("key").generate_image(
+                "prompt", "source.jpg", source_mime_type="image/jpeg"
+            )
+
+    monkeypatch.setattr(client_module, "load_source_payload", payload)
+    monkeypatch.setattr(client_module.asyncio, "sleep", no_sleep)
+    return asyncio.run(run())
+
+
+def test_replicate_poll_errors_do_not_recreate_prediction(monkeypatch):
+    requests = {"POST": 0, "GET": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests[request.method] += 1
+        if request.method == "POST":
+            return httpx.Response(201, json={"id": "p1"})
+        if requests["GET"] == 1:
+            return httpx.Response(503)
+        if requests["GET"] == 2:
+            raise httpx.ConnectError("reset", request=request)
+        return httpx.Response(200, json={"status": "succeeded", "output": ["https://example.com/r.png"]})
+
+    result = run_replicate(monkeypatch, handler)
+
+    # 预测只创建一次，查询失败在轮询内继续
+    assert result["image_url"] == "https://example.com/r.png"
+    assert requests == {"POST": 1, "GET": 3}
+
+
+def test_replicate_poll_failure_is_not_retryable(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(201, json={"id": "p1"})
+        return httpx.Response(404, text="not found")
+
+    with pytest.raises(ProviderError) as exc_info:
+        run_replicate(monkeypatch, handler)
+
+    assert exc_info.value.status_code == 404
+    assert not is_retryable(exc_info.value)
+
+
+@pytest.mark.parametrize("timeout, retryable", [
+    (httpx.ConnectTimeout, True),
+    (httpx.PoolTimeout, True),
+    (httpx.ReadTimeout, False),
+    (httpx.WriteTimeout, False),
+])
+def test_replicate_create_timeout_retryable_only_before_sending(monkeypatch, timeout, retryable):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise timeout("timeout", request=request)
+
+    with pytest.raises(ProviderError) as exc_info:
+        run_replicate(monkeypatch, handler)
+
+    assert exc_info.value.status_code is None
+    assert is_retryable(exc_info.value) is retryable
@@ -0,0 +1,135 @@
+"""S3 存储后端（使用模拟的 boto3 客户端）"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import storage_backend
+from app.services.storage_backend import S3Storage
+
+
+class FakeClientError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3:
+    """内存中的 bucket，只实现 S3Storage 用到的接口"""
+
+    def __init__(self):
+        self.objects = {}
+        self.presigned = 0
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+    def download_file(self, bucket, key, path):
+        if key not in self.objects:
+            raise FakeClientError("404")
+        with open(path, "wb") as f:
+            f.write(self.objects[key])
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeClientError("404")
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.presigned += 1
+        return f"https://s3.example.com/{Params['Key']}?sig={self.presigned}"
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    fake = FakeS3()
+    monkeypatch.setattr(storage_backend, "BOTO3_AVAILABLE", True)
+    monkeypatch.setattr(storage_backend, "boto3", SimpleNamespace(client=lambda *a, **kw: fake), raising=False)
+    monkeypatch.setattr(storage_backend, "BotoConfig", lambda **kw: None, raising=False)
+    monkeypatch.setattr(storage_backend, "ClientError", FakeClientError, raising=False)
+
+    def make(**kwargs) -> S3Storage:
+        return S3Storage(bucket="bucket", cache_dir=str(tmp_path / "cache"), **kwargs)
+
+    make.fake = fake
+    make.tmp_path = tmp_path
+    return make
+
+
+def write_temp(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_put_fetch_and_delete(s3):
+    storage = s3()
+    storage.put_file(write_temp(s3.tmp_path, "a.png", 10), "images/a.png")
+
+    assert storage.exists("images/a.png")
+    local = storage.fetch("images/a.png")
+    assert open(local, "rb").read() == b"x" * 10
+
+    storage.delete("images/a.png")
+    assert not storage.exists("images/a.png")
+    assert not os.path.exists(local)
+    with pytest.raises(FileNotFoundError):
+        storage.fetch("images/a.png")
+
+
+def test_cache_evicts_least_recently_used(s3):
+    storage = s3(cache_max_bytes=350)
+    for index, name in enumerate(["a", "b", "c"]):
+        storage.put_file(write_temp(s3.tmp_path, f"{name}.png", 100), f"images/{name}.png", keep_local=True)
+        path = storage._cache_path(f"images/{name}.png")
+        os.utime(path, (1000 + index, 1000 + index))
+
+    # a 被访问后成为最近使用，写入 d 超过上限时从最久未使用的 b、c 开始淘汰到上限的 80%
+    storage._touch(storage._cache_path("images/a.png"))
+    storage.put_file(write_temp(s3.tmp_path, "d.png", 100), "images/d.png", keep_local=True)
+
+    cached = sorted(os.listdir(os.path.join(storage.cache_dir, "images")))
+    assert cached == ["a.png", "d.png"]
+    assert storage._cache_bytes == 200
+    # 被淘汰的文件重新从 bucket 下载
+    assert open(storage.fetch("images/b.png"), "rb").read() == b"x" * 100
+
+
+def test_presigned_url_reused_until_refresh(s3, monkeypatch):
+    storage = s3(presign_expires=100)
+    clock = [1000.0]
+    monkeypatch.setattr(storage_backend, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+
+    first = storage.url("images/a.png")
+    clock[0] += 79
+    assert storage.url("images/a.png") == first
+
+    # 超过有效期的 80% 后重新签名
+    clock[0] += 2
+    assert storage.url("images/a.png") != first
+    assert s3.fake.presigned == 2
+
+
+def test_presigned_url_cache_is_bounded(s3, monkeypatch):
+    storage = s3()
+    monkeypatch.setattr(S3Storage, "PRESIGN_CACHE_SIZE", 2)
+
+    first = storage.url("a")
+    storage.url("b")
+    storage.url("a")
+    storage.url("c")
+
+    assert list(storage._urls) == ["a", "c"]
+    assert storage.url("a") == first
+
+
+def test_delete_drops_presigned_url(s3):
+    storage = s3()
+    first = storage.url("images/a.png")
+
+    storage.delete("images/a.png")
+
+    assert storage.url("images/a.png") != first
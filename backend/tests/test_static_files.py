@@ -0,0 +1,101 @@
+"""/uploads 静态文件服务：Range 和 Accept 协商"""
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.core.static_files import UploadStaticFiles, accepted_formats, parse_range
+from app.core.storage import GENERATED, storage_relpath
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    (" BYTES = 10 - 20 ", (10, 20)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["items=0-1", "bytes=0-1,5-6", "bytes=abc", "bytes=a-b", "bytes=1-x"])
+def test_parse_range_falls_back_to_full_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-100", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("image/avif,image/webp,image/*,*/*;q=0.8", ["avif", "webp"]),
+    ("image/webp,*/*", ["webp"]),
+    ("image/avif;q=0, image/webp;q=0.5", ["webp"]),
+    ("IMAGE/WEBP", ["webp"]),
+    ("image/*,*/*", []),
+    ("", []),
+])
+def test_accepted_formats(header, expected):
+    assert accepted_formats(header) == expected
+
+
+@pytest.fixture
+def client(tmp_path):
+    def write(category: str, filename: str, content: bytes) -> str:
+        relpath = storage_relpath(category, filename)
+        path = tmp_path / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        return "/uploads/" + relpath
+
+    app = Starlette(routes=[Mount("/uploads", UploadStaticFiles(directory=str(tmp_path)))])
+    test_client = TestClient(app)
+    test_client.write = write
+    return test_client
+
+
+def test_range_request(client):
+    url = client.write(GENERATED, "result_a.png", bytes(range(256)) * 4)
+
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+    assert response.headers["content-length"] == "10"
+
+    response = client.get(url, headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_range_ignored_when_if_range_does_not_match(client):
+    url = client.write(GENERATED, "result_a.png", b"x" * 100)
+
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.content) == 100
+
+
+def test_accept_negotiation(client):
+    url = client.write(GENERATED, "result_b.png", b"png")
+    client.write(GENERATED, "result_b_full.webp", b"webp")
+
+    response = client.get(url, headers={"Accept": "image/avif,image/webp,*/*"})
+    assert response.content == b"webp"
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+
+    response = client.get(url, headers={"Accept": "image/png,*/*"})
+    assert response.content == b"png"
+    assert response.headers["vary"] == "Accept"
+
+
+def test_internal_directories_not_served(client, tmp_path):
+    (tmp_path / "temp").mkdir()
+    (tmp_path / "temp" / "upload.jpg").write_bytes(b"jpg")
+
+    assert client.get("/uploads/temp/upload.jpg").status_code == 404
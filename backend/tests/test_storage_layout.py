@@ -0,0 +1,108 @@
+"""分片目录布局和平铺目录迁移"""
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.core.migrate_storage import migrate_column
+from app.core.storage import (
+    GENERATED,
+    IMAGES,
+    resolve_storage_path,
+    shard_for,
+    storage_key,
+    storage_local_path,
+    storage_url,
+)
+from app.models.image import GenerationJob, GenerationStatus, UploadedImage
+
+
+def test_shard_ignores_extension():
+    shard = shard_for("result_1.png")
+
+    assert shard == shard_for("result_1.webp")
+    assert len(shard) == 5 and shard[2] == "/"
+    assert shard != shard_for("result_2.png")
+
+
+def test_storage_path_layout(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    shard = shard_for("cat.png")
+
+    url = storage_url(IMAGES, "cat.png")
+
+    assert url == f"/uploads/images/{shard}/cat.png"
+    assert storage_key(url) == f"images/{shard}/cat.png"
+    assert resolve_storage_path(url) == os.path.join(str(tmp_path), "images", shard, "cat.png")
+
+    path = storage_local_path(GENERATED, "r.png", create_dirs=True)
+    assert os.path.isdir(os.path.dirname(path))
+
+
+@pytest.fixture
+def flat_uploads(db, tmp_path, monkeypatch):
+    """平铺布局的旧上传：三个文件存在，一个文件丢失"""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    os.makedirs(tmp_path / "images")
+    for index in range(4):
+        filename = f"old_{index}.jpg"
+        if index < 3:
+            (tmp_path / "images" / filename).write_bytes(b"jpeg")
+        db.add(UploadedImage(
+            id=f"img-{index}",
+            user_id="1",
+            filename=filename,
+            storage_path=f"/uploads/images/{filename}",
+            file_size=4,
+            width=10,
+            height=10,
+            mime_type="image/jpeg",
+        ))
+    db.commit()
+    return tmp_path
+
+
+def paths(db):
+    db.expire_all()
+    return {image.id: image.storage_path for image in db.query(UploadedImage).all()}
+
+
+def test_migrate_moves_files_in_batches(db, flat_uploads):
+    migrated = migrate_column(db, UploadedImage, UploadedImage.storage_path, IMAGES, batch_size=2)
+
+    assert migrated == 3
+    result = paths(db)
+    for index in range(3):
+        url = result[f"img-{index}"]
+        assert url == storage_url(IMAGES, f"old_{index}.jpg")
+        assert os.path.exists(resolve_storage_path(url))
+        assert not (flat_uploads / "images" / f"old_{index}.jpg").exists()
+    # 文件不存在的记录保持原路径
+    assert result["img-3"] == "/uploads/images/old_3.jpg"
+
+    # 重复执行时已迁移的记录被跳过
+    assert migrate_column(db, UploadedImage, UploadedImage.storage_path, IMAGES, batch_size=2) == 0
+
+
+def test_migrate_dry_run_changes_nothing(db, flat_uploads):
+    before = paths(db)
+
+    assert migrate_column(db, UploadedImage, UploadedImage.storage_path, IMAGES, batch_size=10, dry_run=True) == 3
+
+    assert paths(db) == before
+    assert (flat_uploads / "images" / "old_0.jpg").exists()
+
+
+def test_migrate_skips_external_result_urls(db, flat_uploads):
+    db.add(GenerationJob(
+        id="job",
+        user_id="1",
+        source_image_id="img-0",
+        style_id="cartoon",
+        status=GenerationStatus.COMPLETED,
+        result_image_url="https://cdn.example.com/result.png",
+    ))
+    db.commit()
+
+    assert migrate_column(db, GenerationJob, GenerationJob.result_image_url, GENERATED, batch_size=10) == 0
+    assert db.get(GenerationJob, "job").result_image_url == "https://cdn.example.com/result.png"
@@ -0,0 +1,74 @@
+"""按内容寻址的上传存储：引用计数"""
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.core.storage import storage_key
+from app.models.image import ImageBlob
+from app.services.storage_backend import get_storage
+from app.services.upload_storage import (
+    acquire_blob_reference,
+    blob_storage_path,
+    find_blob,
+    register_blob,
+    release_blob,
+)
+
+CONTENT_HASH = "ab" * 32
+
+
+@pytest.fixture
+def blob_file(db):
+    """已写入存储的文件及其登记记录"""
+    storage_path = blob_storage_path(CONTENT_HASH, "image/png")
+    register_blob(db, CONTENT_HASH, storage_path, 4, 10, 10, "image/png")
+    source = os.path.join(settings.TEMP_DIR, "upload.part")
+    os.makedirs(settings.TEMP_DIR, exist_ok=True)
+    with open(source, "wb") as f:
+        f.write(b"data")
+    get_storage().put_file(source, storage_key(storage_path), "image/png")
+    return storage_path
+
+
+def ref_count(db) -> int:
+    db.expire_all()
+    return db.get(ImageBlob, CONTENT_HASH).ref_count
+
+
+def test_register_existing_blob_increments_reference(db, blob_file):
+    moved = blob_storage_path(CONTENT_HASH, "image/jpeg")
+
+    register_blob(db, CONTENT_HASH, moved, 4, 10, 10, "image/jpeg")
+
+    assert ref_count(db) == 2
+    assert db.get(ImageBlob, CONTENT_HASH).storage_path == moved
+
+
+def test_acquire_reference_for_existing_blob(db, blob_file):
+    assert find_blob(db, CONTENT_HASH).storage_path == blob_file
+    assert acquire_blob_reference(db, CONTENT_HASH)
+    assert ref_count(db) == 2
+    assert not acquire_blob_reference(db, "cd" * 32)
+
+
+def test_last_release_deletes_file(db, blob_file):
+    acquire_blob_reference(db, CONTENT_HASH)
+    key = storage_key(blob_file)
+
+    assert not release_blob(db, CONTENT_HASH)
+    db.commit()
+    assert ref_count(db) == 1
+    assert get_storage().exists(key)
+
+    assert release_blob(db, CONTENT_HASH)
+    db.commit()
+    assert db.get(ImageBlob, CONTENT_HASH) is None
+    assert not get_storage().exists(key)
+    assert find_blob(db, CONTENT_HASH) is None
+
+
+def test_missing_file_is_not_reused(db, blob_file):
+    os.remove(get_storage().fetch(storage_key(blob_file)))
+
+    assert find_blob(db, CONTENT_HASH) is None
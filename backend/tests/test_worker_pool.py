@@ -0,0 +1,115 @@
+"""多 worker 认领竞争、租约失效和 worker 池处理"""
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.image import GenerationJob, GenerationStatus
+from app.services import job_queue
+from app.services.job_queue import GenerationWorkerPool, claim_next_job
+
+
+def add_jobs(db, count: int) -> list:
+    now = datetime.utcnow()
+    ids = [f"job-{index}" for index in range(count)]
+    for index, job_id in enumerate(ids):
+        db.add(GenerationJob(
+            id=job_id,
+            user_id="1",
+            source_image_id="img",
+            style_id="cartoon",
+            status=GenerationStatus.PENDING,
+            created_at=now + timedelta(milliseconds=index),
+        ))
+    db.commit()
+    return ids
+
+
+def test_concurrent_workers_claim_each_job_once(db):
+    ids = add_jobs(db, 20)
+    claimed = {}
+    barrier = threading.Barrier(4)
+
+    def worker(worker_id: str) -> None:
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            while True:
+                job_id = claim_next_job(session, worker_id, max_attempts=50)
+                if job_id is None:
+                    return
+                claimed.setdefault(job_id, []).append(worker_id)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{index}",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(ids)
+    assert all(len(owners) == 1 for owners in claimed.values())
+
+    db.expire_all()
+    for job in db.query(GenerationJob).all():
+        assert job.status == GenerationStatus.PROCESSING
+        assert job.claimed_by == claimed[job.id][0]
+        assert job.attempts == 1
+
+
+def test_pool_processes_queued_jobs(db, monkeypatch):
+    ids = add_jobs(db, 3)
+    processed = []
+
+    async def fake_process(job_id, worker_id):
+        processed.append((job_id, worker_id))
+
+    monkeypatch.setattr(job_queue, "process_generation_job", fake_process)
+
+    async def run():
+        pool = GenerationWorkerPool(concurrency=2, poll_interval=0.05)
+        await pool.start()
+        for _ in range(100):
+            if len(processed) == len(ids):
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+        return pool.worker_id
+
+    worker_id = asyncio.run(run())
+
+    assert sorted(job_id for job_id, _ in processed) == ids
+    assert {owner for _, owner in processed} == {worker_id}
+
+
+def test_lost_lease_cancels_job(db, monkeypatch):
+    add_jobs(db, 1)
+    monkeypatch.setattr(settings, "GENERATION_JOB_LEASE_SECONDS", 0.3)
+    state = {}
+
+    async def slow_process(job_id, worker_id):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    monkeypatch.setattr(job_queue, "process_generation_job", slow_process)
+
+    async def run():
+        pool = GenerationWorkerPool(concurrency=1)
+        job_id = claim_next_job(db, pool.worker_id)
+
+        # 任务被回收并由其他 worker 认领后，下次续租失败，本 worker 停止处理
+        db.query(GenerationJob).filter(GenerationJob.id == job_id).update(
+            {GenerationJob.claimed_by: "other-worker"}
+        )
+        db.commit()
+
+        await asyncio.wait_for(pool._run_job(job_id), timeout=2)
+
+    asyncio.run(run())
+
+    assert state == {"cancelled": True}
@@ -6,6 +6,7 @@ import { Button } from "@/components/ui/button";
 import { Download, RotateCcw, X } from "lucide-react";
 import { Skeleton } from "@/components/ui/skeleton";
 import { useState } from "react";
+import { resolveMediaUrl } from "@/lib/utils";
 
 interface GeneratedImagePreviewProps {
   imageUrl: string;
@@ -19,7 +20,7 @@ export function GeneratedImagePreview({
   onClear,
 }: GeneratedImagePreviewProps) {
   const [imageLoaded, setImageLoaded] = useState(false);
-  const fullImageUrl = `${import.meta.env.VITE_API_BASE_URL || "http://localhost:8000"}${imageUrl}`;
+  const fullImageUrl = resolveMediaUrl(imageUrl);
 
   const handleDownload = () => {
     const link = document.createElement("a");
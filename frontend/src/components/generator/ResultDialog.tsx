@@ -13,6 +13,7 @@ import {
 import { Button } from "@/components/ui/button";
 import { Skeleton } from "@/components/ui/skeleton";
 import { useState } from "react";
+import { resolveMediaUrl } from "@/lib/utils";
 
 interface ResultDialogProps {
   imageUrl: string;
@@ -23,7 +24,7 @@ interface ResultDialogProps {
 
 export function ResultDialog({ imageUrl, isOpen, onClose, onRegenerate }: ResultDialogProps) {
   const [imageLoaded, setImageLoaded] = useState(false);
-  const fullImageUrl = `${import.meta.env.VITE_API_BASE_URL || "http://localhost:8000"}${imageUrl}`;
+  const fullImageUrl = resolveMediaUrl(imageUrl);
 
   const handleDownload = () => {
     const link = document.createElement("a");
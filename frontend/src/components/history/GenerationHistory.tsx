@@ -19,13 +19,13 @@ import {
   DialogFooter,
 } from '@/components/ui/dialog';
 import type { HistoryItem } from '@/types/history';
+import { renditionSources, resolveMediaUrl } from '@/lib/utils';
 
 interface GenerationHistoryProps {
   onRegenerate?: (styleId: string) => void;
 }
 
 export function GenerationHistory({ onRegenerate }: GenerationHistoryProps) {
-  const apiBaseUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
   const [selectedItem, setSelectedItem] = useState<HistoryItem | null>(null);
 
   const { data, isLoading, error } = useQuery({
@@ -38,7 +38,7 @@ export function GenerationHistory({ onRegenerate }: GenerationHistoryProps) {
     if (!selectedItem?.result_image_url) return;
 
     try {
-      const imageUrl = `${apiBaseUrl}${selectedItem.result_image_url}`;
+      const imageUrl = resolveMediaUrl(selectedItem.result_image_url);
       const response = await fetch(imageUrl);
       const blob = await response.blob();
       const url = window.URL.createObjectURL(blob);
@@ -125,16 +125,21 @@ export function GenerationHistory({ onRegenerate }: GenerationHistoryProps) {
             {/* Image */}
             <div className="relative aspect-square bg-muted">
               {item.result_image_url && item.status === 'completed' ? (
-                <img
-                  src={`${apiBaseUrl}${item.result_image_url}`}
-                  alt="Generated result"
-                  className="w-full h-full object-cover"
-                  loading="lazy"
-                  onError={(e) => {
-                    console.error('Image load error:', item.result_image_url);
-                    e.currentTarget.style.display = 'none';
-                  }}
-                />
+                <picture>
+                  {renditionSources(item.renditions, 'thumb').map((source) => (
+                    <source key={source.type} srcSet={source.srcSet} type={source.type} />
+                  ))}
+                  <img
+                    src={resolveMediaUrl(item.result_image_url)}
+                    alt="Generated result"
+                    className="w-full h-full object-cover"
+                    loading="lazy"
+                    onError={(e) => {
+                      console.error('Image load error:', item.result_image_url);
+                      e.currentTarget.style.display = 'none';
+                    }}
+                  />
+                </picture>
               ) : (
                 <div className="w-full h-full flex items-center justify-center text-sm text-muted-foreground">
                   {item.status === 'pending' && '等待中'}
@@ -168,11 +173,16 @@ export function GenerationHistory({ onRegenerate }: GenerationHistoryProps) {
           </DialogHeader>
           {selectedItem?.result_image_url && (
             <div className="flex justify-center">
-              <img
-                src={`${apiBaseUrl}${selectedItem.result_image_url}`}
-                alt="历史记录预览"
-                className="max-w-full h-auto rounded-lg"
-              />
+              <picture>
+                {renditionSources(selectedItem.renditions, 'medium').map((source) => (
+                  <source key={source.type} srcSet={source.srcSet} type={source.type} />
+                ))}
+                <img
+                  src={resolveMediaUrl(selectedItem.result_image_url)}
+                  alt="历史记录预览"
+                  className="max-w-full h-auto rounded-lg"
+                />
+              </picture>
             </div>
           )}
           <DialogFooter className="gap-2">
@@ -5,6 +5,7 @@ import { X, RotateCcw } from "lucide-react";
 import type { UploadedImage } from "@/types/api";
 import { Card, CardContent } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
+import { resolveMediaUrl } from "@/lib/utils";
 
 interface ImagePreviewProps {
   image: UploadedImage;
@@ -19,7 +20,7 @@ function formatFileSize(bytes: number): string {
 }
 
 export function ImagePreview({ image, onClear, onReupload }: ImagePreviewProps) {
-  const imageUrl = `${import.meta.env.VITE_API_BASE_URL || "http://localhost:8000"}${image.storage_path}`;
+  const imageUrl = resolveMediaUrl(image.storage_path);
 
   return (
     <Card className="mt-4">
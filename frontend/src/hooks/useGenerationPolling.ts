@@ -1,9 +1,11 @@
 /**
- * 生成任务轮询 Hook
+ * 生成任务状态 Hook
+ *
+ * 优先通过 Server-Sent Events 接收状态推送；浏览器不支持或连接出错时退回轮询。
  */
-import { useQuery } from "@tanstack/react-query";
-import { useEffect, useRef } from "react";
-import { getGenerationJob } from "@/services/api";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
+import { useEffect, useRef, useState } from "react";
+import { getGenerationJob, getGenerationJobEventsUrl } from "@/services/api";
 import type { GenerationJob } from "@/types/api";
 
 interface UseGenerationPollingOptions {
@@ -13,37 +15,71 @@ interface UseGenerationPollingOptions {
   onFailed?: (job: GenerationJob) => void;
 }
 
+const isTerminal = (job: GenerationJob) =>
+  job.status === "completed" || job.status === "failed";
+
 export function useGenerationPolling({
   jobId,
   interval = 3000,
   onCompleted,
   onFailed,
 }: UseGenerationPollingOptions) {
+  const queryClient = useQueryClient();
   // 使用 ref 来跟踪回调是否已触发,避免重复调用
   const completedRef = useRef(false);
   const failedRef = useRef(false);
+  // SSE 连接正常时不轮询
+  const [streaming, setStreaming] = useState(false);
 
   const { data: job, isLoading } = useQuery({
     queryKey: ["generation-job", jobId],
     queryFn: () => getGenerationJob(jobId!),
     enabled: !!jobId,
     refetchInterval: (query) => {
+      if (streaming) return false;
+
       const data = query.state.data;
       if (!data) return interval;
 
       // 任务完成或失败时停止轮询
-      if (data.status === "completed" || data.status === "failed") {
+      if (isTerminal(data)) {
         return false;
       }
 
       // 继续轮询
       return interval;
     },
-    // 90 秒后停止轮询(超时保护)
     refetchIntervalInBackground: false,
     staleTime: 0,
   });
 
+  // 订阅状态推送
+  useEffect(() => {
+    if (!jobId || typeof EventSource === "undefined") return;
+
+    const source = new EventSource(getGenerationJobEventsUrl(jobId));
+    setStreaming(true);
+
+    source.addEventListener("status", (event) => {
+      const data = JSON.parse((event as MessageEvent).data) as GenerationJob;
+      queryClient.setQueryData(["generation-job", jobId], data);
+      if (isTerminal(data)) {
+        source.close();
+      }
+    });
+
+    // 连接出错时关闭推送，退回轮询
+    source.onerror = () => {
+      source.close();
+      setStreaming(false);
+    };
+
+    return () => {
+      source.close();
+      setStreaming(false);
+    };
+  }, [jobId, queryClient]);
+
   // 使用 useEffect 来处理状态变化时的回调
   useEffect(() => {
     if (!job) return;
@@ -4,3 +4,43 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs))
 }
+
+/**
+ * 把后端返回的图片地址转换为可直接访问的 URL
+ *
+ * 本地存储返回 /uploads/... 相对路径，需要拼接 API 地址；
+ * 对象存储返回的预签名 / CDN 地址已经是完整 URL，原样使用。
+ */
+export function resolveMediaUrl(path: string): string {
+  if (/^https?:\/\//.test(path)) {
+    return path
+  }
+  const apiBaseUrl = import.meta.env.VITE_API_BASE_URL || "http://localhost:8000"
+  return `${apiBaseUrl}${path}`
+}
+
+/** 浏览器按顺序选择第一个支持的格式 */
+const RENDITION_FORMATS: Array<[string, string]> = [
+  ["avif", "image/avif"],
+  ["webp", "image/webp"],
+]
+
+/**
+ * 某个尺寸的派生版本，用作 <picture> 的 <source>
+ *
+ * 原图小于该尺寸时后端不会生成，回退到 full 版本；没有派生版本时返回空数组，
+ * 由 <img> 的原图地址兜底。
+ */
+export function renditionSources(
+  renditions: Record<string, Record<string, string>> | null | undefined,
+  size: string
+): Array<{ srcSet: string; type: string }> {
+  const formats = renditions?.[size] ?? renditions?.full
+  if (!formats) {
+    return []
+  }
+  return RENDITION_FORMATS.filter(([name]) => formats[name]).map(([name, type]) => ({
+    srcSet: resolveMediaUrl(formats[name]),
+    type,
+  }))
+}
@@ -94,3 +94,10 @@ export async function getGenerationJob(jobId: string): Promise<GenerationJob> {
   const response = await api.get<GenerationJob>(`/api/v1/generations/${jobId}`);
   return response.data;
 }
+
+/**
+ * 生成任务状态推送（Server-Sent Events）地址
+ */
+export function getGenerationJobEventsUrl(jobId: string): string {
+  return `${API_BASE_URL}/api/v1/generations/${jobId}/events`;
+}
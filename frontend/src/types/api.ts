@@ -19,19 +19,27 @@ export interface GenerationStyle {
   description?: string;
   prompt_template: string;
   sort_order: number;
+  cache_results?: boolean;
 }
 
 export type GenerationStatus = "pending" | "processing" | "completed" | "failed";
 
+/** 生成结果的派生版本：{尺寸: {格式: URL}}，尺寸为 thumb / medium / full，格式为 webp / avif */
+export type Renditions = Record<string, Record<string, string>>;
+
 export interface GenerationJob {
   id: string;
   user_id: string;
   source_image_id: string;
   style_id: string;
+  batch_id?: string | null;
   status: GenerationStatus;
+  queue_position?: number;
   result_image_url?: string;
+  renditions?: Renditions | null;
   error_message?: string;
   credits_cost: number;
   created_at: string;
+  started_at?: string;
   completed_at?: string;
 }
@@ -2,6 +2,8 @@
  * 生成历史相关类型定义
  */
 
+import type { Renditions } from './api';
+
 export interface HistoryItem {
   id: string;
   style_id: string;
@@ -9,6 +11,7 @@ export interface HistoryItem {
   custom_prompt: string | null;
   status: 'pending' | 'processing' | 'completed' | 'failed';
   result_image_url: string | null;
+  renditions?: Renditions | null;
   credits_cost: number;
   error_message: string | null;
   created_at: string;